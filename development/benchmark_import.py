@@ -0,0 +1,315 @@
+""" Benchmark the ENEX import pipeline on synthetic ENEX files
+
+Run from the project folder, e.g.
+    python -m development.benchmark_import --notes 2000 --resources-every 5
+Results are saved as JSON; pass an earlier result file with --compare to see
+how each stage has changed between versions.
+"""
+
+import argparse
+import base64
+from dataclasses import asdict, dataclass, field
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from box import Box
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.config.config_main import load_config
+from src.config.config_logging import logger
+from src.controller.load_import_data import load_enex_backup
+from src.controller.resource_store import ResourceStore
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    save_enex_backup_to_mysql_db,
+)
+
+cfg: Box = load_config()
+
+WHEN_TAGS: list[str] = cfg.DATABASE.TAGS.WHEN
+WHERE_TAGS: list[str] = cfg.DATABASE.TAGS.WHERE
+REFERENCE_TAGS: list[str] = ["Recipes", "Taxes", "Books", "Car", "Garden", "Travel"]
+WORDS: list[str] = (
+    "the quick brown fox jumps over a lazy dog while notes about tasks and "
+    "projects pile up in the inbox waiting for review next week"
+).split()
+RESULTS_FOLDER: str = "data/benchmarks"
+
+
+@dataclass
+class SyntheticEnexSpec:
+    notes: int = 1000
+    body_words: int = 200  # Words in the body of each note
+    tag_probability: float = 0.6  # Chance of each of a where, when and reference tag
+    resources_every: int = 5  # Every nth note has resources. 0 for none
+    resources_per_note: int = 1
+    resource_bytes: int = 50_000
+    seed: int = 1
+
+
+@dataclass
+class StageResult:
+    stage: str
+    wall_seconds: float
+    notes: int
+    notes_per_sec: float
+    peak_memory_mb: float
+    sql_statements: int
+    extra: dict[str, Any] = field(default_factory=dict)
+
+
+class SqlStatementCounter:
+    """Counts every statement sent to any database while active"""
+
+    def __init__(self) -> None:
+        self.count: int = 0
+
+    def _count(self, *args: Any) -> None:
+        self.count += 1
+
+    def __enter__(self) -> "SqlStatementCounter":
+        event.listen(Engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        event.remove(Engine, "before_cursor_execute", self._count)
+
+
+def synthetic_note_xml(
+    note_no: int, spec: SyntheticEnexSpec, rnd: random.Random
+) -> str:
+    tags: list[str] = [
+        rnd.choice(tag_list)
+        for tag_list in (WHERE_TAGS, WHEN_TAGS, REFERENCE_TAGS)
+        if rnd.random() < spec.tag_probability
+    ]
+    tags_xml: str = "".join(f"<tag>{tag}</tag>" for tag in tags)
+    words: list[str] = rnd.choices(WORDS, k=spec.body_words)
+    paragraphs: list[str] = [
+        " ".join(words[i : i + 20]) + "." for i in range(0, len(words), 20)
+    ]
+    body: str = "".join(f"<div>{paragraph}</div>" for paragraph in paragraphs)
+
+    resources_xml: list[str] = []
+    if spec.resources_every and note_no % spec.resources_every == 0:
+        for resource_no in range(spec.resources_per_note):
+            data: bytes = rnd.randbytes(spec.resource_bytes)
+            hash: str = hashlib.md5(data).hexdigest()
+            body += f'<en-media hash="{hash}" type="image/png" />'
+            resources_xml.append(
+                "<resource>"
+                f'<data encoding="base64">\n{base64.encodebytes(data).decode()}</data>'
+                "<mime>image/png</mime><width>640</width><height>480</height>"
+                "<resource-attributes>"
+                f"<source-url>en-cache://tokenKey%3D%22AuthToken%3AUser%3A1%22+1+{hash}+https://www.evernote.com/</source-url>"
+                f"<file-name>note{note_no}-{resource_no}.png</file-name>"
+                "</resource-attributes></resource>"
+            )
+
+    created: dt.datetime = dt.datetime(2023, 1, 1) + dt.timedelta(minutes=note_no)
+    reminder: str = (
+        f"<reminder-time>{(created + dt.timedelta(days=7)):%Y%m%dT%H%M%SZ}</reminder-time>"
+        if rnd.random() < 0.25
+        else ""
+    )
+    return (
+        f"<note><title>Synthetic note {note_no}</title>"
+        f"<created>{created:%Y%m%dT%H%M%SZ}</created>"
+        f"<updated>{created:%Y%m%dT%H%M%SZ}</updated>"
+        f"{tags_xml}<note-attributes><author>benchmark</author>{reminder}</note-attributes>"
+        "<content><![CDATA["
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+        '<!DOCTYPE en-note SYSTEM "http://xml.evernote.com/pub/enml2.dtd">\n'
+        f"<en-note>{body}</en-note>]]></content>"
+        f"{''.join(resources_xml)}</note>\n"
+    )
+
+
+def write_synthetic_enex(filepath: str, spec: SyntheticEnexSpec) -> int:
+    """Writes the ENEX file one note at a time and returns its size in bytes"""
+    rnd = random.Random(spec.seed)
+    with open(filepath, "w", encoding="utf-8") as fp:
+        fp.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<!DOCTYPE en-export SYSTEM "http://xml.evernote.com/pub/evernote-export4.dtd">\n'
+            '<en-export export-date="20231020T000000Z" application="Evernote" version="10.64.4">\n'
+        )
+        for note_no in range(spec.notes):
+            fp.write(synthetic_note_xml(note_no=note_no, spec=spec, rnd=rnd))
+        fp.write("</en-export>\n")
+    return os.path.getsize(filepath)
+
+
+def run_stage(stage: str, notes: int, func: Callable[[], Any]) -> StageResult:
+    """Run one stage, measuring wall time, peak Python memory and SQL statements"""
+    tracemalloc.start()
+    with SqlStatementCounter() as sql_counter:
+        start_time: float = time.perf_counter()
+        func()
+        wall_seconds: float = time.perf_counter() - start_time
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return StageResult(
+        stage=stage,
+        wall_seconds=round(wall_seconds, 4),
+        notes=notes,
+        notes_per_sec=round(notes / wall_seconds, 1) if wall_seconds else 0.0,
+        peak_memory_mb=round(peak_bytes / 1_048_576, 2),
+        sql_statements=sql_counter.count,
+    )
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(spec: SyntheticEnexSpec) -> dict[str, Any]:
+    stages: list[StageResult] = []
+    with tempfile.TemporaryDirectory(prefix="notis-benchmark-") as temp_folder:
+        enex_pathname: str = os.path.join(temp_folder, "synthetic.enex")
+        enex_bytes: int = write_synthetic_enex(filepath=enex_pathname, spec=spec)
+
+        notes_loaded: list[int] = []
+
+        def load() -> None:
+            notes, _ = load_enex_backup(
+                filepath=enex_pathname,
+                logger=logger,
+                resource_sink=ResourceStore(
+                    folder=os.path.join(temp_folder, "load_resources")
+                ),
+            )
+            notes_loaded.append(len(notes))
+
+        stages.append(run_stage(stage="load_enex_backup", notes=spec.notes, func=load))
+        stages[-1].extra["notes_loaded"] = notes_loaded[0]
+
+        stages.append(
+            run_stage(
+                stage="save_enex_backup_to_flask_mysql_db",
+                notes=spec.notes,
+                func=lambda: save_enex_backup_to_mysql_db(
+                    enex_backup_pathname=enex_pathname,
+                    database_pathname=os.path.join(temp_folder, "benchmark.db"),
+                    resource_folder=os.path.join(temp_folder, "import_resources"),
+                    incremental=False,
+                    resume=False,
+                ),
+            )
+        )
+
+    for stage in stages:
+        stage.extra["mb_per_sec"] = round(
+            enex_bytes / 1_048_576 / stage.wall_seconds, 2
+        )
+
+    return {
+        "timestamp": dt.datetime.now(dt.UTC).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "spec": asdict(spec),
+        "enex_bytes": enex_bytes,
+        "stages": [asdict(stage) for stage in stages],
+    }
+
+
+def compare_results(previous: dict[str, Any], current: dict[str, Any]) -> None:
+    previous_stages: dict[str, dict[str, Any]] = {
+        stage["stage"]: stage for stage in previous["stages"]
+    }
+    print(f"Compared with {previous.get('revision')} ({previous.get('timestamp')})")
+    if previous["spec"] != current["spec"]:
+        print("Warning: the synthetic ENEX spec differs between the two runs")
+    for stage in current["stages"]:
+        before: Optional[dict[str, Any]] = previous_stages.get(stage["stage"])
+        if before is None:
+            continue
+        for metric in ("wall_seconds", "peak_memory_mb", "sql_statements"):
+            change: str = (
+                f"{stage[metric] / before[metric]:.2f}x" if before[metric] else "n/a"
+            )
+            print(
+                f"  {stage['stage']:<36} {metric:<16} "
+                f"{before[metric]:>12} -> {stage[metric]:>12} ({change})"
+            )
+
+
+def print_results(results: dict[str, Any]) -> None:
+    print(
+        f"Synthetic ENEX: {results['enex_bytes'] / 1_048_576:.2f} MB, {results['spec']}"
+    )
+    for stage in results["stages"]:
+        print(
+            f"  {stage['stage']:<36} {stage['wall_seconds']:>9.3f} s "
+            f"{stage['notes_per_sec']:>10.1f} notes/s "
+            f"{stage['peak_memory_mb']:>9.2f} MB peak "
+            f"{stage['sql_statements']:>8} SQL statements"
+        )
+
+
+if __name__ == "__main__":
+    defaults = SyntheticEnexSpec()
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--notes", type=int, default=defaults.notes)
+    parser.add_argument("--body-words", type=int, default=defaults.body_words)
+    parser.add_argument(
+        "--tag-probability", type=float, default=defaults.tag_probability
+    )
+    parser.add_argument("--resources-every", type=int, default=defaults.resources_every)
+    parser.add_argument(
+        "--resources-per-note", type=int, default=defaults.resources_per_note
+    )
+    parser.add_argument("--resource-bytes", type=int, default=defaults.resource_bytes)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--output", help="JSON results file to write")
+    parser.add_argument("--compare", help="Earlier JSON results file to compare with")
+    args = parser.parse_args()
+
+    # Debug logging of every note would dominate the timings
+    logger.setLevel(logging.INFO)
+
+    results: dict[str, Any] = run_benchmark(
+        spec=SyntheticEnexSpec(
+            notes=args.notes,
+            body_words=args.body_words,
+            tag_probability=args.tag_probability,
+            resources_every=args.resources_every,
+            resources_per_note=args.resources_per_note,
+            resource_bytes=args.resource_bytes,
+            seed=args.seed,
+        )
+    )
+    print_results(results=results)
+
+    output_pathname: str = args.output or os.path.join(
+        RESULTS_FOLDER, f"import_benchmark_{results['timestamp'].replace(':', '')}.json"
+    )
+    os.makedirs(os.path.dirname(output_pathname) or ".", exist_ok=True)
+    with open(output_pathname, "w") as fp:
+        json.dump(results, fp, indent=4)
+    print(f"Results saved to {output_pathname}")
+
+    if args.compare:
+        with open(args.compare) as fp:
+            compare_results(previous=json.load(fp), current=results)
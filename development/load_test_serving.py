@@ -0,0 +1,315 @@
+""" Load test the Flask app and the async app with the same mix of requests
+
+Start both on the same database, then run from the project folder, e.g.
+    flask --app src.controller.app run --port 5000
+    uvicorn src.controller.async_app:app --port 8000
+    python -m development.load_test_serving --clients 100 --seconds 30
+Each of --clients clients sends requests one after another for --seconds to
+each app in turn: task lists with random filters and sorting, and random tasks.
+While the async app is tested, --waiting-clients more clients long-poll
+/sync from the latest change, as idle sync clients would. The Flask app has no long-polling,
+and caches what it reads, so repeated lists are served from its read cache.
+Results are saved as JSON; pass an earlier result file with --compare to see
+how each app has changed between versions.
+"""
+
+import argparse
+import asyncio
+from dataclasses import asdict, dataclass
+import datetime as dt
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from typing import Any, Optional
+
+from box import Box
+import httpx
+
+from src.config.config_main import load_config
+from src.controller.task_query import SortOrder, TaskSort
+
+cfg: Box = load_config()
+
+WHEN_TAGS: list[str] = cfg.DATABASE.TAGS.WHEN
+WHERE_TAGS: list[str] = cfg.DATABASE.TAGS.WHERE
+SORTS: list[str] = [sort.value for sort in TaskSort]
+SYNC_MAX_BATCH_SIZE: int = cfg.API.SYNC_MAX_BATCH_SIZE
+RESULTS_FOLDER: str = "data/benchmarks"
+
+
+@dataclass
+class LoadSpec:
+    clients: int = 50
+    waiting_clients: int = 200  # Long-polling the async app while it is tested
+    seconds: float = 20.0
+    list_share: float = 0.5  # Of requests for a task list, the rest for one task
+    list_limit: int = 50
+    seed: int = 1
+
+
+@dataclass
+class ServerResult:
+    server: str
+    url: str
+    requests: int
+    errors: int
+    requests_per_sec: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values: list[float], share: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * share), len(sorted_values) - 1)]
+
+
+async def sample_task_ids(client: httpx.AsyncClient, url: str) -> list[int]:
+    """The ids of up to a page of tasks, spread over the table by sorting"""
+    task_ids: set[int] = set()
+    for sort in SORTS:
+        response = await client.get(f"{url}/tasks", params={"sort": sort})
+        response.raise_for_status()
+        task_ids.update(task["id"] for task in response.json()["tasks"])
+    return sorted(task_ids)
+
+
+def random_request(
+    spec: LoadSpec, task_ids: list[int], rnd: random.Random
+) -> tuple[str, dict[str, Any]]:
+    if rnd.random() >= spec.list_share:
+        return f"/tasks/{rnd.choice(task_ids)}", {}
+    params: dict[str, Any] = {
+        "sort": rnd.choice(SORTS),
+        "order": rnd.choice([order.value for order in SortOrder]),
+        "limit": spec.list_limit,
+    }
+    if rnd.random() < 0.5:
+        params["where"] = rnd.choice(WHERE_TAGS)
+    if rnd.random() < 0.5:
+        params["when"] = rnd.choice(WHEN_TAGS)
+    return "/tasks", params
+
+
+async def run_client(
+    client: httpx.AsyncClient,
+    url: str,
+    spec: LoadSpec,
+    task_ids: list[int],
+    rnd: random.Random,
+    deadline: float,
+    latencies: list[float],
+) -> int:
+    """Sends requests one after another until the deadline. Returns the errors"""
+    errors: int = 0
+    while time.perf_counter() < deadline:
+        path, params = random_request(spec=spec, task_ids=task_ids, rnd=rnd)
+        start: float = time.perf_counter()
+        try:
+            response = await client.get(f"{url}{path}", params=params)
+            if response.status_code != 200:
+                errors += 1
+        except httpx.HTTPError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return errors
+
+
+async def latest_seq(client: httpx.AsyncClient, url: str) -> int:
+    """The seq of the latest change, synced up to as a client would"""
+    since: int = 0
+    while True:
+        response = await client.get(
+            f"{url}/sync", params={"since": since, "limit": SYNC_MAX_BATCH_SIZE}
+        )
+        response.raise_for_status()
+        since = response.json()["next_since"]
+        if not response.json()["has_more"]:
+            return since
+
+
+async def run_waiting_client(client: httpx.AsyncClient, url: str, since: int) -> None:
+    # Long-polls for the changes after since, until cancelled
+    while True:
+        try:
+            response = await client.get(
+                f"{url}/sync", params={"since": since, "wait": 60}
+            )
+            since = response.json()["next_since"]
+        except httpx.HTTPError:
+            await asyncio.sleep(1)
+
+
+async def load_test_server(
+    server: str, url: str, spec: LoadSpec, waiting_clients: int
+) -> ServerResult:
+    url = url.rstrip("/")
+    limits = httpx.Limits(max_connections=spec.clients + waiting_clients)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        task_ids: list[int] = await sample_task_ids(client=client, url=url)
+        since: int = await latest_seq(client=client, url=url) if waiting_clients else 0
+        waiters: list[asyncio.Task[None]] = [
+            asyncio.create_task(run_waiting_client(client=client, url=url, since=since))
+            for _ in range(waiting_clients)
+        ]
+        latencies: list[float] = []
+        start: float = time.perf_counter()
+        errors: list[int] = await asyncio.gather(
+            *(
+                run_client(
+                    client=client,
+                    url=url,
+                    spec=spec,
+                    task_ids=task_ids,
+                    rnd=random.Random(spec.seed + client_no),
+                    deadline=start + spec.seconds,
+                    latencies=latencies,
+                )
+                for client_no in range(spec.clients)
+            )
+        )
+        wall_seconds: float = time.perf_counter() - start
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    latencies_ms: list[float] = sorted(latency * 1_000 for latency in latencies)
+    return ServerResult(
+        server=server,
+        url=url,
+        requests=len(latencies_ms),
+        errors=sum(errors),
+        requests_per_sec=round(len(latencies_ms) / wall_seconds, 1),
+        p50_ms=round(statistics.median(latencies_ms), 2) if latencies_ms else 0.0,
+        p95_ms=round(percentile(sorted_values=latencies_ms, share=0.95), 2),
+        p99_ms=round(percentile(sorted_values=latencies_ms, share=0.99), 2),
+        max_ms=round(latencies_ms[-1], 2) if latencies_ms else 0.0,
+    )
+
+
+def run_load_test(
+    spec: LoadSpec, flask_url: Optional[str], async_url: Optional[str]
+) -> dict[str, Any]:
+    servers: list[ServerResult] = []
+    if flask_url:
+        servers.append(
+            asyncio.run(
+                load_test_server(
+                    server="flask", url=flask_url, spec=spec, waiting_clients=0
+                )
+            )
+        )
+    if async_url:
+        servers.append(
+            asyncio.run(
+                load_test_server(
+                    server="async",
+                    url=async_url,
+                    spec=spec,
+                    waiting_clients=spec.waiting_clients,
+                )
+            )
+        )
+    return {
+        "timestamp": dt.datetime.now(dt.UTC).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "spec": asdict(spec),
+        "servers": [asdict(server) for server in servers],
+    }
+
+
+def compare_results(previous: dict[str, Any], current: dict[str, Any]) -> None:
+    previous_servers: dict[str, dict[str, Any]] = {
+        server["server"]: server for server in previous["servers"]
+    }
+    print(f"Compared with {previous.get('revision')} ({previous.get('timestamp')})")
+    if previous["spec"] != current["spec"]:
+        print("Warning: the load spec differs between the two runs")
+    for server in current["servers"]:
+        before: Optional[dict[str, Any]] = previous_servers.get(server["server"])
+        if before is None:
+            continue
+        for metric in ("requests_per_sec", "p50_ms", "p95_ms", "errors"):
+            change: str = (
+                f"{server[metric] / before[metric]:.2f}x" if before[metric] else "n/a"
+            )
+            print(
+                f"  {server['server']:<8} {metric:<16} "
+                f"{before[metric]:>12} -> {server[metric]:>12} ({change})"
+            )
+
+
+def print_results(results: dict[str, Any]) -> None:
+    print(f"Load: {results['spec']}")
+    for server in results["servers"]:
+        print(
+            f"  {server['server']:<8} {server['requests']:>8} requests "
+            f"{server['requests_per_sec']:>9.1f} req/s "
+            f"p50 {server['p50_ms']:>8.2f} ms p95 {server['p95_ms']:>8.2f} ms "
+            f"p99 {server['p99_ms']:>8.2f} ms {server['errors']:>6} errors"
+        )
+
+
+if __name__ == "__main__":
+    defaults = LoadSpec()
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--flask-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--async-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=defaults.clients)
+    parser.add_argument("--waiting-clients", type=int, default=defaults.waiting_clients)
+    parser.add_argument("--seconds", type=float, default=defaults.seconds)
+    parser.add_argument("--list-share", type=float, default=defaults.list_share)
+    parser.add_argument("--list-limit", type=int, default=defaults.list_limit)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--output", help="JSON results file to write")
+    parser.add_argument("--compare", help="Earlier JSON results file to compare with")
+    args = parser.parse_args()
+
+    results: dict[str, Any] = run_load_test(
+        spec=LoadSpec(
+            clients=args.clients,
+            waiting_clients=args.waiting_clients,
+            seconds=args.seconds,
+            list_share=args.list_share,
+            list_limit=args.list_limit,
+            seed=args.seed,
+        ),
+        flask_url=args.flask_url,
+        async_url=args.async_url,
+    )
+    print_results(results=results)
+
+    output_pathname: str = args.output or os.path.join(
+        RESULTS_FOLDER,
+        f"serving_load_test_{results['timestamp'].replace(':', '')}.json",
+    )
+    os.makedirs(os.path.dirname(output_pathname) or ".", exist_ok=True)
+    with open(output_pathname, "w") as fp:
+        json.dump(results, fp, indent=4)
+    print(f"Results saved to {output_pathname}")
+
+    if args.compare:
+        with open(args.compare) as fp:
+            compare_results(previous=json.load(fp), current=results)
@@ -13,7 +13,7 @@ from src.config.config_main import cfg
 def load_log_config() -> Box:
     """
     Load logging config as log_cfg
-    Create logging folder if necessary
+    Create logging folders if necessary
     """
     logging_config_path_filename: str = cfg.LOGGING.CONFIG_PATH
 
@@ -30,6 +30,7 @@ def load_log_config() -> Box:
         )
 
     makedirs(name=log_cfg.handler.log_file.folder, exist_ok=True)
+    makedirs(name=log_cfg.handler.history.folder, exist_ok=True)
 
     return log_cfg
 
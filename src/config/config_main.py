@@ -1,10 +1,15 @@
 """ Loads General Program configuration as cfg, boxed """
 
 from box import Box
+import os
 from typing import Any
 import yaml
 
 CONFIG_LOC: str = "configs/notis_config.yaml"
+# The folder holding src, which relative paths in the config may be taken from
+PROJECT_FOLDER: str = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
 env = "dev"
 
 
@@ -1,32 +1,113 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import select
-from sqlalchemy.sql import text
+import os
+from typing import Any, Optional
 
-from src.controller.save_enex_backup_to_flask_mysql_db import Task
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    abort,
+    current_app,
+    jsonify,
+    request,
+    send_file,
+    stream_with_context,
+)
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import func, select
+
+from src.controller.read_cache import ReadCache
+from src.controller.reminders import REMINDERS_IN_APPS, ReminderScheduler, notifier_for
+from src.controller.repository import LoadProfile, get_loaded
+from src.controller.rest_api import item_response, list_response, sync_response
+from src.controller.resource_access import (
+    RESOURCE_CACHE_MAX_AGE_SECONDS,
+    get_resource,
+    iter_resource_data,
+    resource_mime,
+    resource_size,
+)
+from src.controller.resource_store import ResourceStore
+from src.controller.search import SEARCH_PAGE_SIZE, SEARCH_TABLES_BY_KIND, search
+from src.controller.sqlite_profile import SqliteProfile, apply_sqlite_profile
+from src.controller.thumbnails import (
+    THUMBNAIL_FOLDER,
+    THUMBNAIL_SIZES,
+    stored_thumbnail,
+    thumbnail_for,
+)
+from src.controller.task_query import (
+    TASK_LIST_PAGE_SIZE,
+    InvalidCursor,
+    SortOrder,
+    TaskFilter,
+    TaskSort,
+    list_tasks,
+    task_summary,
+)
+from src.controller.task_write import (
+    TaskIn,
+    TaskPatch,
+    UnknownTag,
+    add_task,
+    apply_task_fields,
+)
 
 # this variable, db, will be used for all SQLAlchemy commands
-db = SQLAlchemy()
-# create the app
-app = Flask(__name__)
-# change string to the name of your database; add path if necessary
-database_pathname: str = "../../../data/database/notes_data.db"
-db_name = f"sqlite+pysqlite:///{database_pathname}"
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    DATABASE_PATHNAME,
+    RESOURCE_STORE_FOLDER,
+    Project,
+    ReferenceTag,
+    Task,
+    WhenTag,
+    WhereTag,
+    db,
+)
+
+routes = Blueprint("notis", __name__)
+
+
+def create_app(
+    database_pathname: str = DATABASE_PATHNAME,
+    resource_folder: str = RESOURCE_STORE_FOLDER,
+    fire_reminders: bool = REMINDERS_IN_APPS,
+) -> Flask:
+    """
+    The app on the database. Run with
+        flask --app src.controller.app run
+    which finds this factory. Only one app per database should fire reminders
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite+pysqlite:///{database_pathname}"
+    # The ResourceStore of the resources not kept in the database
+    app.config["RESOURCE_FOLDER"] = resource_folder
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
 
-app.config["SQLALCHEMY_DATABASE_URI"] = db_name
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = True
+    # initialize the app with Flask-SQLAlchemy
+    db.init_app(app)
+    with app.app_context():
+        apply_sqlite_profile(engine=db.engine, profile=SqliteProfile.SERVING)
+        # Task and tag lists, kept until a commit changes the tasks or tags
+        app.extensions["read_cache"] = ReadCache(engine=db.engine).start()
+        if fire_reminders:
+            # Sees the app's writes as they are committed
+            app.extensions["reminder_scheduler"] = ReminderScheduler(
+                engine=db.engine, notifier=notifier_for()
+            ).start()
+    app.register_blueprint(routes)
+    return app
 
-# initialize the app with Flask-SQLAlchemy
-db.init_app(app)
+
+def read_cache() -> ReadCache:
+    return current_app.extensions["read_cache"]
 
 
-# NOTHING BELOW THIS LINE NEEDS TO CHANGE
 # this route will test the database connection - and nothing more
-@app.route("/")
+@routes.route("/")
 def testdb():
     try:
-        result = db.session.scalars(select(Task)).all()
-        return "<h1>It works.</h1>/p<p>{results}</p>"
+        task_count = db.session.scalar(select(func.count(Task.id)))
+        return f"<h1>It works.</h1><p>{task_count} tasks</p>"
     except Exception as e:
         # e holds description of the error
         error_text = "<p>The error:<br>" + str(e) + "</p>"
@@ -34,5 +115,296 @@ def testdb():
         return hed + error_text
 
 
+@routes.route("/resources/<resource_hash>")
+def get_resource_data(resource_hash: str) -> Response:
+    """
+    Streams a resource's bytes, from the database or the ResourceStore.
+    A Range header with one range of bytes gets just those, e.g. to resume a
+    download or seek in a recording. The hash is the content, so clients may
+    cache the bytes for good.
+    """
+    if request.if_none_match.contains_weak(resource_hash):
+        return immutable(Response(status=304), etag=resource_hash)
+    resource = get_resource(resource_hash=resource_hash)
+    if resource is None:
+        abort(404)
+    resource_folder: str = current_app.config["RESOURCE_FOLDER"]
+    size = resource_size(resource=resource, resource_folder=resource_folder)
+    if size is None:
+        abort(404)
+
+    status: int = 200
+    start, end = 0, size
+    headers: dict[str, str] = {"Accept-Ranges": "bytes"}
+    # Ranges are ignored if the If-Range is for other bytes, or if there are
+    # several, which are allowed to be answered with the whole resource
+    if request.range is not None and (
+        request.if_range.etag is None or request.if_range.etag == resource_hash
+    ):
+        byte_range = request.range.range_for_length(size)
+        if byte_range is not None:
+            status = 206
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        elif len(request.range.ranges) == 1:
+            return Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+    headers["Content-Length"] = str(end - start)
+
+    return immutable(
+        Response(
+            stream_with_context(
+                iter_resource_data(
+                    resource=resource,
+                    resource_folder=resource_folder,
+                    start=start,
+                    end=end,
+                )
+            ),
+            status=status,
+            mimetype=resource_mime(resource=resource),
+            headers=headers,
+        ),
+        etag=resource_hash,
+    )
+
+
+@routes.route("/resources/<resource_hash>/thumbnail/<int:width>x<int:height>")
+def get_resource_thumbnail(resource_hash: str, width: int, height: int) -> Response:
+    """
+    The image scaled down to fit width x height, one of THUMBNAIL_SIZES.
+    Made once, then served from the thumbnail store.
+    """
+    if (width, height) not in THUMBNAIL_SIZES:
+        abort(
+            404,
+            description="Thumbnails are made in these sizes: "
+            + ", ".join(f"{width}x{height}" for width, height in THUMBNAIL_SIZES),
+        )
+    store = ResourceStore(folder=THUMBNAIL_FOLDER)
+    thumbnail = stored_thumbnail(
+        store=store, resource_hash=resource_hash, width=width, height=height
+    )
+    if thumbnail is None:
+        resource = get_resource(resource_hash=resource_hash)
+        if resource is None:
+            abort(404)
+        thumbnail = thumbnail_for(
+            resource=resource,
+            width=width,
+            height=height,
+            resource_folder=current_app.config["RESOURCE_FOLDER"],
+        )
+        if thumbnail is None:
+            abort(404)
+
+    return immutable(
+        send_file(os.path.abspath(thumbnail.path), mimetype=thumbnail.mime, etag=False),
+        etag=thumbnail.key,
+    )
+
+
+def immutable(response: Response, etag: str) -> Response:
+    """Lets clients and caches keep the response for good, under etag"""
+    response.set_etag(etag)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = RESOURCE_CACHE_MAX_AGE_SECONDS
+    response.cache_control.immutable = True
+    return response
+
+
+@routes.route("/search")
+def search_tasks_and_notes() -> Response:
+    """
+    Ranked full-text search, e.g. /search?q=tax+return&kind=note&page=2
+    kind may be given more than once, and defaults to both tasks and notes
+    """
+    query: str = request.args.get("q", "").strip()
+    if not query:
+        abort(400, description="The q parameter is required")
+    search_page = search(
+        query=query,
+        kinds=request.args.getlist("kind") or SEARCH_TABLES_BY_KIND,
+        page=request.args.get("page", 1, type=int),
+        per_page=request.args.get("per_page", SEARCH_PAGE_SIZE, type=int),
+    )
+    return jsonify(
+        query=search_page.query,
+        page=search_page.page,
+        per_page=search_page.per_page,
+        has_more=search_page.has_more,
+        results=[hit._asdict() for hit in search_page.hits],
+    )
+
+
+@routes.route("/tasks")
+def get_tasks() -> Response:
+    """
+    Tasks filtered by tag and project, sorted and paged, e.g.
+    /tasks?where=@Phone&when=1-Now&when=2-Next&sort=reminder&limit=20
+    Repeated filters match any of their values. Pass the next_cursor of a
+    response as cursor, with the same filters and sort, for the next page.
+    """
+    return jsonify(
+        read_cache().get_or_load(
+            key=("tasks", tuple(sorted(request.args.items(multi=True)))),
+            depends_on=(Task, WhereTag, WhenTag, ReferenceTag, Project),
+            load=load_task_page,
+        )
+    )
+
+
+def load_task_page() -> dict[str, Any]:
+    try:
+        sort = TaskSort(request.args.get("sort", TaskSort.CREATED.value))
+        order = SortOrder(request.args.get("order", SortOrder.ASC.value))
+        task_page = list_tasks(
+            task_filter=TaskFilter(
+                where=request.args.getlist("where"),
+                when=request.args.getlist("when"),
+                reference=request.args.getlist("tag"),
+                project_id=request.args.get("project", type=int),
+            ),
+            sort=sort,
+            order=order,
+            limit=request.args.get("limit", TASK_LIST_PAGE_SIZE, type=int),
+            cursor=request.args.get("cursor"),
+        )
+    except (ValueError, InvalidCursor) as e:
+        abort(400, description=str(e))
+    return {
+        "tasks": [task_summary(task=task) for task in task_page.tasks],
+        "next_cursor": task_page.next_cursor,
+    }
+
+
+@routes.route("/tags")
+def get_tags() -> Response:
+    """The names of the where (context), when and reference tags"""
+    return jsonify(
+        read_cache().get_or_load(
+            key=("tags",),
+            depends_on=(WhereTag, WhenTag, ReferenceTag),
+            load=lambda: {
+                kind: db.session.scalars(select(model.name).order_by(model.name)).all()
+                for kind, model in (
+                    ("where", WhereTag),
+                    ("when", WhenTag),
+                    ("reference", ReferenceTag),
+                )
+            },
+        )
+    )
+
+
+@routes.route("/cache")
+def get_cache_stats() -> Response:
+    """Hits and misses of the read cache since the app started"""
+    return jsonify(
+        hits=read_cache().stats.hits,
+        misses=read_cache().stats.misses,
+        hit_ratio=read_cache().stats.hit_ratio,
+        invalidations=read_cache().stats.invalidations,
+    )
+
+
+def validated(model: type[BaseModel]) -> BaseModel:
+    """The request's JSON body, or else aborts with 422"""
+    try:
+        return model.model_validate(request.get_json(silent=True) or {})
+    except ValidationError as e:
+        abort(422, description=str(e))
+
+
+def written_task(task: Task) -> dict[str, Any]:
+    """Commits the task, and returns it as /tasks/<task_id> does"""
+    db.session.commit()
+    return {**task_summary(task=task), "body_text": task.body_text}
+
+
+@routes.post("/tasks")
+def create_task() -> tuple[dict[str, Any], int]:
+    """Adds a task from a JSON body of TaskIn's fields"""
+    try:
+        task: Task = add_task(
+            session=db.session, fields=validated(model=TaskIn).model_dump()
+        )
+    except UnknownTag as e:
+        abort(422, description=str(e))
+    return written_task(task=task), 201
+
+
+@routes.patch("/tasks/<int:task_id>")
+def update_task(task_id: int) -> dict[str, Any]:
+    """Changes the fields of TaskPatch sent in the JSON body, only those"""
+    task: Optional[Task] = get_loaded(
+        model=Task, id=task_id, profile=LoadProfile.DETAIL
+    )
+    if task is None:
+        abort(404)
+    try:
+        apply_task_fields(
+            session=db.session,
+            task=task,
+            fields=validated(model=TaskPatch).model_dump(exclude_unset=True),
+        )
+    except UnknownTag as e:
+        abort(422, description=str(e))
+    return written_task(task=task)
+
+
+@routes.route("/tasks/<int:task_id>")
+def get_task(task_id: int) -> Response:
+    return jsonify(
+        read_cache().get_or_load(
+            key=("task", task_id),
+            depends_on=(Task, WhereTag, WhenTag, ReferenceTag),
+            load=lambda: load_task(task_id=task_id),
+        )
+    )
+
+
+def load_task(task_id: int) -> dict[str, Any]:
+    task = get_loaded(model=Task, id=task_id, profile=LoadProfile.DETAIL)
+    if task is None:
+        abort(404)
+    return {**task_summary(task=task), "body_text": task.body_text}
+
+
+@routes.route("/api/<any(tasks, notes, projects):resource_name>")
+def get_api_list(resource_name: str) -> Response:
+    """
+    One page of tasks, notes or projects, e.g.
+    /api/tasks?fields=title,updated&limit=500&cursor=...
+    Send the ETag back as If-None-Match to get a 304 if the page is unchanged.
+    """
+    return list_response(resource_name=resource_name)
+
+
+@routes.route("/api/<any(tasks, notes, projects):resource_name>/<int:row_id>")
+def get_api_item(resource_name: str, row_id: int) -> Response:
+    return item_response(resource_name=resource_name, row_id=row_id)
+
+
+@routes.route("/api/tags/<any(where, when, reference):kind>")
+def get_api_tags(kind: str) -> Response:
+    return list_response(resource_name=f"tags/{kind}")
+
+
+@routes.route("/api/tags/<any(where, when, reference):kind>/<int:row_id>")
+def get_api_tag(kind: str, row_id: int) -> Response:
+    return item_response(resource_name=f"tags/{kind}", row_id=row_id)
+
+
+@routes.route("/sync")
+def get_sync() -> Response:
+    """
+    The changes to tasks, notes, projects, resources and tags after a seq,
+    e.g. /sync?since=1234, with tombstones for deleted rows
+    """
+    return sync_response()
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Without the reloader, which would run a second app, firing reminders too
+    create_app().run(debug=True, use_reloader=False)
@@ -0,0 +1,326 @@
+""" Serving tasks and tags from an async engine, for many concurrent clients
+
+The same models and queries as the Flask app, run on an AsyncSession over
+aiosqlite, so a request waiting on the database doesn't hold a thread. Run with
+    uvicorn src.controller.async_app:app
+
+It serves /tasks, /tags and /sync, and adds and changes tasks the same way as
+the Flask app. Search, /api and resources are only served by the Flask app.
+Like the Flask app, it fires reminders if REMINDERS.IN_APPS.
+
+Sync clients long-poll /sync?since=<seq>&wait=<seconds>, the change log
+feed of the Flask app's /sync, so they see every change, deletes included,
+whoever wrote it. A waiting client holds no database connection: one watcher
+reads the change log's latest seq every LONG_POLL_CHECK_SECONDS and wakes the
+clients waiting for a later one, and writes through this app wake them at
+once. The pool only needs to be as large as the number of queries running at
+the same time.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Annotated, Any, AsyncIterator, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Query
+from sqlalchemy import AsyncAdaptedQueuePool, Engine, Select, select, text
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from src.controller.change_log import LATEST_SEQ_SQL
+from src.controller.reminders import (
+    REMINDERS_IN_APPS,
+    ReminderScheduler,
+    create_reminder_engine,
+    notifier_for,
+)
+from src.controller.repository import LoadProfile, load_options
+from src.controller.rest_api import sync_changes, sync_limit
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    DATABASE_PATHNAME,
+    ReferenceTag,
+    Task,
+    WhenTag,
+    WhereTag,
+    cfg,
+)
+from src.controller.sqlite_profile import SqliteProfile, apply_sqlite_profile
+from src.controller.task_query import (
+    TASK_LIST_PAGE_SIZE,
+    InvalidCursor,
+    SortOrder,
+    TaskFilter,
+    TaskSort,
+    task_page,
+    task_page_query,
+    task_summary,
+)
+from src.controller.task_write import (
+    TaskIn,
+    TaskPatch,
+    UnknownTag,
+    add_task,
+    apply_task_fields,
+)
+from src.config.config_logging import logger
+
+ASYNC_POOL_SIZE: int = cfg.ASYNC_APP.POOL_SIZE
+ASYNC_MAX_OVERFLOW: int = cfg.ASYNC_APP.MAX_OVERFLOW
+ASYNC_POOL_TIMEOUT: float = cfg.ASYNC_APP.POOL_TIMEOUT
+LONG_POLL_MAX_SECONDS: float = cfg.ASYNC_APP.LONG_POLL_MAX_SECONDS
+LONG_POLL_CHECK_SECONDS: float = cfg.ASYNC_APP.LONG_POLL_CHECK_SECONDS
+
+
+def create_async_database_engine(database_pathname: str) -> AsyncEngine:
+    # aiosqlite opens a connection, and a thread to run it, per checkout by
+    # default. A pool keeps them open, with their PRAGMAs applied
+    engine: AsyncEngine = create_async_engine(
+        f"sqlite+aiosqlite:///{database_pathname}",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=ASYNC_POOL_SIZE,
+        max_overflow=ASYNC_MAX_OVERFLOW,
+        pool_timeout=ASYNC_POOL_TIMEOUT,
+    )
+    apply_sqlite_profile(engine=engine.sync_engine, profile=SqliteProfile.SERVING)
+    return engine
+
+
+class ChangeWatcher:
+    """
+    Keeps the change log's latest seq, and wakes the clients waiting for a
+    later one: at once for writes through this app, and within check_seconds
+    for other writers, such as an import or the Flask app
+    """
+
+    def __init__(self, engine: AsyncEngine, check_seconds: float) -> None:
+        self.engine: AsyncEngine = engine
+        self.check_seconds: float = check_seconds
+        self.seq: int = 0  # The latest change log seq seen
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task[None]] = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def notify(self, seq: int) -> None:
+        """Wakes the clients waiting for a seq up to seq"""
+        async with self.condition:
+            if seq > self.seq:
+                self.seq = seq
+                self.condition.notify_all()
+
+    async def wait_for_change(self, after_seq: int, timeout: float) -> bool:
+        """Whether there was a change after after_seq before the timeout"""
+        async with self.condition:
+            try:
+                await asyncio.wait_for(
+                    self.condition.wait_for(lambda: self.seq > after_seq),
+                    timeout=timeout,
+                )
+            except TimeoutError:
+                return False
+            return True
+
+    async def _watch(self) -> None:
+        async with self.engine.connect() as connection:
+            while True:
+                seq: int = (await connection.exec_driver_sql(LATEST_SEQ_SQL)).scalar()
+                # Ends the read, so the next one sees later commits
+                await connection.rollback()
+                await self.notify(seq=seq)
+                await asyncio.sleep(self.check_seconds)
+
+
+def create_async_app(
+    database_pathname: str = DATABASE_PATHNAME,
+    long_poll_check_seconds: float = LONG_POLL_CHECK_SECONDS,
+    fire_reminders: bool = REMINDERS_IN_APPS,
+) -> FastAPI:
+    engine: AsyncEngine = create_async_database_engine(
+        database_pathname=database_pathname
+    )
+    # Not expired on commit, so a written task can be returned without a reload
+    async_session = async_sessionmaker(engine, expire_on_commit=False)
+    change_watcher = ChangeWatcher(engine=engine, check_seconds=long_poll_check_seconds)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        change_watcher.start()
+        # On a sync engine of its own, as it runs in a thread. It sees the
+        # app's writes as they are committed, through the sessions' events
+        reminder_engine: Optional[Engine] = None
+        reminder_scheduler: Optional[ReminderScheduler] = None
+        if fire_reminders:
+            reminder_engine = create_reminder_engine(
+                database_pathname=database_pathname
+            )
+            reminder_scheduler = ReminderScheduler(
+                engine=reminder_engine, notifier=notifier_for()
+            ).start()
+        app.state.reminder_scheduler = reminder_scheduler
+        logger.info(msg=f"Serving {database_pathname}")
+        try:
+            yield
+        finally:
+            if reminder_scheduler is not None:
+                await asyncio.to_thread(reminder_scheduler.stop)
+            if reminder_engine is not None:
+                reminder_engine.dispose()
+            await change_watcher.stop()
+            await engine.dispose()
+
+    app = FastAPI(title="Notis", lifespan=lifespan)
+
+    async def get_session() -> AsyncIterator[AsyncSession]:
+        async with async_session() as session:
+            yield session
+
+    DbSession = Annotated[AsyncSession, Depends(get_session)]
+
+    async def loaded_task(session: AsyncSession, task_id: int) -> Task:
+        task: Optional[Task] = await session.get(
+            Task, task_id, options=load_options(model=Task, profile=LoadProfile.DETAIL)
+        )
+        if task is None:
+            raise HTTPException(status_code=404)
+        return task
+
+    @app.get("/tasks")
+    async def get_tasks(
+        session: DbSession,
+        where: Annotated[list[str], Query()] = [],
+        when: Annotated[list[str], Query()] = [],
+        tag: Annotated[list[str], Query()] = [],
+        project: Optional[int] = None,
+        sort: TaskSort = TaskSort.CREATED,
+        order: SortOrder = SortOrder.ASC,
+        limit: int = TASK_LIST_PAGE_SIZE,
+        cursor: Optional[str] = None,
+    ) -> dict[str, Any]:
+        """The same tasks, filters and paging as the Flask app's /tasks"""
+        try:
+            query: Select = task_page_query(
+                task_filter=TaskFilter(
+                    where=where, when=when, reference=tag, project_id=project
+                ),
+                sort=sort,
+                order=order,
+                limit=limit,
+                cursor=cursor,
+            )
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        page = task_page(
+            tasks=list(await session.scalars(query)),
+            sort=sort,
+            order=order,
+            limit=limit,
+        )
+        return {
+            "tasks": [task_summary(task=task) for task in page.tasks],
+            "next_cursor": page.next_cursor,
+        }
+
+    @app.get("/tasks/{task_id}")
+    async def get_task(session: DbSession, task_id: int) -> dict[str, Any]:
+        task: Task = await loaded_task(session=session, task_id=task_id)
+        return {**task_summary(task=task), "body_text": task.body_text}
+
+    async def written_task(session: AsyncSession, task: Task) -> dict[str, Any]:
+        """Commits the task, and returns it as /tasks/{task_id} does"""
+        await session.commit()
+        written: dict[str, Any] = {
+            **task_summary(task=task),
+            "body_text": task.body_text,
+        }
+        await change_watcher.notify(seq=await session.scalar(text(LATEST_SEQ_SQL)))
+        return written
+
+    @app.post("/tasks", status_code=201)
+    async def create_task(session: DbSession, task_in: TaskIn) -> dict[str, Any]:
+        try:
+            task: Task = await session.run_sync(
+                lambda sync_session: add_task(
+                    session=sync_session, fields=task_in.model_dump()
+                )
+            )
+        except UnknownTag as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return await written_task(session=session, task=task)
+
+    @app.patch("/tasks/{task_id}")
+    async def update_task(
+        session: DbSession, task_id: int, task_patch: TaskPatch
+    ) -> dict[str, Any]:
+        task: Task = await loaded_task(session=session, task_id=task_id)
+        try:
+            await session.run_sync(
+                lambda sync_session: apply_task_fields(
+                    session=sync_session,
+                    task=task,
+                    fields=task_patch.model_dump(exclude_unset=True),
+                )
+            )
+        except UnknownTag as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return await written_task(session=session, task=task)
+
+    @app.get("/sync")
+    async def get_sync(
+        session: DbSession,
+        since: int = 0,
+        limit: Optional[int] = None,
+        wait: float = 0.0,
+    ) -> dict[str, Any]:
+        """
+        The changes after seq since, as the Flask app's /sync sends them. If
+        there are none yet, waits up to wait seconds for some
+        """
+        limit = sync_limit(limit=limit)
+        deadline: float = asyncio.get_running_loop().time() + min(
+            max(wait, 0.0), LONG_POLL_MAX_SECONDS
+        )
+        while True:
+            changes: dict[str, Any] = await session.run_sync(
+                lambda sync_session: sync_changes(
+                    session=sync_session, since=since, limit=limit
+                )
+            )
+            # Ends the read, so no snapshot or connection is held while waiting
+            await session.rollback()
+            remaining: float = deadline - asyncio.get_running_loop().time()
+            if changes["changes"] or remaining <= 0:
+                break
+            if not await change_watcher.wait_for_change(
+                after_seq=since, timeout=remaining
+            ):
+                break
+        return changes
+
+    @app.get("/tags")
+    async def get_tags(session: DbSession) -> dict[str, list[str]]:
+        """The names of the where (context), when and reference tags"""
+        return {
+            kind: list(await session.scalars(select(model.name).order_by(model.name)))
+            for kind, model in (
+                ("where", WhereTag),
+                ("when", WhenTag),
+                ("reference", ReferenceTag),
+            )
+        }
+
+    return app
+
+
+app: FastAPI = create_async_app()
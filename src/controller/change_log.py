@@ -0,0 +1,158 @@
+""" The change log: every insert, update and delete of the synced tables, in order
+
+Each change is a row of change_log with a seq that only ever grows, the table,
+the changed row's key and whether it was inserted, updated or deleted. Rows
+are keyed by id, and association rows by their pair of ids, kept in row_id and
+related_id. Triggers on each table write the log, so every writer is logged,
+including imports and other processes. Clients sync by asking for the changes
+after the last seq they have seen.
+
+A row's latest change is all a client needs, as it is sent the row as it is
+now, so compacting the log drops every change with a later one for the same
+row. Deletes are kept, as tombstones, so clients far behind still see them.
+
+An update is only logged if it changed one of the row's values, so writing a
+row back as it was, e.g. by an import of an unchanged note, sends clients
+nothing. The update triggers list the columns they compare, so they are made
+again when a column is added.
+"""
+
+from typing import Sequence
+
+from sqlalchemy import Connection
+
+from src.config.config_logging import logger
+
+# The synced tables, with the columns that key their rows. Existing rows are
+# logged in this order, so the rows an association row refers to come first
+CHANGE_LOG_KEYS: dict[str, tuple[str, ...]] = {
+    "where_tags_table": ("id",),
+    "when_tags": ("id",),
+    "reference_tags": ("id",),
+    "resources": ("id",),
+    "projects": ("id",),
+    "notes": ("id",),
+    "tasks": ("id",),
+    "task_where_tags_association": ("task_id", "where_tag_id"),
+    "task_when_tags_association": ("task_id", "when_tag_id"),
+    "task_reference_tags_association": ("task_id", "reference_tag_id"),
+    "note_reference_tags_association": ("note_id", "reference_tag_id"),
+    "project_task_association": ("project_id", "task_id"),
+}
+CHANGE_LOG_OPERATIONS: tuple[str, ...] = ("insert", "update", "delete")
+
+# AUTOINCREMENT, so the seq of a compacted away change is never used again.
+# Only indexed by seq, as every other index would slow down every write
+CHANGE_LOG_TABLE_SQL: str = """
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name VARCHAR(63) NOT NULL,
+        row_id INTEGER NOT NULL,
+        related_id INTEGER,
+        operation VARCHAR(6) NOT NULL,
+        changed TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+CHANGE_LOG_INSERT_SQL: str = """
+    INSERT INTO change_log (table_name, row_id, related_id, operation)
+    VALUES ('{table}', {row}.{first_key}, {related_id}, '{operation}');
+"""
+# The seq of the latest change, 0 for none
+LATEST_SEQ_SQL: str = "SELECT coalesce(max(seq), 0) FROM change_log"
+
+
+def change_log_insert_sql(table: str, row: str, operation: str) -> str:
+    """The trigger statement logging the change of the new or old row"""
+    keys: tuple[str, ...] = CHANGE_LOG_KEYS[table]
+    return CHANGE_LOG_INSERT_SQL.format(
+        table=table,
+        row=row,
+        first_key=keys[0],
+        related_id=f"{row}.{keys[1]}" if len(keys) > 1 else "NULL",
+        operation=operation,
+    )
+
+
+def change_log_trigger_sql(
+    table: str, operation: str, columns: Sequence[str] = ()
+) -> str:
+    """
+    The trigger logging the operation on the table. An update trigger only
+    fires if one of the columns changed, if they are given
+    """
+    when: str = ""
+    if operation == "update" and columns:
+        when = (
+            "WHEN "
+            + " OR ".join(f"old.{column} IS NOT new.{column}" for column in columns)
+            + " "
+        )
+    if operation == "insert":
+        body: str = change_log_insert_sql(table=table, row="new", operation="insert")
+    elif operation == "delete":
+        body = change_log_insert_sql(table=table, row="old", operation="delete")
+    elif len(CHANGE_LOG_KEYS[table]) > 1:
+        # An association row changed is one pair gone and another added
+        body = change_log_insert_sql(
+            table=table, row="old", operation="delete"
+        ) + change_log_insert_sql(table=table, row="new", operation="insert")
+    else:
+        body = change_log_insert_sql(table=table, row="new", operation="update")
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {table}_change_log_{operation} "
+        f"AFTER {operation.upper()} ON {table} {when}BEGIN {body} END"
+    )
+
+
+def create_change_log_triggers(connection: Connection) -> None:
+    for table in CHANGE_LOG_KEYS:
+        columns: list[str] = [
+            row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")
+        ]
+        for operation in CHANGE_LOG_OPERATIONS:
+            connection.exec_driver_sql(
+                change_log_trigger_sql(
+                    table=table, operation=operation, columns=columns
+                )
+            )
+
+
+def log_only_changed_updates(connection: Connection) -> None:
+    """
+    The update triggers logged every update, even one writing a row back as
+    it was. They are made again, comparing the old and new values
+    """
+    for table in CHANGE_LOG_KEYS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {table}_change_log_update")
+    create_change_log_triggers(connection=connection)
+
+
+def add_change_log(connection: Connection) -> None:
+    """
+    The change log and its triggers, starting with an insert of every row
+    already stored, so a client syncing from the start gets every row
+    """
+    connection.exec_driver_sql(CHANGE_LOG_TABLE_SQL)
+    if connection.exec_driver_sql("SELECT count(*) FROM change_log").scalar() == 0:
+        for table, keys in CHANGE_LOG_KEYS.items():
+            connection.exec_driver_sql(
+                "INSERT INTO change_log (table_name, row_id, related_id, operation) "
+                f"SELECT '{table}', {keys[0]}, "
+                f"{keys[1] if len(keys) > 1 else 'NULL'}, 'insert' FROM {table} "
+                f"ORDER BY {', '.join(keys)}"
+            )
+    create_change_log_triggers(connection=connection)
+
+
+def compact_change_log(connection: Connection) -> int:
+    """
+    Drops the changes of each row but its latest. Returns how many were
+    dropped
+    """
+    dropped: int = connection.exec_driver_sql(
+        "DELETE FROM change_log WHERE seq NOT IN ("
+        "SELECT max(seq) FROM change_log GROUP BY table_name, row_id, related_id)"
+    ).rowcount
+    if dropped:
+        logger.info(msg=f"Dropped {dropped} superseded changes from the change log")
+    return dropped
@@ -0,0 +1,39 @@
+""" Normalized content hash of a Task or Note, used to find duplicates """
+
+import datetime as dt
+import hashlib
+from typing import Iterable, Optional
+
+
+def normalize_timestamp(timestamp: Optional[dt.datetime]) -> str:
+    """Naive UTC, to the second, as SQLite gives back what was stored aware"""
+    if timestamp is None:
+        return ""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(dt.UTC).replace(tzinfo=None)
+    return timestamp.isoformat(timespec="seconds")
+
+
+def compute_content_hash(
+    title: str,
+    body_text: str,
+    tags: Iterable[str],
+    created: Optional[dt.datetime],
+    updated: Optional[dt.datetime],
+) -> str:
+    """
+    sha256 of a Task or Note's normalized content: runs of whitespace in the
+    title and body collapse to one space and tags are deduplicated and sorted,
+    so the same note always gets the same hash however it was exported
+    """
+    content_hash = hashlib.sha256()
+    for field in (
+        " ".join(title.split()),
+        " ".join(body_text.split()),
+        "\x1f".join(sorted({tag.strip() for tag in tags})),
+        normalize_timestamp(created),
+        normalize_timestamp(updated),
+    ):
+        content_hash.update(field.encode("utf-8"))
+        content_hash.update(b"\x1e")
+    return content_hash.hexdigest()
@@ -0,0 +1,313 @@
+""" The daily to do digest: actionable tasks grouped by when and where, by email
+
+A task is actionable on a day if its when tag is one of DIGEST.WHEN_TAGS or it
+has a reminder that day. Days and reminder times are those of DIGEST.TIME_ZONE,
+while reminder times are stored in UTC. The digest is read in two queries, one for the when
+buckets, sorted the way the digest groups them, and one for the day's
+reminders. Each row carries its task's when and where tags, projects and
+reference tags, so rendering never goes back to the database. Rows are plain
+tuples rather than Task objects: loading tens of thousands of ORM objects with
+their collections costs several times the queries themselves.
+"""
+
+import argparse
+from dataclasses import dataclass, field
+import datetime as dt
+import html
+from itertools import groupby
+from typing import Any, NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Engine, Select, create_engine, func, literal, select
+from sqlalchemy.orm import Session
+
+from src.controller.mail import SmtpSettings, send_email
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    DATABASE_PATHNAME,
+    Project,
+    ReferenceTag,
+    Task,
+    WhenTag,
+    WhereTag,
+    cfg,
+    project_tasks,
+    task_when_tags,
+    task_where_tags,
+    tasks_reference_tags,
+)
+from src.controller.sqlite_profile import SqliteProfile, apply_sqlite_profile
+from src.config.config_logging import logger
+
+DIGEST_WHEN_TAGS: list[str] = cfg.DIGEST.WHEN_TAGS
+# None is the system's time zone
+DIGEST_TIME_ZONE: Optional[dt.tzinfo] = (
+    ZoneInfo(cfg.DIGEST.TIME_ZONE) if cfg.DIGEST.TIME_ZONE else None
+)
+NO_CONTEXT: str = "No context"
+NAME_SEPARATOR: str = "\x1f"  # Between the names in one group_concat column
+
+
+class DigestTask(NamedTuple):
+    id: int
+    title: str
+    reminder_time: Optional[dt.datetime]
+    when: Optional[str]
+    where: Optional[str]
+    projects: list[str]
+    reference_tags: list[str]
+
+
+@dataclass
+class DigestGroup:
+    when: str
+    where: str
+    tasks: list[DigestTask] = field(default_factory=list)
+
+
+@dataclass
+class Digest:
+    day: dt.date
+    reminders: list[DigestTask] = field(default_factory=list)  # Due that day, by time
+    groups: list[DigestGroup] = field(default_factory=list)  # By when, then where
+
+    @property
+    def task_count(self) -> int:
+        return len(
+            {task.id for task in self.reminders}
+            | {task.id for group in self.groups for task in group.tasks}
+        )
+
+
+def names_for_task(
+    name_column: Any, association_table: Any, id_column: str, name_model: type[Any]
+) -> Any:
+    """The names of the task's projects or tags, in one column"""
+    return (
+        select(func.group_concat(name_column, literal(NAME_SEPARATOR)))
+        .join(association_table, association_table.c[id_column] == name_model.id)
+        .where(association_table.c.task_id == Task.id)
+        .scalar_subquery()
+    )
+
+
+def digest_query() -> Select:
+    return (
+        select(
+            Task.id,
+            Task.title,
+            Task.reminder_time,
+            WhenTag.name,
+            WhereTag.name,
+            names_for_task(Project.title, project_tasks, "project_id", Project),
+            names_for_task(
+                ReferenceTag.name,
+                tasks_reference_tags,
+                "reference_tag_id",
+                ReferenceTag,
+            ),
+        )
+        .outerjoin(task_where_tags, task_where_tags.c.task_id == Task.id)
+        .outerjoin(WhereTag, WhereTag.id == task_where_tags.c.where_tag_id)
+    )
+
+
+def digest_tasks(session: Session, query: Select) -> list[DigestTask]:
+    # Through the connection, as there are no ORM entities to load
+    return [
+        DigestTask(
+            id=task_id,
+            title=title,
+            reminder_time=reminder_time,
+            when=when,
+            where=where,
+            projects=sorted(projects.split(NAME_SEPARATOR)) if projects else [],
+            reference_tags=(
+                sorted(reference_tags.split(NAME_SEPARATOR)) if reference_tags else []
+            ),
+        )
+        for task_id, title, reminder_time, when, where, projects, reference_tags in (
+            session.connection().execute(query)
+        )
+    ]
+
+
+def day_bounds_utc(
+    day: dt.date, time_zone: Optional[dt.tzinfo]
+) -> tuple[dt.datetime, dt.datetime]:
+    """
+    The start and end of the day in the time zone, as stored: in UTC without a
+    time zone. Days may not be 24 hours long, where clocks change.
+    """
+    return tuple(
+        # A naive datetime is taken to be in the system's time zone
+        dt.datetime.combine(bound, dt.time(), tzinfo=time_zone)
+        .astimezone(dt.UTC)
+        .replace(tzinfo=None)
+        for bound in (day, day + dt.timedelta(days=1))
+    )
+
+
+def local_reminder(task: DigestTask, time_zone: Optional[dt.tzinfo]) -> DigestTask:
+    if task.reminder_time is None:
+        return task
+    return task._replace(
+        reminder_time=task.reminder_time.replace(tzinfo=dt.UTC).astimezone(time_zone)
+    )
+
+
+def build_digest(
+    session: Session,
+    day: dt.date,
+    when_tags: list[str] = DIGEST_WHEN_TAGS,
+    time_zone: Optional[dt.tzinfo] = DIGEST_TIME_ZONE,
+) -> Digest:
+    day_start, day_end = day_bounds_utc(day=day, time_zone=time_zone)
+
+    # From the when tags through their tasks, rather than scanning all tasks
+    bucket_tasks: list[DigestTask] = digest_tasks(
+        session=session,
+        query=digest_query()
+        .join(task_when_tags, task_when_tags.c.task_id == Task.id)
+        .join(WhenTag, WhenTag.id == task_when_tags.c.when_tag_id)
+        .where(WhenTag.name.in_(when_tags))
+        .order_by(
+            WhenTag.name,
+            WhereTag.name.is_(None),
+            WhereTag.name,
+            Task.reminder_time.is_(None),
+            Task.reminder_time,
+            Task.title,
+            Task.id,
+        ),
+    )
+    reminders: list[DigestTask] = digest_tasks(
+        session=session,
+        query=digest_query()
+        .outerjoin(task_when_tags, task_when_tags.c.task_id == Task.id)
+        .outerjoin(WhenTag, WhenTag.id == task_when_tags.c.when_tag_id)
+        .where(Task.reminder_time >= day_start, Task.reminder_time < day_end)
+        .order_by(Task.reminder_time, Task.title, Task.id),
+    )
+
+    digest = Digest(
+        day=day,
+        reminders=[
+            local_reminder(task=task, time_zone=time_zone) for task in reminders
+        ],
+    )
+    for (when, where), group_tasks in groupby(
+        bucket_tasks, key=lambda task: (task.when, task.where or NO_CONTEXT)
+    ):
+        digest.groups.append(
+            DigestGroup(
+                when=when,
+                where=where,
+                tasks=[
+                    local_reminder(task=task, time_zone=time_zone)
+                    for task in group_tasks
+                ],
+            )
+        )
+    return digest
+
+
+def task_details(task: DigestTask) -> list[str]:
+    """Reminder time, projects and tags, as shown after the task's title"""
+    details: list[str] = []
+    if task.reminder_time is not None:
+        details.append(f"reminder {task.reminder_time:%Y-%m-%d %H:%M}")
+    details.extend(f"project: {project}" for project in task.projects)
+    details.extend(task.reference_tags)
+    return details
+
+
+def render_digest_text(digest: Digest) -> str:
+    lines: list[str] = [f"To do for {digest.day:%A, %B %d, %Y}", ""]
+    if digest.reminders:
+        lines.append("Reminders today")
+        for task in digest.reminders:
+            lines.append(
+                f"  {task.reminder_time:%H:%M}  {task.title}"
+                f" [{task.where or NO_CONTEXT}]"
+            )
+        lines.append("")
+    for when, when_groups in groupby(digest.groups, key=lambda group: group.when):
+        lines.append(when)
+        for group in when_groups:
+            lines.append(f"  {group.where}")
+            for task in group.tasks:
+                details: list[str] = task_details(task=task)
+                lines.append(
+                    f"    - {task.title}"
+                    + (f" ({', '.join(details)})" if details else "")
+                )
+        lines.append("")
+    if not digest.task_count:
+        lines.append("Nothing to do today.")
+    return "\n".join(lines)
+
+
+def render_digest_html(digest: Digest) -> str:
+    escape = html.escape
+    parts: list[str] = [f"<h1>To do for {digest.day:%A, %B %d, %Y}</h1>"]
+    if digest.reminders:
+        parts.append("<h2>Reminders today</h2><ul>")
+        parts.extend(
+            f"<li>{task.reminder_time:%H:%M} {escape(task.title)} "
+            f"<small>{escape(task.where or NO_CONTEXT)}</small></li>"
+            for task in digest.reminders
+        )
+        parts.append("</ul>")
+    for when, when_groups in groupby(digest.groups, key=lambda group: group.when):
+        parts.append(f"<h2>{escape(when)}</h2>")
+        for group in when_groups:
+            parts.append(f"<h3>{escape(group.where)}</h3><ul>")
+            for task in group.tasks:
+                details: list[str] = task_details(task=task)
+                parts.append(
+                    f"<li>{escape(task.title)}"
+                    + (
+                        f" <small>{escape(', '.join(details))}</small>"
+                        if details
+                        else ""
+                    )
+                    + "</li>"
+                )
+            parts.append("</ul>")
+    if not digest.task_count:
+        parts.append("<p>Nothing to do today.</p>")
+    return "\n".join(parts)
+
+
+def send_digest(digest: Digest, settings: SmtpSettings) -> None:
+    send_email(
+        settings=settings,
+        subject=f"To do for {digest.day:%a %b %d}: {digest.task_count} tasks",
+        text=render_digest_text(digest=digest),
+        html=render_digest_html(digest=digest),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database", default=DATABASE_PATHNAME)
+    parser.add_argument(
+        "--day",
+        type=dt.date.fromisoformat,
+        default=dt.datetime.now(DIGEST_TIME_ZONE).date(),
+        help="YYYY-MM-DD, today by default",
+    )
+    parser.add_argument(
+        "--print", action="store_true", help="Print the digest instead of sending it"
+    )
+    args = parser.parse_args()
+
+    engine: Engine = create_engine(f"sqlite+pysqlite:///{args.database}")
+    apply_sqlite_profile(engine=engine, profile=SqliteProfile.SERVING)
+    with Session(engine) as session:
+        digest: Digest = build_digest(session=session, day=args.day)
+        if args.print:
+            print(render_digest_text(digest=digest))
+        else:
+            send_digest(digest=digest, settings=SmtpSettings())
+            logger.info(msg=f"Sent the digest of {digest.task_count} tasks")
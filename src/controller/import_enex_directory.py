@@ -0,0 +1,470 @@
+""" Import a whole directory (or glob) of ENEX files into the database """
+
+import argparse
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+import glob
+from itertools import islice
+from multiprocessing import Manager
+import os
+from queue import Empty, Queue
+import time
+from typing import Iterator, Optional
+
+from flask import Flask
+from sqlalchemy import select
+
+from src.controller.load_import_data import RawNote, file_fingerprint, iter_enex_notes
+from src.controller.resource_store import (
+    PendingResourceData,
+    ResourceStorage,
+    ResourceWriter,
+)
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    DATABASE_PATHNAME,
+    IMPORT_CHUNK_SIZE,
+    IMPORT_COMMIT_EVERY,
+    IMPORT_DEFER_SEARCH_INDEX,
+    IMPORT_INCREMENTAL,
+    IMPORT_RESUME,
+    IMPORT_TAGS_TO_SKIP,
+    RESOURCE_STORAGE,
+    RESOURCE_STORE_FOLDER,
+    ImportCheckpoint,
+    ImportedFile,
+    ImportedNote,
+    ImportTagRegistries,
+    cfg,
+    create_import_app,
+    db,
+    finish_enex_import,
+    get_import_state,
+    load_tag_registries,
+    log_resource_writer_results,
+    resource_sink_for,
+    search_indexing_for,
+    write_enex_chunk_to_db,
+)
+from src.config.config_logging import logger
+
+IMPORT_FILE_WORKERS: int = cfg.IMPORT.FILE_WORKERS
+BYTES_PER_MB: int = 1_048_576
+BATCHES_PER_WORKER: int = 2  # Parsed batches waiting to be written, per worker
+RESULT_WAIT_SECONDS: float = 1.0  # Between checks for workers that died
+
+
+@dataclass
+class EnexBatch:
+    """A batch of notes of one ENEX file, parsed in a worker process to be written"""
+
+    path: str
+    fingerprint: str
+    notes: list[RawNote]
+    # With ResourceStorage.BLOB, the bytes of the resources of the notes
+    resource_data: Optional[PendingResourceData] = None
+
+
+@dataclass
+class ParsedEnexFile:
+    """
+    Sent by a worker process after the last batch of an ENEX file, with how its
+    parsing went
+    """
+
+    path: str
+    fingerprint: str = ""
+    size_bytes: int = 0
+    notes_parsed: int = 0
+    skipped: bool = False  # Already imported unchanged
+    parse_seconds: float = 0.0
+    resources_written: int = 0
+    resource_failures: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class EnexFileSummary:
+    path: str
+    size_bytes: int
+    notes_parsed: int = 0
+    notes_written: int = 0
+    skipped: bool = False
+    parse_seconds: float = 0.0
+    write_seconds: float = 0.0
+    resources_written: int = 0
+    resource_failures: int = 0
+    error: Optional[str] = None
+
+    @property
+    def notes_per_sec(self) -> float:
+        return rate(self.notes_parsed, self.parse_seconds)
+
+    @property
+    def mb_per_sec(self) -> float:
+        return rate(self.size_bytes / BYTES_PER_MB, self.parse_seconds)
+
+
+@dataclass
+class DirectoryImportSummary:
+    files: list[EnexFileSummary] = field(default_factory=list)
+    wall_seconds: float = 0.0
+
+    @property
+    def notes_written(self) -> int:
+        return sum(file.notes_written for file in self.files)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(file.size_bytes for file in self.files if not file.skipped)
+
+    @property
+    def notes_per_sec(self) -> float:
+        return rate(self.notes_written, self.wall_seconds)
+
+    @property
+    def mb_per_sec(self) -> float:
+        return rate(self.size_bytes / BYTES_PER_MB, self.wall_seconds)
+
+
+def rate(amount: float, seconds: float) -> float:
+    return amount / seconds if seconds > 0 else 0.0
+
+
+def find_enex_files(directory_or_glob: str) -> list[str]:
+    """All .enex files in a directory, or the files matching a glob pattern"""
+    if os.path.isdir(directory_or_glob):
+        directory_or_glob = os.path.join(directory_or_glob, "*.enex")
+    return sorted(path for path in glob.glob(directory_or_glob) if os.path.isfile(path))
+
+
+def parse_enex_file(
+    path: str,
+    incremental: bool,
+    resume: bool,
+    imported_files: frozenset[str],
+    checkpoints: dict[str, int],
+    imported_notes: frozenset[str],
+    resource_folder: str,
+    resource_storage: ResourceStorage,
+    batches: Queue,
+    batch_size: int,
+) -> None:
+    """
+    Parse and convert one ENEX file, putting its notes on batches batch_size
+    at a time as they are parsed, then the ParsedEnexFile. Runs in a worker
+    process; batches is bounded, so the worker waits while the main process
+    writes, and only a few batches of notes are held at any time.
+    Notes are written by the main process, so what has already been imported
+    is passed in. Resource bytes are written here to the content-addressed
+    store, which is safe to share between processes; with ResourceStorage.BLOB
+    they are sent with the batch of their notes, and written with them.
+    """
+    start_time: float = time.perf_counter()
+    parsed = ParsedEnexFile(path=path)
+    try:
+        parsed.fingerprint = file_fingerprint(path=path)
+        parsed.size_bytes = os.path.getsize(path)
+        if incremental and parsed.fingerprint in imported_files:
+            parsed.skipped = True
+            return
+
+        resource_sink: ResourceWriter | PendingResourceData = resource_sink_for(
+            resource_storage=resource_storage, resource_folder=resource_folder
+        )
+        with resource_sink:
+            # Files are already parsed in parallel, so each converts its own notes
+            notes: Iterator[RawNote] = iter_enex_notes(
+                filepath=path,
+                logger=logger,
+                workers=1,
+                chunk_size=IMPORT_CHUNK_SIZE,
+                tags_to_skip=IMPORT_TAGS_TO_SKIP,
+                resource_sink=resource_sink,
+                skip_fingerprints=imported_notes if incremental else None,
+                start_note_no=checkpoints.get(parsed.fingerprint, 0) if resume else 0,
+            )
+            while chunk := list(islice(notes, batch_size)):
+                batches.put(
+                    EnexBatch(
+                        path=path,
+                        fingerprint=parsed.fingerprint,
+                        notes=chunk,
+                        resource_data=(
+                            resource_sink.take(
+                                hashes=(
+                                    resource["hash"]
+                                    for _, resources in chunk
+                                    for resource in resources
+                                )
+                            )
+                            if isinstance(resource_sink, PendingResourceData)
+                            else None
+                        ),
+                    )
+                )
+                parsed.notes_parsed += len(chunk)
+
+        if isinstance(resource_sink, ResourceWriter):
+            log_resource_writer_results(resource_writer=resource_sink)
+            parsed.resources_written = resource_sink.written
+            parsed.resource_failures = len(resource_sink.failures)
+    except Exception as e:
+        parsed.error = str(e)
+    finally:
+        parsed.parse_seconds = time.perf_counter() - start_time
+        batches.put(parsed)
+
+
+@dataclass
+class EnexFileWrite:
+    """What the main process has written of an ENEX file so far"""
+
+    summary: EnexFileSummary
+    file_imported: bool = False
+    skipped: bool = False
+
+
+def start_enex_file_write(
+    batch: EnexBatch, incremental: bool, checkpoints: dict[str, int]
+) -> EnexFileWrite:
+    # The state is checked here as an identical file may have been written since
+    file_imported, _ = get_import_state(enex_fingerprint=batch.fingerprint)
+    if batch.fingerprint in checkpoints:
+        logger.info(
+            msg=f"Resuming import of {batch.path} from note "
+            f"{checkpoints[batch.fingerprint]}"
+        )
+    return EnexFileWrite(
+        summary=EnexFileSummary(
+            path=batch.path, size_bytes=os.path.getsize(batch.path)
+        ),
+        file_imported=file_imported,
+        skipped=incremental and file_imported,
+    )
+
+
+def write_enex_batch(
+    batch: EnexBatch,
+    file_write: EnexFileWrite,
+    incremental: bool,
+    imported_fingerprints: set[str],
+    tag_registries: ImportTagRegistries,
+) -> None:
+    """
+    Write a batch of notes of a file to the database, committed with the file's
+    checkpoint. Only ever called from the main process, so all writes go
+    through a single session.
+    """
+    notes: list[RawNote] = [
+        raw_note
+        for raw_note in batch.notes
+        if not incremental or raw_note[0]["fingerprint"] not in imported_fingerprints
+    ]
+    if file_write.skipped or not notes:
+        return
+    start_time: float = time.perf_counter()
+    file_write.summary.notes_written += write_enex_chunk_to_db(
+        chunk=notes,
+        enex_backup_pathname=batch.path,
+        enex_fingerprint=batch.fingerprint,
+        imported_fingerprints=imported_fingerprints,
+        tag_registries=tag_registries,
+        resource_data=batch.resource_data,
+    )
+    file_write.summary.write_seconds += time.perf_counter() - start_time
+
+
+def finish_enex_file_write(
+    parsed: ParsedEnexFile, file_write: Optional[EnexFileWrite]
+) -> EnexFileSummary:
+    """Record a file whose batches have all been written as imported"""
+    if file_write is None:
+        file_write = EnexFileWrite(
+            summary=EnexFileSummary(path=parsed.path, size_bytes=parsed.size_bytes)
+        )
+        if not parsed.skipped and parsed.error is None:
+            file_imported, _ = get_import_state(enex_fingerprint=parsed.fingerprint)
+            file_write.file_imported = file_imported
+    summary: EnexFileSummary = file_write.summary
+    summary.notes_parsed = parsed.notes_parsed
+    summary.parse_seconds = parsed.parse_seconds
+    summary.resources_written = parsed.resources_written
+    summary.resource_failures = parsed.resource_failures
+    summary.skipped = parsed.skipped or file_write.skipped
+    summary.error = parsed.error
+    if parsed.error is not None:
+        # Its checkpoint is kept, so a resumed import carries on after the notes written
+        logger.warning(msg=f"Cannot import {parsed.path} due to error: {parsed.error}")
+    elif not summary.skipped:
+        start_time: float = time.perf_counter()
+        finish_enex_import(
+            enex_backup_pathname=parsed.path,
+            enex_fingerprint=parsed.fingerprint,
+            file_imported=file_write.file_imported,
+        )
+        summary.write_seconds += time.perf_counter() - start_time
+    return summary
+
+
+def import_enex_directory(
+    *,
+    directory_or_glob: str,
+    database_pathname: str,
+    file_workers: int = IMPORT_FILE_WORKERS,
+    resource_folder: str = RESOURCE_STORE_FOLDER,
+    resource_storage: ResourceStorage = RESOURCE_STORAGE,
+    incremental: bool = IMPORT_INCREMENTAL,
+    resume: bool = IMPORT_RESUME,
+    commit_every: int = IMPORT_COMMIT_EVERY,
+    defer_search_index: bool = IMPORT_DEFER_SEARCH_INDEX,
+) -> DirectoryImportSummary:
+    """
+    Import every ENEX file in a directory or matching a glob pattern.
+    Up to file_workers files are parsed at the same time in worker processes,
+    which send their notes back in batches of commit_every notes as they go.
+    The main process writes and commits each batch as it arrives, so memory
+    stays bounded by the batches waiting, whatever the size of the files.
+    The app is created and the tables checked only once for the batch.
+    """
+    start_time: float = time.perf_counter()
+    summary = DirectoryImportSummary()
+    enex_paths: list[str] = find_enex_files(directory_or_glob=directory_or_glob)
+    if not enex_paths:
+        logger.warning(msg=f"No ENEX files found in {directory_or_glob}")
+        return summary
+
+    app: Flask = create_import_app(database_pathname=database_pathname)
+
+    with app.app_context():
+        imported_fingerprints: set[str] = set(
+            db.session.scalars(select(ImportedNote.fingerprint))
+        )
+        imported_files: frozenset[str] = frozenset(
+            db.session.scalars(select(ImportedFile.fingerprint))
+        )
+        checkpoints: dict[str, int] = {
+            checkpoint.fingerprint: checkpoint.last_note_no + 1
+            for checkpoint in db.session.scalars(select(ImportCheckpoint))
+        }
+        imported_notes: frozenset[str] = frozenset(imported_fingerprints)
+
+        with search_indexing_for(
+            defer_search_index=defer_search_index, incremental=incremental
+        ), load_tag_registries() as tag_registries, ProcessPoolExecutor(
+            max_workers=file_workers
+        ) as executor, Manager() as manager:
+            # The manager shuts down first, so on an error workers waiting to put
+            # a batch on the queue fail rather than keep the executor waiting
+            batches: Queue = manager.Queue(maxsize=BATCHES_PER_WORKER * file_workers)
+            # Files wait for a worker as paths, so only their batches take memory
+            parsing: dict[Future[None], str] = {
+                executor.submit(
+                    parse_enex_file,
+                    path,
+                    incremental,
+                    resume,
+                    imported_files,
+                    checkpoints,
+                    imported_notes,
+                    resource_folder,
+                    resource_storage,
+                    batches,
+                    commit_every,
+                ): path
+                for path in enex_paths
+            }
+            file_writes: dict[str, EnexFileWrite] = {}
+            files_left: set[str] = set(enex_paths)
+
+            while files_left:
+                try:
+                    message: EnexBatch | ParsedEnexFile = batches.get(
+                        timeout=RESULT_WAIT_SECONDS
+                    )
+                except Empty:
+                    # A worker that died never sends its ParsedEnexFile
+                    for future, path in parsing.items():
+                        if path in files_left and future.done() and future.exception():
+                            files_left.discard(path)
+                            summary.files.append(
+                                finish_enex_file_write(
+                                    parsed=ParsedEnexFile(
+                                        path=path, error=str(future.exception())
+                                    ),
+                                    file_write=file_writes.pop(path, None),
+                                )
+                            )
+                    continue
+
+                if isinstance(message, EnexBatch):
+                    if message.path not in file_writes:
+                        file_writes[message.path] = start_enex_file_write(
+                            batch=message,
+                            incremental=incremental,
+                            checkpoints=checkpoints if resume else {},
+                        )
+                    write_enex_batch(
+                        batch=message,
+                        file_write=file_writes[message.path],
+                        incremental=incremental,
+                        imported_fingerprints=imported_fingerprints,
+                        tag_registries=tag_registries,
+                    )
+                else:
+                    files_left.discard(message.path)
+                    summary.files.append(
+                        finish_enex_file_write(
+                            parsed=message,
+                            file_write=file_writes.pop(message.path, None),
+                        )
+                    )
+
+    summary.wall_seconds = time.perf_counter() - start_time
+    return summary
+
+
+def print_import_summary(summary: DirectoryImportSummary) -> None:
+    print(
+        f"{'File':<50} {'Notes':>7} {'MB':>8} {'Parse s':>8} {'Write s':>8} "
+        f"{'Notes/s':>9} {'MB/s':>7}"
+    )
+    for file in sorted(summary.files, key=lambda file: file.path):
+        name: str = os.path.basename(file.path)[:50]
+        if file.error is not None:
+            print(f"{name:<50} failed: {file.error}")
+            continue
+        if file.skipped:
+            print(f"{name:<50} skipped, already imported unchanged")
+            continue
+        print(
+            f"{name:<50} {file.notes_written:>7} "
+            f"{file.size_bytes / BYTES_PER_MB:>8.2f} {file.parse_seconds:>8.2f} "
+            f"{file.write_seconds:>8.2f} {file.notes_per_sec:>9.1f} "
+            f"{file.mb_per_sec:>7.2f}"
+        )
+    print(
+        f"{'Total':<50} {summary.notes_written:>7} "
+        f"{summary.size_bytes / BYTES_PER_MB:>8.2f} {summary.wall_seconds:>8.2f} "
+        f"{'':>8} {summary.notes_per_sec:>9.1f} {summary.mb_per_sec:>7.2f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "enex_files",
+        nargs="?",
+        default="data/import_data",
+        help="Directory of .enex files, or a glob pattern",
+    )
+    parser.add_argument("--database", default=DATABASE_PATHNAME)
+    parser.add_argument("--file-workers", type=int, default=IMPORT_FILE_WORKERS)
+    args = parser.parse_args()
+
+    print_import_summary(
+        summary=import_enex_directory(
+            directory_or_glob=args.enex_files,
+            database_pathname=args.database,
+            file_workers=args.file_workers,
+        )
+    )
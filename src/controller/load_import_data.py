@@ -1,224 +1,507 @@
-import base64
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import hashlib
 from html.parser import HTMLParser
-from io import BytesIO
-import os
-from typing import Any, Optional, Protocol
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Container,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Protocol,
+)
+import xml.etree.ElementTree as ET
 
-from PIL import Image, UnidentifiedImageError
+from src.controller.resource_store import DecodedResourceData, ResourceSink
+
+READ_CHUNK_SIZE: int = 1_048_576  # Bytes of ENEX file fed to the parser at a time
+
+DEFAULT_TAGS_TO_SKIP: frozenset[str] = frozenset(["en-note", "div", "br"])
+# Tags that break the line in the plain text rendition, so words don't run together
+LINE_BREAK_TAGS: frozenset[str] = frozenset(
+    ["en-note", "div", "br", "p", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6"]
+)
+
+RawNote = tuple[dict[str, str | list[str]], list[dict[str, str]]]
 
 
 class LoggerProto(Protocol):
     def debug(self, msg: str) -> None:
         ...
 
+    def info(self, msg: str) -> None:
+        ...
+
+    def warning(self, msg: str) -> None:
+        ...
+
+
+class ConvertedContent(NamedTuple):
+    body: str  # Stored body, ENML with the tags_to_skip removed
+    text: str  # Plain text, all tags removed
+    first_sentence: str  # First sentence of max length 50 characters, not including tags
+
+
+class EnmlConverter(HTMLParser):
+    """
+    Converts ENML note content in a single pass, building the stored body, a plain
+    text rendition and the first sentence (used to title untitled notes) at once.
+    Output is buffered in lists and joined once at the end.
+    """
 
-class MyHTMLParser(HTMLParser):
     def __init__(
-        self, *, convert_charrefs: bool = True, replace_tags_char: str = ""
+        self,
+        *,
+        convert_charrefs: bool = True,
+        tags_to_skip: Iterable[str] = DEFAULT_TAGS_TO_SKIP,
     ) -> None:
         super().__init__(convert_charrefs=convert_charrefs)
-        self.data: str = ""
-        self.tags_to_skip: list[str] = [
-            "en-note",
-            "div",
-            "br",
-        ]  # ["note-attributes", "resource"]
-        self.replace_tags_char: str = replace_tags_char
+        self.tags_to_skip: frozenset[str] = frozenset(tags_to_skip)
+        self.body_parts: list[str] = []
+        self.text_parts: list[str] = []
+        # Text with a "." for each tag, so tags end sentences
+        self.sentence_parts: list[str] = []
+
+    def convert(self, content: str) -> ConvertedContent:
+        self.feed(content)
+        self.close()
+
+        # The whitespace between tags makes sentences of its own, so the first
+        # is the first with more than whitespace
+        sentences: Iterator[str] = (
+            sentence.strip() for sentence in "".join(self.sentence_parts).split(".")
+        )
+        converted = ConvertedContent(
+            body="".join(self.body_parts).strip(),
+            text="".join(self.text_parts).strip(),
+            first_sentence=next((sentence for sentence in sentences if sentence), "")[
+                :50
+            ],
+        )
+        self.reset()
+        self.body_parts, self.text_parts, self.sentence_parts = [], [], []
+        return converted
 
     def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
-        # print(f"starttag:{tag=}")
-        if self.replace_tags_char:
-            # print(f"{self.replace_tags_char=}")
-            self.data += self.replace_tags_char
-            return
+        # Every tag ends a sentence, including those left out of the stored body
+        self.sentence_parts.append(".")
+        if tag in LINE_BREAK_TAGS:
+            self.text_parts.append("\n")
         if tag in self.tags_to_skip:
             return
         if attrs:
-            # print(f"{attrs=}")
-            self.data += f"<{tag} "
+            self.body_parts.append(f"<{tag} ")
             for attrib in attrs:
-                self.data += f' {attrib[0]}="{attrib[1]}"'
-                # print(f"{these_attrs=}")
-            self.data += " />"
+                self.body_parts.append(f' {attrib[0]}="{attrib[1]}"')
+            self.body_parts.append(" />")
         else:
-            self.data += f"<{tag}>"
+            self.body_parts.append(f"<{tag}>")
 
     def handle_endtag(self, tag: str) -> None:
-        # print(f"endtag:{tag=}")
-        if self.replace_tags_char:
-            self.data += self.replace_tags_char
-            return
+        self.sentence_parts.append(".")
+        if tag in LINE_BREAK_TAGS:
+            self.text_parts.append("\n")
         if tag in self.tags_to_skip:
             return
-        self.data += f"</{tag}>"
+        self.body_parts.append(f"</{tag}>")
 
     def handle_data(self, data: str) -> None:
-        # print(f"data:{data}")
-        # if data in ["\n      ", "      \n    ", "\n"]:
-        #     return
-        # self.data += f"Data: '{data}'"
-        self.data += f"{data}"
-
-    def handle_decl(self, decl: str) -> None:
-        if self.replace_tags_char:
-            self.data += self.replace_tags_char
-            return
-        # print(f"Found decl. Ignoring. Data: {decl=}")
+        self.body_parts.append(data)
+        self.text_parts.append(data)
+        self.sentence_parts.append(data)
+
+
+class EnexTreeBuilder(ET.TreeBuilder):
+    """
+    TreeBuilder that collects each <note> element as soon as it is closed so it
+    can be processed and released before the rest of the file is parsed.
+    The base64 text of each <resource><data> is decoded as it is parsed instead of
+    being kept; the element gets "hash" and "size" attributes of the decoded bytes,
+    which are handed to on_resource_data.
+    """
+
+    def __init__(
+        self, on_resource_data: Optional[Callable[[str, bytearray], Any]] = None
+    ) -> None:
+        super().__init__()
+        self.root: Optional[ET.Element] = None
+        self.closed_notes: list[ET.Element] = []
+        self.on_resource_data: Optional[
+            Callable[[str, bytearray], Any]
+        ] = on_resource_data
+        self.in_resource: bool = False
+        self.resource_data: Optional[DecodedResourceData] = None
+
+    def start(self, tag: str, attrs: dict[str, str]) -> ET.Element:
+        elem: ET.Element = super().start(tag, attrs)
+        if self.root is None:
+            self.root = elem
+        if tag == "resource":
+            self.in_resource = True
+        elif tag == "data" and self.in_resource:
+            self.resource_data = DecodedResourceData()
+        return elem
+
+    def data(self, data: str) -> None:
+        if self.resource_data is not None:
+            self.resource_data.write(text=data)
+        else:
+            super().data(data)
+
+    def end(self, tag: str) -> ET.Element:
+        elem: ET.Element = super().end(tag)
+        if tag == "note":
+            self.closed_notes.append(elem)
+        elif tag == "resource":
+            self.in_resource = False
+        elif tag == "data" and self.resource_data is not None:
+            hash, decoded = self.resource_data.close()
+            self.resource_data = None
+            elem.set("hash", hash)
+            elem.set("size", str(len(decoded)))
+            if self.on_resource_data is not None:
+                self.on_resource_data(hash, decoded)
+        return elem
+
+    def pop_closed_notes(self) -> list[ET.Element]:
+        """Return closed notes and detach them from the root so they can be freed"""
+        closed_notes: list[ET.Element] = self.closed_notes
+        self.closed_notes = []
+        if self.root is not None:
+            for note in closed_notes:
+                self.root.remove(note)
+        return closed_notes
+
+
+def iter_note_elements(
+    path: str,
+    read_chunk_size: int = READ_CHUNK_SIZE,
+    on_resource_data: Optional[Callable[[str, bytearray], Any]] = None,
+) -> Iterator[ET.Element]:
+    """
+    Incrementally parse an ENEX file, yielding one <note> element at a time.
+    Only the note currently being parsed is held in memory.
+    on_resource_data is called with the hash and decoded bytes of each resource.
+    """
+    builder = EnexTreeBuilder(on_resource_data=on_resource_data)
+    parser = ET.XMLParser(target=builder)
+
+    with open(path, "rb") as fp:
+        while chunk := fp.read(read_chunk_size):
+            parser.feed(chunk)
+            yield from builder.pop_closed_notes()
+    parser.close()
+    yield from builder.pop_closed_notes()
 
 
-def read_input_file(path: str):
-    import xml.etree.ElementTree as ET
+def extract_note_fields(note: ET.Element, logger: LoggerProto) -> RawNote:
+    """
+    Returns the note as a dictionary, with its content still as ENML, and a list
+    of its resources, mainly pictures, as dictionaries. The resource bytes
+    themselves are not included, only their hash and size.
+    """
+    this_note: dict[str, str | list[str]] = {}
+    resources: list[dict[str, str]] = []
 
-    # Parse the XML file
-    tree = ET.parse(path)
+    for field in note:
+        match field.tag:
+            case "content":
+                this_note[field.tag] = field.text.strip()
+            case "resource":
+                image_data: dict[str, str] = {}
+                for sub_field in field:
+                    # print(f"{sub_field.tag=}")
+                    match sub_field.tag:
+                        case "data":
+                            image_data["hash"] = sub_field.get("hash")
+                            image_data["size"] = sub_field.get("size")
+                        case "mime" | "width" | "height":
+                            image_data[sub_field.tag] = sub_field.text
+                        case "resource-attributes":
+                            for sub_sub_field in sub_field:
+                                match sub_sub_field.tag:
+                                    case "file-name":
+                                        image_data["file_name"] = sub_sub_field.text
+                                        # print(f"{image_data['file_name']=}")
+                                    case "source-url":
+                                        # Hash of the decoded data takes precedence
+                                        image_data.setdefault(
+                                            "hash", sub_sub_field.text.split("+")[2]
+                                        )
+                                    case _:
+                                        logger.debug(
+                                            msg=f"Ignoring image field: {sub_sub_field.tag=}"
+                                        )
+                            if image_data["file_name"] is None:
+                                image_data["file_name"] = ".".join(
+                                    [
+                                        image_data["hash"],
+                                        image_data["mime"].split("/")[1],
+                                    ]
+                                )
+                                logger.debug(
+                                    msg=f"image filename changed from None to {image_data['file_name']}"
+                                )
+                        case _:
+                            logger.debug(msg=f"Ignoring image field: {sub_field.tag=}")
+                if all(item in image_data for item in ["file_name", "hash", "size"]):
+                    resources.append(image_data)
+                else:
+                    logger.warning(
+                        msg=f"Didn't find all image data. Have: {image_data.keys()}, hash: {image_data.get('hash')}"
+                    )
+            case "note-attributes":
+                for sub_field in field:
+                    this_note[sub_field.tag] = sub_field.text
+            case _ if field.tag != "tag":
+                this_note[field.tag] = field.text
+            case _:  # if field.tag == "tag"
+                if "tags" not in this_note:
+                    this_note["tags"] = [field.text]
+                else:
+                    this_note["tags"] = this_note["tags"] + [field.text]
+
+    return this_note, resources
+
+
+def convert_note(
+    raw_note: RawNote, tags_to_skip: Iterable[str] = DEFAULT_TAGS_TO_SKIP
+) -> RawNote:
+    """
+    Convert the ENML content of a note extracted by extract_note_fields to the
+    stored body and its plain text, and derive a title for untitled notes.
+    Only uses picklable arguments so it can be run in a worker process.
+    """
+    this_note, resources = raw_note
 
-    # Get the root of the XML document
-    root = tree.getroot()
+    converted: ConvertedContent = EnmlConverter(tags_to_skip=tags_to_skip).convert(
+        content=this_note["content"]
+    )
+    this_note["content"] = converted.body
+    this_note["text"] = converted.text
 
-    # Iterate over the children of the root node
-    # for child in root:
-    #     print(child.tag, child.text)
+    if this_note["title"] == "Untitled Note":
+        if converted.first_sentence:
+            this_note["title"] = converted.first_sentence
+        elif this_note["content"][:9] == "<en-media":
+            this_note["title"] = "Saved Image"
 
-    return root
+    return this_note, resources
 
 
-def save_image(image_data: dict[str, str]) -> bool:
-    try:
-        image = Image.open(BytesIO(base64.b64decode(image_data["data"])))
-    except UnidentifiedImageError:
-        print(
-            f"Could not create image with filename: {image_data['file_name']} and hash: {image_data['hash']}"
+def plain_text(content: str, tags_to_skip: Iterable[str] = DEFAULT_TAGS_TO_SKIP) -> str:
+    """The plain text of a note's content, as indexed for search"""
+    return EnmlConverter(tags_to_skip=tags_to_skip).convert(content=content).text
+
+
+def convert_notes(
+    numbered_raw_notes: list[tuple[int, RawNote]],
+    tags_to_skip: Iterable[str] = DEFAULT_TAGS_TO_SKIP,
+) -> list[tuple[int, RawNote]]:
+    """Convert a chunk of notes. Unit of work for the process pool"""
+    return [
+        (note_no, convert_note(raw_note=raw_note, tags_to_skip=tags_to_skip))
+        for note_no, raw_note in numbered_raw_notes
+    ]
+
+
+def note_fingerprint(this_note: dict[str, str | list[str]]) -> str:
+    """
+    Stable hash of the fields that identify a version of a note as exported:
+    title, ENML content, tags (in any order) and created time
+    """
+    hasher = hashlib.sha256()
+    for value in (
+        this_note.get("title") or "",
+        this_note.get("content") or "",
+        "\x1f".join(sorted(this_note.get("tags", []))),
+        this_note.get("created") or "",
+    ):
+        hasher.update(value.encode())
+        hasher.update(b"\x1e")
+    return hasher.hexdigest()
+
+
+def file_fingerprint(path: str, read_chunk_size: int = READ_CHUNK_SIZE) -> str:
+    """Hash of the contents of an ENEX file"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fp:
+        while chunk := fp.read(read_chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def iter_raw_notes(
+    filepath: str,
+    logger: LoggerProto,
+    max_notes_to_read: Optional[int] = None,
+    resource_sink: Optional[ResourceSink] = None,
+) -> Iterator[tuple[int, RawNote]]:
+    """
+    Yields the note number and extracted, but not yet converted, fields of each
+    note, including its note_no and fingerprint.
+    Resource bytes are handed to resource_sink, if given, as they are parsed
+    """
+    on_resource_data: Optional[Callable[[str, bytearray], Any]] = (
+        resource_sink.put if resource_sink is not None else None
+    )
+    for note_no, note in enumerate(
+        iter_note_elements(path=filepath, on_resource_data=on_resource_data)
+    ):
+        # if note_no == 0:  # Skip export note
+        #     continue
+        # print(f"\nNote No.: {note_no}")
+        raw_note: RawNote = extract_note_fields(note=note, logger=logger)
+        note.clear()  # Release the parsed element, including resource data
+        raw_note[0]["note_no"] = note_no
+        raw_note[0]["fingerprint"] = note_fingerprint(this_note=raw_note[0])
+        yield note_no, raw_note
+
+        if max_notes_to_read and (note_no >= max_notes_to_read):
+            break
+
+
+def iter_converted_notes_in_pool(
+    numbered_raw_notes: Iterator[tuple[int, RawNote]],
+    workers: int,
+    chunk_size: int,
+    tags_to_skip: Iterable[str] = DEFAULT_TAGS_TO_SKIP,
+) -> Iterator[tuple[int, RawNote]]:
+    """
+    Convert notes in a pool of worker processes, one chunk of notes per task.
+    Results are yielded in the original note order. The number of chunks in
+    flight is bounded so memory stays flat while the workers catch up.
+    """
+    max_chunks_in_flight: int = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque[Future[list[tuple[int, RawNote]]]] = deque()
+        while chunk := list(islice(numbered_raw_notes, chunk_size)):
+            pending.append(executor.submit(convert_notes, chunk, tags_to_skip))
+            if len(pending) >= max_chunks_in_flight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def discard_resources(resource_sink: Optional[ResourceSink], raw_note: RawNote) -> bool:
+    """
+    Tell resource_sink the resources of a skipped note won't be imported.
+    Returns False so it can be used to filter out the note.
+    """
+    if resource_sink is not None:
+        for resource in raw_note[1]:
+            resource_sink.discard(resource["hash"])
+    return False
+
+
+def iter_enex_notes(
+    filepath: str,
+    logger: LoggerProto,
+    max_notes_to_read: Optional[int] = None,
+    workers: int = 1,
+    chunk_size: int = 64,
+    tags_to_skip: Iterable[str] = DEFAULT_TAGS_TO_SKIP,
+    resource_sink: Optional[ResourceSink] = None,
+    skip_fingerprints: Optional[Container[str]] = None,
+    start_note_no: int = 0,
+) -> Iterator[RawNote]:
+    """
+    Generator version of load_enex_backup. Yields one note at a time, each as a
+    tuple of the note dictionary and the list of its resources. Memory use does
+    not grow with the size of the ENEX file.
+    With workers > 1, content conversion is done in a pool of worker processes,
+    chunk_size notes at a time. Notes are yielded in the same order either way.
+    ENML tags in tags_to_skip are left out of the stored note body.
+    Resource bytes are decoded as they are parsed and handed to resource_sink, if
+    given, e.g. a ResourceStore or ResourceWriter; the resource dictionaries only
+    carry their hash.
+    Notes whose fingerprint is in skip_fingerprints, i.e. already imported and
+    unchanged, are skipped before their content is converted, as are notes
+    before start_note_no, e.g. when resuming an interrupted import. The
+    resources of skipped notes are discarded from resource_sink.
+    """
+    numbered_raw_notes: Iterator[tuple[int, RawNote]] = iter_raw_notes(
+        filepath=filepath,
+        logger=logger,
+        max_notes_to_read=max_notes_to_read,
+        resource_sink=resource_sink,
+    )
+    if start_note_no:
+        numbered_raw_notes = (
+            (note_no, raw_note)
+            for note_no, raw_note in numbered_raw_notes
+            if note_no >= start_note_no
+            or discard_resources(resource_sink=resource_sink, raw_note=raw_note)
+        )
+    if skip_fingerprints is not None:
+        numbered_raw_notes = (
+            (note_no, raw_note)
+            for note_no, raw_note in numbered_raw_notes
+            if raw_note[0]["fingerprint"] not in skip_fingerprints
+            or discard_resources(resource_sink=resource_sink, raw_note=raw_note)
+        )
+    numbered_notes: Iterator[tuple[int, RawNote]]
+    if workers > 1:
+        numbered_notes = iter_converted_notes_in_pool(
+            numbered_raw_notes=numbered_raw_notes,
+            workers=workers,
+            chunk_size=chunk_size,
+            tags_to_skip=tags_to_skip,
         )
-        return False
-    if image_data["file_name"] is None:
-        print(f"{image_data=}")
-    filename_base_old: str = ".".join(image_data["file_name"].split(".")[:-1])
-    # print(f"{filename_base_old=}")
-    filename_base_new: str = "_".join((filename_base_old, image_data["hash"]))
-    filename_ext: str = image_data["file_name"].split(".")[-1]
-    filename: str = ".".join((filename_base_new, filename_ext))
-    folder: str = "data\images"
-    filepath: str = os.path.join(folder, filename)
-    # print(f"{filepath=}")
-    try:
-        image.save(fp=filepath)
-    except OSError as e:
-        print(
-            f"Cannot save image with filename: {image_data['file_name']} and hash: {image_data['hash']} due to error: {e}"
+    else:
+        numbered_notes = (
+            (note_no, convert_note(raw_note=raw_note, tags_to_skip=tags_to_skip))
+            for note_no, raw_note in numbered_raw_notes
         )
-    return True
+
+    for note_no, (this_note, resources) in numbered_notes:
+        if (
+            this_note["title"] not in ["Untitled Note", ""]
+            or this_note["content"] != ""
+        ):
+            yield this_note, resources
+        else:
+            discard_resources(
+                resource_sink=resource_sink, raw_note=(this_note, resources)
+            )
+            logger.info(
+                msg=f"Skipping note {note_no} due to empty title and content. {this_note=}"
+            )
 
 
 def load_enex_backup(
     filepath: str,
     logger: LoggerProto,
     max_notes_to_read: Optional[int] = None,
+    workers: int = 1,
+    resource_sink: Optional[ResourceSink] = None,
 ) -> tuple[list[dict[str, str]], list[dict[str, str]]]:
     """
     Returns two lists of dictionaries
         - List of Notes, each as a dictionary
-        - List of Resources, mainly pictures, as dictionary with picture as base64 text
+        - List of Resources, mainly pictures, as dictionary with the hash of the
+          picture, which is handed to resource_sink if given
+    Use iter_enex_notes to process large files one note at a time instead
+    With workers > 1, content conversion is done in a pool of worker processes
     """
 
-    data = read_input_file(path=filepath)
     notes: list[dict[str, Any]] = []
     resources: list[dict[str, str]] = []
     # parser.feed('<html><head><title>Test</title></head>'
     #             '<body><h1>Parse me!</h1></body></html>')
 
-    for note_no, note in enumerate(data):
-        # if note_no == 0:  # Skip export note
-        #     continue
-        # print(f"\nNote No.: {note_no}")
-        this_note: dict[str, str | list[str]] = {}
-
-        for field in note:
-            match field.tag:
-                case "content":
-                    parser = MyHTMLParser()
-                    field_text_stripped: str = field.text.strip()
-                    # print(f"content:{field_text_stripped=}")
-                    parser.feed(field_text_stripped)
-                    temp = parser.data.strip()
-                    # print(f"content:{temp=}")
-                    this_note[field.tag] = temp
-                case "resource":
-                    image_data: dict[str, str] = {}
-                    for sub_field in field:
-                        # print(f"{sub_field.tag=}")
-                        match sub_field.tag:
-                            case "data" | "mime" | "width" | "height":
-                                image_data[sub_field.tag] = sub_field.text
-                            case "resource-attributes":
-                                for sub_sub_field in sub_field:
-                                    match sub_sub_field.tag:
-                                        case "file-name":
-                                            image_data["file_name"] = sub_sub_field.text
-                                            # print(f"{image_data['file_name']=}")
-                                        case "source-url":
-                                            image_data[
-                                                "hash"
-                                            ] = sub_sub_field.text.split("+")[2]
-                                        case _:
-                                            print(
-                                                f"Ignoring image field: {sub_sub_field.tag=}"
-                                            )
-                                if image_data["file_name"] is None:
-                                    image_data["file_name"] = ".".join(
-                                        [
-                                            image_data["hash"],
-                                            image_data["mime"].split("/")[1],
-                                        ]
-                                    )
-                                    print(
-                                        f"image filename changed from None to {image_data['file_name']}"
-                                    )
-                            case _:
-                                print(f"Ignoring image field: {sub_field.tag=}")
-                    if all(
-                        item in image_data for item in ["file_name", "hash", "data"]
-                    ):
-                        result: bool = save_image(image_data=image_data)
-                        resources.append(image_data)
-                    else:
-                        print(
-                            f"Didn't find all image data. Have: {image_data.keys()}, hash: {image_data['hash']}"
-                        )
-                case "note-attributes":
-                    for sub_field in field:
-                        this_note[sub_field.tag] = sub_field.text
-                case _ if field.tag != "tag":
-                    this_note[field.tag] = field.text
-                case _:  # if field.tag == "tag"
-                    if "tags" not in this_note:
-                        this_note["tags"] = [field.text]
-                    else:
-                        this_note["tags"] = this_note["tags"] + [field.text]
-        if this_note["title"] == "Untitled Note":
-            parser = MyHTMLParser(replace_tags_char=".")
-            parser.feed(this_note["content"])
-            temp = parser.data.strip().strip(".")
-            # print(f"{temp=}")
-            new_title = temp.split(".")[0][
-                :50
-            ]  # First sentence of max length 50 characters, not including tags
-            if new_title:
-                this_note["title"] = new_title
-            elif this_note["content"][:9] == "<en-media":
-                this_note["title"] = "Saved Image"
-
-        if (
-            this_note["title"] not in ["Untitled Note", ""]
-            or this_note["content"] != ""
-        ):
-            notes.append(this_note)
-        else:
-            print(
-                f"Skipping note {note_no} due to empty title and content. {this_note=}"
-            )
-
-        if max_notes_to_read and (note_no >= max_notes_to_read):
-            break
+    for this_note, note_resources in iter_enex_notes(
+        filepath=filepath,
+        logger=logger,
+        max_notes_to_read=max_notes_to_read,
+        workers=workers,
+        resource_sink=resource_sink,
+    ):
+        notes.append(this_note)
+        resources.extend(note_resources)
 
     return notes, resources
 
@@ -0,0 +1,58 @@
+""" Sending email through the SMTP server in the configuration
+
+For development, a local debugging server prints what it receives, e.g.
+    python -m aiosmtpd -n -l localhost:1025
+"""
+
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+import smtplib
+from typing import Optional
+
+from box import Box
+
+from src.config.config_main import load_config
+
+cfg: Box = load_config()
+
+
+@dataclass
+class SmtpSettings:
+    host: str = cfg.SMTP.HOST
+    port: int = cfg.SMTP.PORT
+    sender: str = cfg.SMTP.SENDER
+    recipients: list[str] = field(default_factory=lambda: list(cfg.SMTP.RECIPIENTS))
+    username: Optional[str] = cfg.SMTP.USERNAME
+    password: Optional[str] = cfg.SMTP.PASSWORD
+    starttls: bool = cfg.SMTP.STARTTLS
+    timeout: float = cfg.SMTP.TIMEOUT
+
+
+def build_email(
+    settings: SmtpSettings, subject: str, text: str, html: Optional[str] = None
+) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = settings.sender
+    message["To"] = ", ".join(settings.recipients)
+    message.set_content(text)
+    if html is not None:
+        message.add_alternative(html, subtype="html")
+    return message
+
+
+def send_email(
+    settings: SmtpSettings, subject: str, text: str, html: Optional[str] = None
+) -> None:
+    """Sends a plain text email, with an HTML alternative if given"""
+    message: EmailMessage = build_email(
+        settings=settings, subject=subject, text=text, html=html
+    )
+    with smtplib.SMTP(
+        host=settings.host, port=settings.port, timeout=settings.timeout
+    ) as smtp:
+        if settings.starttls:
+            smtp.starttls()
+        if settings.username:
+            smtp.login(user=settings.username, password=settings.password or "")
+        smtp.send_message(message)
@@ -0,0 +1,489 @@
+""" Versioned upgrades of databases created by earlier versions, in place
+
+The version of a database is kept in SQLite's PRAGMA user_version. Each
+migration runs once, in order, for databases below its version. New databases
+get the tables from create_all, so each migration must be safe to run on the
+current schema; the full-text search index and the change log, which
+create_all does not know about, come from the migrations for new and old
+databases alike.
+"""
+
+import base64
+import binascii
+import datetime as dt
+import hashlib
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import Connection, bindparam, text
+
+from src.controller.change_log import add_change_log, log_only_changed_updates
+from src.controller.content_hash import compute_content_hash
+from src.controller.load_import_data import plain_text
+from src.controller.search_index import (
+    SEARCH_TABLES,
+    create_search_tables,
+    drop_search_triggers,
+    rebuild_search_index,
+)
+from src.config.config_logging import logger
+
+FINGERPRINT_LEN: int = 64  # sha256 hex digest
+RESOURCES_PER_DECODE: int = 100  # Resources decoded at a time, as each may be large
+ROWS_PER_UPDATE: int = 1_000  # Rows given their plain text at a time
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def get_user_version(connection: Connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def column_names(connection: Connection, table: str) -> list[str]:
+    return [row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")]
+
+
+def parse_stored_datetime(value: Optional[str | dt.datetime]) -> Optional[dt.datetime]:
+    if value is None or isinstance(value, dt.datetime):
+        return value
+    return dt.datetime.fromisoformat(value)
+
+
+# Tags of each Task or Note, as (row id, tag name), used in its content hash
+CONTENT_HASH_TAGS_SQL: dict[str, str] = {
+    "tasks": """
+        SELECT a.task_id, t.name FROM task_where_tags_association a
+        JOIN where_tags_table t ON t.id = a.where_tag_id
+        UNION ALL
+        SELECT a.task_id, t.name FROM task_when_tags_association a
+        JOIN when_tags t ON t.id = a.when_tag_id
+        UNION ALL
+        SELECT a.task_id, t.name FROM task_reference_tags_association a
+        JOIN reference_tags t ON t.id = a.reference_tag_id
+    """,
+    "notes": """
+        SELECT a.note_id, t.name FROM note_reference_tags_association a
+        JOIN reference_tags t ON t.id = a.reference_tag_id
+    """,
+}
+
+
+def add_content_hash_columns(connection: Connection) -> None:
+    """
+    Tasks and Notes get a content_hash column, filled in for the rows already
+    stored, and its unique index. Rows whose content duplicates an earlier row
+    keep a NULL hash.
+    """
+    for table, tags_sql in CONTENT_HASH_TAGS_SQL.items():
+        if "content_hash" in column_names(connection=connection, table=table):
+            continue
+        connection.exec_driver_sql(
+            f"ALTER TABLE {table} ADD COLUMN content_hash VARCHAR({FINGERPRINT_LEN})"
+        )
+
+        tags_by_id: dict[int, list[str]] = {}
+        for row_id, tag_name in connection.exec_driver_sql(tags_sql):
+            tags_by_id.setdefault(row_id, []).append(tag_name)
+
+        hashes_seen: set[str] = set()
+        duplicates: int = 0
+        updates: list[dict[str, str | int]] = []
+        for row_id, title, body_text, created, updated in connection.exec_driver_sql(
+            f"SELECT id, title, body_text, created, updated FROM {table}"
+        ):
+            content_hash: str = compute_content_hash(
+                title=title or "",
+                body_text=body_text or "",
+                tags=tags_by_id.get(row_id, []),
+                created=parse_stored_datetime(created),
+                updated=parse_stored_datetime(updated),
+            )
+            if content_hash in hashes_seen:
+                duplicates += 1
+                continue
+            hashes_seen.add(content_hash)
+            updates.append({"id": row_id, "content_hash": content_hash})
+        if updates:
+            connection.execute(
+                text(f"UPDATE {table} SET content_hash = :content_hash WHERE id = :id"),
+                updates,
+            )
+        connection.exec_driver_sql(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{table}_content_hash "
+            f"ON {table} (content_hash)"
+        )
+        if duplicates:
+            logger.warning(
+                msg=f"{duplicates} {table} duplicate earlier rows "
+                "and were left without a content_hash"
+            )
+
+
+def clear_empty_resource_data(connection: Connection) -> None:
+    """
+    Resources imported before the data column was binary hold "" where their
+    bytes are in the ResourceStore. NULL now means that.
+    The column was NOT NULL text then, and SQLite cannot alter a column, so the
+    table is rebuilt with a nullable BLOB column.
+    """
+    data_not_null: bool = any(
+        row[1] == "data" and row[3]
+        for row in connection.exec_driver_sql("PRAGMA table_info(resources)")
+    )
+    if not data_not_null:
+        connection.exec_driver_sql("UPDATE resources SET data = NULL WHERE data = ''")
+        return
+
+    connection.exec_driver_sql(
+        """
+        CREATE TABLE resources_upgraded (
+            id INTEGER NOT NULL,
+            file_name VARCHAR(63) NOT NULL,
+            hash VARCHAR(63) NOT NULL,
+            data BLOB,
+            mime VARCHAR(63) NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            PRIMARY KEY (id)
+        )
+        """
+    )
+    connection.exec_driver_sql(
+        "INSERT INTO resources_upgraded "
+        "SELECT id, file_name, hash, NULLIF(data, ''), mime, width, height "
+        "FROM resources"
+    )
+    connection.exec_driver_sql("DROP TABLE resources")
+    connection.exec_driver_sql("ALTER TABLE resources_upgraded RENAME TO resources")
+
+
+def decode_base64_resource_data(connection: Connection) -> None:
+    """
+    Resources imported by the first versions hold their bytes as the base64
+    text of the ENEX file. They are decoded to bytes, which is what the data
+    column holds now. ENEX hashes are the MD5 of the bytes, so a resource whose
+    decoded bytes do not match its hash is still decoded but logged. Text that
+    is not base64 is left as it is, and logged.
+    """
+    legacy_ids: list[int] = list(
+        connection.exec_driver_sql(
+            "SELECT id FROM resources WHERE typeof(data) = 'text'"
+        ).scalars()
+    )
+    undecodable_ids: list[int] = []
+    mismatched_ids: list[int] = []
+    for start in range(0, len(legacy_ids), RESOURCES_PER_DECODE):
+        ids: list[int] = legacy_ids[start : start + RESOURCES_PER_DECODE]
+        updates: list[dict[str, int | bytes]] = []
+        for row_id, resource_hash, data in connection.execute(
+            text("SELECT id, hash, data FROM resources WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": ids},
+        ):
+            try:
+                # ENEX files wrap the base64 text in lines
+                data_bytes: bytes = base64.b64decode(
+                    "".join(data.split()), validate=True
+                )
+            except binascii.Error:
+                undecodable_ids.append(row_id)
+                continue
+            if hashlib.md5(data_bytes).hexdigest() != resource_hash:
+                mismatched_ids.append(row_id)
+            updates.append({"id": row_id, "data": data_bytes})
+        if updates:
+            connection.execute(
+                text("UPDATE resources SET data = :data WHERE id = :id"), updates
+            )
+    if legacy_ids:
+        logger.info(msg=f"Decoded {len(legacy_ids) - len(undecodable_ids)} resources")
+    if mismatched_ids:
+        logger.warning(
+            msg=f"Resources whose decoded bytes do not match their hash: "
+            f"{mismatched_ids}"
+        )
+    if undecodable_ids:
+        logger.warning(
+            msg=f"Resources left as text, as it is not base64: {undecodable_ids}"
+        )
+
+
+# Tag tables, with the association table columns that refer to them
+TAG_TABLES: dict[str, list[tuple[str, str]]] = {
+    "where_tags_table": [("task_where_tags_association", "where_tag_id")],
+    "when_tags": [("task_when_tags_association", "when_tag_id")],
+    "reference_tags": [
+        ("note_reference_tags_association", "reference_tag_id"),
+        ("task_reference_tags_association", "reference_tag_id"),
+    ],
+}
+ASSOCIATION_TABLES: dict[str, tuple[str, str]] = {
+    "task_where_tags_association": ("task_id", "where_tag_id"),
+    "task_when_tags_association": ("task_id", "when_tag_id"),
+    "note_reference_tags_association": ("note_id", "reference_tag_id"),
+    "task_reference_tags_association": ("task_id", "reference_tag_id"),
+    "project_task_association": ("project_id", "task_id"),
+}
+# Tasks and Notes, with the association table columns that refer to them
+NOTE_ASSOCIATIONS: dict[str, list[tuple[str, str]]] = {
+    "tasks": [
+        ("task_where_tags_association", "task_id"),
+        ("task_when_tags_association", "task_id"),
+        ("task_reference_tags_association", "task_id"),
+        ("project_task_association", "task_id"),
+    ],
+    "notes": [("note_reference_tags_association", "note_id")],
+}
+COLUMN_INDEXES: list[tuple[str, str]] = [
+    ("tasks", "created"),
+    ("tasks", "updated"),
+    ("tasks", "reminder_time"),
+    ("notes", "created"),
+    ("notes", "updated"),
+    ("notes", "reminder_time"),
+]
+
+
+def add_indexes(connection: Connection) -> None:
+    """
+    Unique indexes on tag names, resource hashes and association pairs, and
+    indexes on the timestamps tasks and notes are sorted and filtered by.
+    Duplicates the unique indexes would reject are merged first.
+    """
+    for tag_table, references in TAG_TABLES.items():
+        # Point associations at the first tag of each name, then drop the rest
+        for association_table, tag_id_column in references:
+            connection.exec_driver_sql(
+                f"""
+                UPDATE {association_table} SET {tag_id_column} = (
+                    SELECT min(first.id) FROM {tag_table} first
+                    JOIN {tag_table} this ON this.name = first.name
+                    WHERE this.id = {association_table}.{tag_id_column}
+                )
+                WHERE {tag_id_column} NOT IN (
+                    SELECT min(id) FROM {tag_table} GROUP BY name
+                )
+                """
+            )
+        connection.exec_driver_sql(
+            f"DELETE FROM {tag_table} "
+            f"WHERE id NOT IN (SELECT min(id) FROM {tag_table} GROUP BY name)"
+        )
+        connection.exec_driver_sql(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{tag_table}_name "
+            f"ON {tag_table} (name)"
+        )
+
+    connection.exec_driver_sql(
+        "DELETE FROM resources "
+        "WHERE id NOT IN (SELECT min(id) FROM resources GROUP BY hash)"
+    )
+    connection.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_resources_hash ON resources (hash)"
+    )
+
+    for association_table, (first_column, second_column) in ASSOCIATION_TABLES.items():
+        connection.exec_driver_sql(
+            f"DELETE FROM {association_table} WHERE rowid NOT IN ("
+            f"SELECT min(rowid) FROM {association_table} "
+            f"GROUP BY {first_column}, {second_column})"
+        )
+        connection.exec_driver_sql(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS "
+            f"ix_{association_table}_{first_column}_{second_column} "
+            f"ON {association_table} ({first_column}, {second_column})"
+        )
+        connection.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_{association_table}_{second_column} "
+            f"ON {association_table} ({second_column})"
+        )
+
+    for table, column in COLUMN_INDEXES:
+        connection.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"
+        )
+
+
+def add_plain_text_columns(connection: Connection) -> None:
+    """
+    Tasks and Notes get a plain_text column, the text the search index holds,
+    filled in from the body of the rows already stored
+    """
+    for table in SEARCH_TABLES:
+        if "plain_text" in column_names(connection=connection, table=table):
+            continue
+        connection.exec_driver_sql(
+            f"ALTER TABLE {table} ADD COLUMN plain_text VARCHAR NOT NULL DEFAULT ''"
+        )
+        rows = connection.exec_driver_sql(
+            f"SELECT id, body_text FROM {table} WHERE body_text != ''"
+        ).all()
+        for start in range(0, len(rows), ROWS_PER_UPDATE):
+            connection.execute(
+                text(f"UPDATE {table} SET plain_text = :plain_text WHERE id = :id"),
+                [
+                    {"id": row_id, "plain_text": plain_text(content=body_text)}
+                    for row_id, body_text in rows[start : start + ROWS_PER_UPDATE]
+                ],
+            )
+
+
+def add_search_index(connection: Connection) -> None:
+    add_plain_text_columns(connection=connection)
+    create_search_tables(connection=connection)
+    rebuild_search_index(connection=connection)
+
+
+def index_plain_text(connection: Connection) -> None:
+    """
+    The search index held the body with its ENML markup, so searches matched
+    tag and attribute names, e.g. "png" every note with a picture. It is
+    rebuilt over plain_text instead.
+    """
+    add_plain_text_columns(connection=connection)
+    if "plain_text" in column_names(connection=connection, table="tasks_fts"):
+        return
+    drop_search_triggers(connection=connection)
+    for table in SEARCH_TABLES:
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {table}_fts")
+    add_search_index(connection=connection)
+
+
+def delete_note_rows(connection: Connection, table: str, ids: list[int]) -> None:
+    """Deletes Task or Note rows with their associations"""
+    id_params: list[dict[str, int]] = [{"id": row_id} for row_id in ids]
+    for association_table, id_column in NOTE_ASSOCIATIONS[table]:
+        connection.execute(
+            text(f"DELETE FROM {association_table} WHERE {id_column} = :id"), id_params
+        )
+    connection.execute(text(f"DELETE FROM {table} WHERE id = :id"), id_params)
+
+
+def add_note_identity_indexes(connection: Connection) -> None:
+    """
+    Unique indexes on the title and created time of tasks and notes, which
+    identify a note across exports. Imports used to add a row for each version
+    of an edited note, so only the latest version of each is kept, and a note
+    both a task and a reference note is kept only as its latest.
+    """
+    for table in NOTE_ASSOCIATIONS:
+        stale_ids: list[int] = list(
+            connection.exec_driver_sql(
+                "SELECT id FROM ("
+                "SELECT id, row_number() OVER ("
+                "PARTITION BY title, created ORDER BY updated DESC, id DESC"
+                f") AS version FROM {table}"
+                ") WHERE version > 1"
+            ).scalars()
+        )
+        if stale_ids:
+            delete_note_rows(connection=connection, table=table, ids=stale_ids)
+            logger.info(
+                msg=f"Dropped {len(stale_ids)} earlier versions of edited {table}"
+            )
+        connection.exec_driver_sql(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{table}_title_created "
+            f"ON {table} (title, created)"
+        )
+
+    stale_ids_by_table: dict[str, list[int]] = {"tasks": [], "notes": []}
+    for task_id, note_id, task_is_latest in connection.exec_driver_sql(
+        "SELECT tasks.id, notes.id, tasks.updated >= notes.updated FROM tasks "
+        "JOIN notes ON notes.title = tasks.title AND notes.created = tasks.created"
+    ):
+        if task_is_latest:
+            stale_ids_by_table["notes"].append(note_id)
+        else:
+            stale_ids_by_table["tasks"].append(task_id)
+    for table, stale_ids in stale_ids_by_table.items():
+        if stale_ids:
+            delete_note_rows(connection=connection, table=table, ids=stale_ids)
+
+
+def add_task_title_index(connection: Connection) -> None:
+    connection.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_title ON tasks (title)"
+    )
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        version=1,
+        description="Add content_hash to tasks and notes",
+        upgrade=add_content_hash_columns,
+    ),
+    Migration(
+        version=2,
+        description="Store NULL resource data for resources in the ResourceStore",
+        upgrade=clear_empty_resource_data,
+    ),
+    Migration(
+        version=3,
+        description="Add unique and lookup indexes",
+        upgrade=add_indexes,
+    ),
+    Migration(
+        version=4,
+        description="Add the full-text search index over tasks and notes",
+        upgrade=add_search_index,
+    ),
+    Migration(
+        version=5,
+        description="Add the index for listing tasks by title",
+        upgrade=add_task_title_index,
+    ),
+    Migration(
+        version=6,
+        description="Add the change log of tasks, notes, projects, resources and tags",
+        upgrade=add_change_log,
+    ),
+    Migration(
+        version=7,
+        description="Identify tasks and notes by title and created time",
+        upgrade=add_note_identity_indexes,
+    ),
+    Migration(
+        version=8,
+        description="Decode resource data stored as base64 text to bytes",
+        upgrade=decode_base64_resource_data,
+    ),
+    Migration(
+        version=9,
+        description="Index the plain text of tasks and notes for search",
+        upgrade=index_plain_text,
+    ),
+    Migration(
+        version=10,
+        description="Log only the updates that change a row",
+        upgrade=log_only_changed_updates,
+    ),
+]
+LATEST_VERSION: int = MIGRATIONS[-1].version
+
+
+def upgrade_database(connection: Connection) -> int:
+    """
+    Run the migrations the database has not had yet, in order, each followed
+    by raising its user_version. Run in one transaction, so a failed upgrade
+    leaves the database as it was. Returns the version upgraded from.
+    """
+    from_version: int = get_user_version(connection=connection)
+    if from_version > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database version {from_version} is newer than this program's "
+            f"version {LATEST_VERSION}"
+        )
+    for migration in MIGRATIONS:
+        if migration.version <= from_version:
+            continue
+        logger.info(
+            msg=f"Upgrading database to version {migration.version}: "
+            f"{migration.description}"
+        )
+        migration.upgrade(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {migration.version}")
+    return from_version
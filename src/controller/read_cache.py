@@ -0,0 +1,329 @@
+""" Caching what the Flask app reads, until a commit changes what it was read from
+
+Each cached value is stored under its key and the generation of every model it
+was read from. A commit that changes a model moves on that model's generation,
+so the values read from it are never found again and age out of the backend,
+while values read from other models stay cached. A value read while a commit
+was changing its models is stored under the generations from before the
+commit, so it can't be served after it either.
+
+Commits in this process are seen through the session's events, including
+inserts, updates and deletes run as statements, such as an import's bulk
+inserts. Commits by other processes are noticed by checking SQLite's
+data_version at most every EXTERNAL_CHECK_SECONDS. When it has moved on, the
+change log tells which tables were changed since the last check, and only the
+generations of the models read from them move on.
+
+So a value may be served up to EXTERNAL_CHECK_SECONDS after another process
+committed a change to what it was read from, but never after that.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+from typing import Any, Callable, Hashable, Iterable, Optional, Protocol, TypeVar
+
+from sqlalchemy import Connection, Engine, event, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from src.controller.change_log import LATEST_SEQ_SQL
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    Base,
+    Note,
+    Project,
+    ReferenceTag,
+    Task,
+    WhenTag,
+    WhereTag,
+    cfg,
+)
+from src.config.config_logging import logger
+
+READ_CACHE_MAX_ENTRIES: int = cfg.READ_CACHE.MAX_ENTRIES
+READ_CACHE_TTL_SECONDS: float = cfg.READ_CACHE.TTL_SECONDS
+READ_CACHE_EXTERNAL_CHECK_SECONDS: float = cfg.READ_CACHE.EXTERNAL_CHECK_SECONDS
+CACHED_MODELS: tuple[type[Base], ...] = (
+    Task,
+    Note,
+    WhereTag,
+    WhenTag,
+    ReferenceTag,
+    Project,
+)
+
+ValueT = TypeVar("ValueT")
+
+
+def models_by_table() -> dict[str, set[type[Base]]]:
+    """
+    The cached models whose reads each table's rows change: a model's own
+    table, and the association tables of its relationships
+    """
+    table_models: dict[str, set[type[Base]]] = {}
+    for model in CACHED_MODELS:
+        table_models.setdefault(model.__tablename__, set()).add(model)
+        for relationship in inspect(model).relationships:
+            if relationship.secondary is not None:
+                table_models.setdefault(relationship.secondary.name, set()).add(model)
+    return table_models
+
+
+MODELS_BY_TABLE: dict[str, set[type[Base]]] = models_by_table()
+
+
+class CacheBackend(Protocol):
+    """Where cached values are kept. get returns MISSING for keys it doesn't have"""
+
+    def get(self, key: Hashable) -> Any:
+        ...
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float) -> None:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+
+MISSING: Any = object()
+
+
+class LruCacheBackend:
+    """
+    In memory, up to max_entries values. Setting a value beyond that evicts the
+    least recently used one, and values expire after their TTL.
+    """
+
+    def __init__(self, max_entries: int = READ_CACHE_MAX_ENTRIES) -> None:
+        self.max_entries: int = max_entries
+        self.lock = threading.Lock()
+        # Least recently used first, each value with its expiry time
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        with self.lock:
+            entry: Optional[tuple[float, Any]] = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0  # Commits that changed cached models
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups: int = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ReadCache:
+    """
+    Values read from the database, kept until a commit changes the models they
+    were read from or their TTL runs out. start() and stop() it, or use it as
+    a context manager, to follow commits. Cached values are shared between
+    threads and requests, so cache plain data rather than ORM objects.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        ttl_seconds: float = READ_CACHE_TTL_SECONDS,
+        engine: Optional[Engine] = None,
+        external_check_seconds: float = READ_CACHE_EXTERNAL_CHECK_SECONDS,
+    ) -> None:
+        self.backend: CacheBackend = LruCacheBackend() if backend is None else backend
+        self.ttl_seconds: float = ttl_seconds
+        self.engine: Optional[Engine] = engine
+        self.external_check_seconds: float = external_check_seconds
+        self.lock = threading.Lock()
+        self.generations: dict[type[Base], int] = dict.fromkeys(CACHED_MODELS, 0)
+        self.stats = CacheStats()
+        self.data_version_connection: Optional[Connection] = None
+        self.data_version: Optional[int] = None
+        self.change_seq: Optional[int] = None  # The last change log seq seen
+        self.next_external_check: float = 0.0
+
+    def start(self) -> "ReadCache":
+        event.listen(Session, "do_orm_execute", self._do_orm_execute)
+        event.listen(Session, "after_flush", self._after_flush)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+        return self
+
+    def stop(self) -> None:
+        event.remove(Session, "do_orm_execute", self._do_orm_execute)
+        event.remove(Session, "after_flush", self._after_flush)
+        event.remove(Session, "after_commit", self._after_commit)
+        event.remove(Session, "after_rollback", self._after_rollback)
+        with self.lock:
+            if self.data_version_connection is not None:
+                self.data_version_connection.close()
+                self.data_version_connection = None
+
+    def __enter__(self) -> "ReadCache":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        depends_on: Iterable[type[Base]],
+        load: Callable[[], ValueT],
+    ) -> ValueT:
+        """
+        The value cached under key, or else load()'s, cached. depends_on are
+        the models load reads, so a commit changing any of them invalidates it.
+        """
+        with self.lock:
+            self._check_external_changes()
+            generation_key: tuple[Any, ...] = (
+                key,
+                *((model.__name__, self.generations[model]) for model in depends_on),
+            )
+        value: Any = self.backend.get(generation_key)
+        with self.lock:
+            if value is MISSING:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+                return value
+        value = load()
+        self.backend.set(generation_key, value, self.ttl_seconds)
+        return value
+
+    def invalidate(self, models: Iterable[type[Base]]) -> None:
+        with self.lock:
+            self.stats.invalidations += 1
+            for model in models:
+                self.generations[model] += 1
+
+    def clear(self) -> None:
+        self.invalidate(models=CACHED_MODELS)
+        self.backend.clear()
+
+    def _check_external_changes(self) -> None:
+        """
+        Moves on the generations of the models whose tables another connection
+        has changed since the last check. SQLite's data_version changes on
+        every commit by another connection, so it is read on a connection of
+        the cache's own. That includes the other connections of this process,
+        so its own commits are also seen here, as well as through its events.
+        Called with the lock held.
+        """
+        if self.engine is None or not self.external_check_seconds:
+            return
+        now: float = time.monotonic()
+        if now < self.next_external_check:
+            return
+        self.next_external_check = now + self.external_check_seconds
+        if self.data_version_connection is None:
+            self.data_version_connection = self.engine.connect()
+        data_version: int = self.data_version_connection.exec_driver_sql(
+            "PRAGMA data_version"
+        ).scalar()
+        if data_version != self.data_version:
+            self._invalidate_changed_tables()
+        self.data_version = data_version
+
+    def _invalidate_changed_tables(self) -> None:
+        """
+        Moves on the generations of the models read from the tables in the
+        change log since the last seq seen, or of every model without one.
+        The first check only finds where the change log is up to.
+        Called with the lock held.
+        """
+        try:
+            if self.data_version is None:
+                self.change_seq = self.data_version_connection.exec_driver_sql(
+                    LATEST_SEQ_SQL
+                ).scalar()
+                return
+            changes: list[tuple[str, int]] = self.data_version_connection.execute(
+                text(
+                    "SELECT table_name, max(seq) FROM change_log "
+                    "WHERE seq > :seq GROUP BY table_name"
+                ),
+                {"seq": self.change_seq or 0},
+            ).all()
+        except OperationalError:
+            # A database not upgraded to a change log yet
+            changes = [(table_name, 0) for table_name in MODELS_BY_TABLE]
+        changed_models: set[type[Base]] = set()
+        for table_name, seq in changes:
+            changed_models.update(MODELS_BY_TABLE.get(table_name, ()))
+            self.change_seq = max(self.change_seq or 0, seq)
+        if not changed_models:
+            return
+        logger.debug(msg="The database was changed by another connection")
+        self.stats.invalidations += 1
+        for model in changed_models:
+            self.generations[model] += 1
+
+    @staticmethod
+    def _changed_models(session: Session) -> set[type[Base]]:
+        return session.info.setdefault("read_cache_changes", set())
+
+    def _do_orm_execute(self, orm_execute_state: ORMExecuteState) -> None:
+        if not (
+            orm_execute_state.is_insert
+            or orm_execute_state.is_update
+            or orm_execute_state.is_delete
+        ):
+            return
+        self._changed_models(session=orm_execute_state.session).update(
+            MODELS_BY_TABLE.get(orm_execute_state.statement.table.name, ())
+        )
+
+    def _after_flush(self, session: Session, flush_context: Any) -> None:
+        """
+        The models of the rows flushed, and the models on the other side of
+        the association rows they added or removed, e.g. a task's tags
+        """
+        changed_models: set[type[Base]] = self._changed_models(session=session)
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            model: type[Any] = type(instance)
+            if model not in self.generations:
+                continue
+            changed_models.add(model)
+            instance_state: Any = inspect(instance)
+            whole_row: bool = instance_state.pending or instance_state.deleted
+            for relationship in inspect(model).relationships:
+                if relationship.secondary is not None and (
+                    whole_row
+                    or instance_state.attrs[relationship.key].history.has_changes()
+                ):
+                    changed_models.update(MODELS_BY_TABLE[relationship.secondary.name])
+
+    def _after_commit(self, session: Session) -> None:
+        changed_models: set[type[Base]] = session.info.pop("read_cache_changes", set())
+        if changed_models:
+            self.invalidate(models=changed_models)
+
+    def _after_rollback(self, session: Session) -> None:
+        session.info.pop("read_cache_changes", None)
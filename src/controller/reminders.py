@@ -0,0 +1,444 @@
+""" Firing task and note reminders when they are due
+
+The scheduler holds the reminders due within the next HORIZON_HOURS in a heap
+ordered by due time, and its thread sleeps until the earliest one is due, so it
+uses no CPU while waiting. Each commit that changes a Task or Note updates the
+heap directly from the session's events. Changes committed by other processes,
+such as an import, are noticed by checking SQLite's data_version every
+EXTERNAL_CHECK_SECONDS, which reloads just the reminders within the horizon.
+
+The Flask app and the async app run a scheduler of their own, if
+REMINDERS.IN_APPS, so their writes reach it as they are committed. Otherwise
+run this module on its own, which sees them within EXTERNAL_CHECK_SECONDS.
+Only one scheduler should run per database, or reminders fire more than once.
+"""
+
+import argparse
+from dataclasses import dataclass
+import datetime as dt
+import heapq
+import threading
+import time
+from typing import Any, NamedTuple, Optional, Protocol
+
+from sqlalchemy import (
+    Connection,
+    Engine,
+    create_engine,
+    event,
+    literal,
+    select,
+    union_all,
+)
+from sqlalchemy.orm import Session
+
+from src.controller.mail import SmtpSettings, send_email
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    DATABASE_PATHNAME,
+    Note,
+    Task,
+    cfg,
+)
+from src.controller.sqlite_profile import SqliteProfile, apply_sqlite_profile
+from src.config.config_logging import logger
+
+REMINDERS_NOTIFIER: str = cfg.REMINDERS.NOTIFIER
+REMINDERS_HORIZON: dt.timedelta = dt.timedelta(hours=cfg.REMINDERS.HORIZON_HOURS)
+REMINDERS_MISSED_GRACE: dt.timedelta = dt.timedelta(
+    seconds=cfg.REMINDERS.MISSED_GRACE_SECONDS
+)
+REMINDERS_EXTERNAL_CHECK_SECONDS: float = cfg.REMINDERS.EXTERNAL_CHECK_SECONDS
+REMINDERS_RETRY_SECONDS: float = cfg.REMINDERS.RETRY_SECONDS
+REMINDERS_IN_APPS: bool = cfg.REMINDERS.IN_APPS
+REMINDER_KINDS: dict[type[Any], str] = {Task: "task", Note: "note"}
+
+
+class Reminder(NamedTuple):
+    due: dt.datetime  # UTC, naive like the stored reminder times
+    kind: str  # "task" or "note"
+    id: int
+    title: str
+
+
+class Notifier(Protocol):
+    def notify(self, reminder: Reminder) -> None:
+        ...
+
+
+class LogNotifier:
+    def notify(self, reminder: Reminder) -> None:
+        logger.info(
+            msg=f"Reminder: {reminder.kind} {reminder.id} {reminder.title!r} "
+            f"is due at {reminder.due:%Y-%m-%d %H:%M:%S}"
+        )
+
+
+@dataclass
+class SmtpNotifier:
+    settings: SmtpSettings
+
+    def notify(self, reminder: Reminder) -> None:
+        send_email(
+            settings=self.settings,
+            subject=f"Reminder: {reminder.title}",
+            text=(
+                f"The {reminder.kind} {reminder.title!r} is due at "
+                f"{reminder.due:%Y-%m-%d %H:%M} UTC."
+            ),
+        )
+
+
+def notifier_for(name: str = REMINDERS_NOTIFIER) -> Notifier:
+    if name == "smtp":
+        return SmtpNotifier(settings=SmtpSettings())
+    if name == "log":
+        return LogNotifier()
+    raise ValueError(f"Unknown reminder notifier: {name}")
+
+
+def utc_now() -> dt.datetime:
+    return dt.datetime.now(dt.UTC).replace(tzinfo=None)
+
+
+def as_utc_naive(value: Optional[dt.datetime]) -> Optional[dt.datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(dt.UTC).replace(tzinfo=None)
+
+
+class ReminderScheduler:
+    """
+    Calls notifier.notify for each reminder when it is due, in a background
+    thread. Reminders changed in this process are picked up as each commit
+    happens; start() and stop() it, or use it as a context manager. If reading
+    the database fails, e.g. while it is locked, the error is logged and the
+    reminders are loaded again after retry_seconds.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        notifier: Notifier,
+        horizon: dt.timedelta = REMINDERS_HORIZON,
+        missed_grace: dt.timedelta = REMINDERS_MISSED_GRACE,
+        external_check_seconds: float = REMINDERS_EXTERNAL_CHECK_SECONDS,
+        retry_seconds: float = REMINDERS_RETRY_SECONDS,
+    ) -> None:
+        self.engine: Engine = engine
+        self.notifier: Notifier = notifier
+        self.horizon: dt.timedelta = horizon
+        self.missed_grace: dt.timedelta = missed_grace
+        self.external_check_seconds: float = external_check_seconds
+        self.retry_seconds: float = retry_seconds
+        self.condition = threading.Condition()
+        # The heap may hold entries that have since changed; a heap entry is
+        # only current if it matches the reminder in reminders
+        self.heap: list[tuple[dt.datetime, str, int]] = []
+        self.reminders: dict[tuple[str, int], Reminder] = {}
+        self.fired_until: dt.datetime = utc_now()
+        self.window_end: dt.datetime = self.fired_until
+        self.reload_needed: bool = True
+        # Changes committed while reminders are being loaded, None otherwise
+        self.changes_during_load: Optional[
+            list[tuple[str, int, Optional[Reminder]]]
+        ] = None
+        self.stopping: bool = False
+        self.thread: Optional[threading.Thread] = None
+        self.data_version_connection: Optional[Connection] = None
+        self.data_version: Optional[int] = None
+        self.fired_count: int = 0
+
+    def start(self) -> "ReminderScheduler":
+        """Starts firing reminders, unless already started"""
+        with self.condition:
+            if self.thread is not None:
+                return self
+            self.fired_until = utc_now() - self.missed_grace
+            event.listen(Session, "after_flush", self._after_flush)
+            event.listen(Session, "after_commit", self._after_commit)
+            event.listen(Session, "after_rollback", self._after_rollback)
+            self.thread = threading.Thread(
+                target=self._run, name="reminder-scheduler", daemon=True
+            )
+            self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.thread is None or self.stopping:
+            return
+        event.remove(Session, "after_flush", self._after_flush)
+        event.remove(Session, "after_commit", self._after_commit)
+        event.remove(Session, "after_rollback", self._after_rollback)
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> "ReminderScheduler":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def __len__(self) -> int:
+        return len(self.reminders)
+
+    def next_due(self) -> Optional[dt.datetime]:
+        with self.condition:
+            self._drop_stale()
+            return self.heap[0][0] if self.heap else None
+
+    def _run(self) -> None:
+        next_external_check: float = time.monotonic()
+        try:
+            while not self.stopping:
+                try:
+                    next_external_check = self._run_once(
+                        next_external_check=next_external_check
+                    )
+                except Exception as e:
+                    logger.error(
+                        msg=f"Reminders are loaded again in {self.retry_seconds}s "
+                        f"after: {e!r}"
+                    )
+                    self._close_data_version_connection()
+                    with self.condition:
+                        self.reload_needed = True
+                        self.changes_during_load = None
+                        if not self.stopping:
+                            self.condition.wait(timeout=self.retry_seconds)
+        finally:
+            self._close_data_version_connection()
+
+    def _run_once(self, next_external_check: float) -> float:
+        """
+        Loads the reminders if needed, then fires those due or else waits for
+        the next. Returns when the external check is next due
+        """
+        if time.monotonic() >= next_external_check:
+            next_external_check = time.monotonic() + self.external_check_seconds
+            if self._changed_externally():
+                with self.condition:
+                    self.reload_needed = True
+
+        with self.condition:
+            now: dt.datetime = utc_now()
+            load_needed: bool = self.reload_needed or now >= self.window_end
+            if load_needed:
+                self.changes_during_load = []
+                load_from: dt.datetime = self.fired_until
+                window_end: dt.datetime = now + self.horizon
+        # The database is read without holding the lock, so commits in the
+        # meantime don't wait for it
+        if load_needed:
+            reminders: dict[tuple[str, int], Reminder] = self._load_reminders(
+                load_from=load_from, window_end=window_end
+            )
+            with self.condition:
+                self._replace_reminders(reminders=reminders, window_end=window_end)
+
+        with self.condition:
+            if self.stopping:
+                return next_external_check
+            now = utc_now()
+            due_reminders: list[Reminder] = self._pop_due(now=now)
+            if not due_reminders:
+                self.condition.wait(
+                    timeout=self._seconds_to_wait(
+                        now=now, next_external_check=next_external_check
+                    )
+                )
+                return next_external_check
+        for reminder in due_reminders:
+            try:
+                self.notifier.notify(reminder)
+                self.fired_count += 1
+            except Exception as e:
+                logger.warning(msg=f"Cannot send reminder {reminder} due to: {e}")
+        return next_external_check
+
+    def _close_data_version_connection(self) -> None:
+        # SQLite connections belong to the thread that opened them. Each has a
+        # data_version of its own, so the next is compared from scratch
+        if self.data_version_connection is not None:
+            self.data_version_connection.close()
+        self.data_version_connection = None
+        self.data_version = None
+
+    def _seconds_to_wait(self, now: dt.datetime, next_external_check: float) -> float:
+        """Until the next reminder is due, the window ends or it's time to check"""
+        wake_at: dt.datetime = self.window_end
+        self._drop_stale()
+        if self.heap:
+            wake_at = min(wake_at, self.heap[0][0])
+        seconds: float = (wake_at - now).total_seconds()
+        if self.external_check_seconds:
+            seconds = min(seconds, next_external_check - time.monotonic())
+        return max(seconds, 0.0)
+
+    def _pop_due(self, now: dt.datetime) -> list[Reminder]:
+        due_reminders: list[Reminder] = []
+        while self.heap and self.heap[0][0] <= now:
+            due, kind, row_id = heapq.heappop(self.heap)
+            reminder: Optional[Reminder] = self.reminders.get((kind, row_id))
+            if reminder is not None and reminder.due == due:
+                del self.reminders[(kind, row_id)]
+                due_reminders.append(reminder)
+        self.fired_until = max(self.fired_until, now)
+        return due_reminders
+
+    def _drop_stale(self) -> None:
+        while self.heap:
+            due, kind, row_id = self.heap[0]
+            reminder: Optional[Reminder] = self.reminders.get((kind, row_id))
+            if reminder is not None and reminder.due == due:
+                return
+            heapq.heappop(self.heap)
+
+    def _load_reminders(
+        self, load_from: dt.datetime, window_end: dt.datetime
+    ) -> dict[tuple[str, int], Reminder]:
+        """
+        All reminders due after load_from, up to window_end, from the
+        reminder_time indexes
+        """
+        query = union_all(
+            *(
+                select(model.reminder_time, literal(kind), model.id, model.title).where(
+                    model.reminder_time > load_from,
+                    model.reminder_time <= window_end,
+                )
+                for model, kind in REMINDER_KINDS.items()
+            )
+        )
+        with self.engine.connect() as connection:
+            return {
+                (kind, row_id): Reminder(due=due, kind=kind, id=row_id, title=title)
+                for due, kind, row_id, title in connection.execute(query)
+            }
+
+    def _replace_reminders(
+        self, reminders: dict[tuple[str, int], Reminder], window_end: dt.datetime
+    ) -> None:
+        """
+        Hold the loaded reminders instead, with the changes committed while
+        they were loaded applied again in case the load missed them
+        """
+        self.reminders = reminders
+        self.heap = [
+            (reminder.due, reminder.kind, reminder.id)
+            for reminder in self.reminders.values()
+        ]
+        heapq.heapify(self.heap)
+        self.window_end = window_end
+        self.reload_needed = False
+        self._apply_changes(changes=self.changes_during_load or [])
+        self.changes_during_load = None
+        logger.debug(
+            msg=f"{len(self.reminders)} reminders due by {self.window_end:%Y-%m-%d %H:%M}"
+        )
+
+    def _changed_externally(self) -> bool:
+        """
+        Whether another connection has committed since the last check.
+        SQLite's data_version changes on every commit by another connection,
+        so it is read on a connection of the scheduler's own.
+        """
+        if not self.external_check_seconds:
+            return False
+        if self.data_version_connection is None:
+            self.data_version_connection = self.engine.connect()
+        data_version: int = self.data_version_connection.exec_driver_sql(
+            "PRAGMA data_version"
+        ).scalar()
+        changed: bool = (
+            self.data_version is not None and data_version != self.data_version
+        )
+        self.data_version = data_version
+        return changed
+
+    def _after_flush(self, session: Session, flush_context: Any) -> None:
+        changes: list[tuple[str, int, Optional[Reminder]]] = session.info.setdefault(
+            "reminder_changes", []
+        )
+        for instance in (*session.new, *session.dirty):
+            kind: Optional[str] = REMINDER_KINDS.get(type(instance))
+            if kind is None:
+                continue
+            due: Optional[dt.datetime] = as_utc_naive(instance.reminder_time)
+            changes.append(
+                (
+                    kind,
+                    instance.id,
+                    None
+                    if due is None
+                    else Reminder(
+                        due=due, kind=kind, id=instance.id, title=instance.title
+                    ),
+                )
+            )
+        for instance in session.deleted:
+            kind = REMINDER_KINDS.get(type(instance))
+            if kind is not None:
+                changes.append((kind, instance.id, None))
+
+    def _after_commit(self, session: Session) -> None:
+        changes: list[tuple[str, int, Optional[Reminder]]] = session.info.pop(
+            "reminder_changes", []
+        )
+        if not changes:
+            return
+        with self.condition:
+            if self.changes_during_load is not None:
+                self.changes_during_load.extend(changes)
+            self._apply_changes(changes=changes)
+            self.condition.notify()
+
+    def _apply_changes(
+        self, changes: list[tuple[str, int, Optional[Reminder]]]
+    ) -> None:
+        for kind, row_id, reminder in changes:
+            if reminder is not None and reminder == self.reminders.get((kind, row_id)):
+                continue
+            if reminder is None or not (
+                self.fired_until < reminder.due <= self.window_end
+            ):
+                self.reminders.pop((kind, row_id), None)
+                continue
+            self.reminders[(kind, row_id)] = reminder
+            heapq.heappush(self.heap, (reminder.due, kind, row_id))
+
+    def _after_rollback(self, session: Session) -> None:
+        session.info.pop("reminder_changes", None)
+
+
+def create_reminder_engine(database_pathname: str) -> Engine:
+    """A sync engine for the scheduler, e.g. next to the async app's"""
+    engine: Engine = create_engine(f"sqlite+pysqlite:///{database_pathname}")
+    apply_sqlite_profile(engine=engine, profile=SqliteProfile.SERVING)
+    return engine
+
+
+def run_reminder_scheduler(database_pathname: str, notifier: Notifier) -> None:
+    """Fire reminders from the database until interrupted"""
+    engine: Engine = create_reminder_engine(database_pathname=database_pathname)
+    with ReminderScheduler(engine=engine, notifier=notifier):
+        logger.info(msg=f"Firing reminders from {database_pathname}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database", default=DATABASE_PATHNAME)
+    parser.add_argument(
+        "--notifier", choices=["log", "smtp"], default=REMINDERS_NOTIFIER
+    )
+    args = parser.parse_args()
+
+    run_reminder_scheduler(
+        database_pathname=args.database, notifier=notifier_for(name=args.notifier)
+    )
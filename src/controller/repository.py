@@ -0,0 +1,182 @@
+""" Reading models with their relationships loaded up front, by loading profile
+
+Each relationship is lazy loaded by default, so touching it on every row of a
+query, e.g. in __repr__ or when serializing a list, costs one more query per
+row. Reading through a profile loads the relationships it needs in a fixed
+number of queries, however many rows there are, and makes any relationship
+it leaves out raise instead of quietly loading row by row.
+"""
+
+from enum import Enum
+from typing import Iterable, Iterator, Optional, TypeVar
+
+from sqlalchemy import Select, inspect, select
+from sqlalchemy.orm import (
+    Session,
+    load_only,
+    raiseload,
+    selectinload,
+)
+from sqlalchemy.orm.interfaces import ORMOption
+
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    Base,
+    Note,
+    Project,
+    ReferenceTag,
+    Task,
+    WhenTag,
+    WhereTag,
+    cfg,
+    db,
+)
+
+EXPORT_BATCH_SIZE: int = cfg.REPOSITORY.EXPORT_BATCH_SIZE
+
+ModelT = TypeVar("ModelT", bound=Base)
+
+
+class LoadProfile(Enum):
+    LIST = "list"  # Many rows, with what is shown for each in a list
+    DETAIL = "detail"  # One row, with everything shown on its own page
+    EXPORT = "export"  # Every row, with every relationship, e.g. for logging each row
+
+
+# Relationships are loaded by selectinload, one query per relationship for all
+# the rows. Not joinedload, even for single rows: the tags are joined through
+# association tables, and SQLite builds the whole of a nested join before
+# looking up the one row in it.
+LOAD_OPTIONS: dict[type[Base], dict[LoadProfile, tuple[ORMOption, ...]]] = {
+    Task: {
+        LoadProfile.LIST: (
+            selectinload(Task.where_tag),
+            selectinload(Task.when_tag),
+            selectinload(Task.reference_tags),
+        ),
+        LoadProfile.DETAIL: (
+            selectinload(Task.where_tag),
+            selectinload(Task.when_tag),
+            selectinload(Task.reference_tags),
+            selectinload(Task.projects),
+        ),
+        LoadProfile.EXPORT: (
+            selectinload(Task.where_tag),
+            selectinload(Task.when_tag),
+            selectinload(Task.reference_tags),
+            selectinload(Task.projects),
+        ),
+    },
+    Note: {
+        LoadProfile.LIST: (selectinload(Note.reference_tags),),
+        LoadProfile.DETAIL: (selectinload(Note.reference_tags),),
+        LoadProfile.EXPORT: (selectinload(Note.reference_tags),),
+    },
+    Project: {
+        LoadProfile.LIST: (),
+        LoadProfile.DETAIL: (
+            selectinload(Project.tasks).options(
+                selectinload(Task.where_tag), selectinload(Task.when_tag)
+            ),
+        ),
+        LoadProfile.EXPORT: (selectinload(Project.tasks),),
+    },
+    WhereTag: {
+        LoadProfile.LIST: (),
+        LoadProfile.DETAIL: (selectinload(WhereTag.tasks),),
+        LoadProfile.EXPORT: (selectinload(WhereTag.tasks),),
+    },
+    WhenTag: {
+        LoadProfile.LIST: (),
+        LoadProfile.DETAIL: (selectinload(WhenTag.tasks),),
+        LoadProfile.EXPORT: (selectinload(WhenTag.tasks),),
+    },
+    ReferenceTag: {
+        LoadProfile.LIST: (),
+        LoadProfile.DETAIL: (
+            selectinload(ReferenceTag.tasks),
+            selectinload(ReferenceTag.notes),
+        ),
+        LoadProfile.EXPORT: (
+            selectinload(ReferenceTag.tasks),
+            selectinload(ReferenceTag.notes),
+        ),
+    },
+}
+
+
+def load_options(model: type[Base], profile: LoadProfile) -> tuple[ORMOption, ...]:
+    """The profile's loaders, with every other relationship of the model raising"""
+    return *LOAD_OPTIONS[model][profile], raiseload("*")
+
+
+def field_load_options(
+    model: type[Base], fields: Iterable[str]
+) -> tuple[ORMOption, ...]:
+    """
+    Loaders for just the named columns and relationships of the model, e.g.
+    for a response with only some fields. Related rows are loaded with only
+    their id, and name if they have one, and every other relationship raises.
+    """
+    mapper = inspect(model)
+    options: list[ORMOption] = [
+        load_only(*(getattr(model, name) for name in fields if name in mapper.columns))
+    ]
+    for name in fields:
+        if name not in mapper.relationships:
+            continue
+        related_mapper = mapper.relationships[name].mapper
+        options.append(
+            selectinload(getattr(model, name)).load_only(
+                *(
+                    getattr(related_mapper.class_, column)
+                    for column in ("id", "name")
+                    if column in related_mapper.columns
+                )
+            )
+        )
+    return *options, raiseload("*")
+
+
+def select_loaded(model: type[ModelT], profile: LoadProfile) -> Select:
+    """
+    select(model) loading the profile's relationships, to add filters,
+    ordering and limits to
+    """
+    return select(model).options(*load_options(model=model, profile=profile))
+
+
+def get_loaded(
+    model: type[ModelT],
+    id: int,
+    profile: LoadProfile = LoadProfile.DETAIL,
+    session: Optional[Session] = None,
+) -> Optional[ModelT]:
+    session = db.session if session is None else session
+    return session.get(model, id, options=load_options(model=model, profile=profile))
+
+
+def iter_loaded(
+    model: type[ModelT],
+    profile: LoadProfile = LoadProfile.EXPORT,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    session: Optional[Session] = None,
+) -> Iterator[ModelT]:
+    """
+    Every row of the model, by id. Rows are read batch_size at a time, with
+    the profile's relationships loaded in a few queries per batch, so memory
+    and queries grow with the batch rather than the table.
+    """
+    session = db.session if session is None else session
+    # Batches by id rather than with yield_per: SQLAlchemy can't load the
+    # relationships of yield_per rows by selectin once a do_orm_execute
+    # listener is registered, as the Flask app's read cache does
+    query: Select = (
+        select_loaded(model=model, profile=profile).order_by(model.id).limit(batch_size)
+    )
+    last_id: int = 0
+    while True:
+        rows: list[ModelT] = list(session.scalars(query.where(model.id > last_id)))
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1].id
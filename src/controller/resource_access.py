@@ -0,0 +1,105 @@
+""" Reading resources back: metadata without the bytes, and the bytes in chunks """
+
+import mimetypes
+import os
+from typing import Callable, Iterator, Optional
+
+from sqlalchemy import func, select
+
+from src.controller.resource_store import ResourceStore
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    RESOURCE_STORE_FOLDER,
+    Resource,
+    cfg,
+    db,
+)
+
+STREAM_CHUNK_SIZE: int = 65_536
+RESOURCE_CACHE_MAX_AGE_SECONDS: int = cfg.RESOURCES.CACHE_MAX_AGE_SECONDS
+
+
+def get_resource(resource_hash: str) -> Optional[Resource]:
+    """The resource's metadata. Its data column is deferred, so not loaded"""
+    return db.session.scalars(
+        select(Resource).where(Resource.hash == resource_hash)
+    ).first()
+
+
+def resource_mime(resource: Resource) -> str:
+    """The stored MIME type, or else one guessed from the file name"""
+    if resource.mime:
+        return resource.mime
+    guessed_mime, _ = mimetypes.guess_type(resource.file_name or "")
+    return guessed_mime or "application/octet-stream"
+
+
+def count_resources() -> int:
+    return db.session.scalar(select(func.count(Resource.id)))
+
+
+def resource_in_db(resource: Resource) -> bool:
+    """Whether the bytes are in the data column rather than the ResourceStore"""
+    return db.session.scalar(
+        select(Resource.data.is_not(None)).where(Resource.id == resource.id)
+    )
+
+
+def resource_size(
+    resource: Resource, resource_folder: str = RESOURCE_STORE_FOLDER
+) -> Optional[int]:
+    """Size of the bytes in either storage, without reading them"""
+    if resource_in_db(resource=resource):
+        return db.session.scalar(
+            select(func.length(Resource.data)).where(Resource.id == resource.id)
+        )
+    filepath: str = ResourceStore(folder=resource_folder).path_for(hash=resource.hash)
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return None
+
+
+def iter_resource_data(
+    resource: Resource,
+    resource_folder: str = RESOURCE_STORE_FOLDER,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    The resource's bytes from start up to, but not including, end, chunk_size
+    at a time. Bytes in the database are read through SQLite's incremental blob
+    I/O and bytes in the ResourceStore from the file, so neither is loaded into
+    memory all at once.
+    Raises FileNotFoundError if the bytes are in neither.
+    """
+    if resource_in_db(resource=resource):
+        sqlite_connection = db.session.connection().connection.driver_connection
+        with sqlite_connection.blobopen(
+            Resource.__tablename__, "data", resource.id, readonly=True
+        ) as blob:
+            blob.seek(start)
+            yield from iter_chunks(
+                read=blob.read, chunk_size=chunk_size, start=start, end=end
+            )
+        return
+
+    with ResourceStore(folder=resource_folder).open(hash=resource.hash) as fp:
+        fp.seek(start)
+        yield from iter_chunks(
+            read=fp.read, chunk_size=chunk_size, start=start, end=end
+        )
+
+
+def iter_chunks(
+    read: Callable[[int], bytes], chunk_size: int, start: int, end: Optional[int]
+) -> Iterator[bytes]:
+    position: int = start
+    while end is None or position < end:
+        chunk: bytes = read(
+            chunk_size if end is None else min(chunk_size, end - position)
+        )
+        if not chunk:
+            return
+        position += len(chunk)
+        yield chunk
@@ -0,0 +1,250 @@
+""" On-disk, content-addressed store for resource (mainly picture) bytes """
+
+import binascii
+from enum import Enum
+import hashlib
+import os
+from queue import Queue
+import tempfile
+import threading
+from typing import Any, BinaryIO, Iterable, NamedTuple, Optional, Protocol
+
+DECODE_BATCH_LEN: int = 65_536  # Characters of base64 text decoded at a time
+
+
+class ResourceStorage(Enum):
+    FILES = "files"  # Files in a ResourceStore, referenced by hash
+    BLOB = "blob"  # A deferred binary column of the resources table
+
+
+class Base64StreamDecoder:
+    """
+    Decodes base64 text that arrives in pieces, e.g. one line at a time from the
+    XML parser. Whitespace is ignored and any characters that don't make up a
+    full 4 character group are kept for the next piece.
+    """
+
+    def __init__(self) -> None:
+        self.pending: list[str] = []
+        self.pending_len: int = 0
+        self.remainder: str = ""
+
+    def decode(self, text: str) -> bytes:
+        self.pending.append(text)
+        self.pending_len += len(text)
+        if self.pending_len < DECODE_BATCH_LEN:
+            return b""
+        return self._decode_pending()
+
+    def flush(self) -> bytes:
+        decoded: bytes = self._decode_pending()
+        if self.remainder:
+            raise binascii.Error(
+                f"base64 data ended with incomplete group: {self.remainder!r}"
+            )
+        return decoded
+
+    def _decode_pending(self) -> bytes:
+        text: str = self.remainder + "".join("".join(self.pending).split())
+        usable_len: int = len(text) - len(text) % 4
+        self.remainder = text[usable_len:]
+        self.pending = []
+        self.pending_len = 0
+        return binascii.a2b_base64(text[:usable_len])
+
+
+class DecodedResourceData:
+    """Incrementally decodes the base64 <data> of a resource and hashes the bytes"""
+
+    def __init__(self) -> None:
+        self.decoder = Base64StreamDecoder()
+        self.md5 = hashlib.md5()
+        self.data = bytearray()
+
+    def write(self, text: str) -> None:
+        self._append(self.decoder.decode(text))
+
+    def close(self) -> tuple[str, bytearray]:
+        """Returns the md5 hash (as used by Evernote) and the decoded bytes"""
+        self._append(self.decoder.flush())
+        return self.md5.hexdigest(), self.data
+
+    def _append(self, decoded: bytes) -> None:
+        if decoded:
+            self.md5.update(decoded)
+            self.data += decoded
+
+
+class ResourceStore:
+    """
+    Resource bytes stored once per hash as folder/<hash[:2]>/<hash>.
+    Resources already in the store are not written again.
+    """
+
+    def __init__(self, folder: str) -> None:
+        self.folder: str = folder
+
+    def path_for(self, hash: str) -> str:
+        return os.path.join(self.folder, hash[:2], hash)
+
+    def exists(self, hash: str) -> bool:
+        return os.path.exists(self.path_for(hash=hash))
+
+    def put(self, hash: str, data: bytes | bytearray) -> bool:
+        """Returns True if the data was written, False if the hash was already stored"""
+        filepath: str = self.path_for(hash=hash)
+        if os.path.exists(filepath):
+            return False
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        fd, temp_filepath = tempfile.mkstemp(dir=os.path.dirname(filepath))
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(temp_filepath, filepath)  # Readers never see a partial file
+        except BaseException:
+            os.remove(temp_filepath)
+            raise
+        return True
+
+    def open(self, hash: str) -> BinaryIO:
+        return open(self.path_for(hash=hash), "rb")
+
+    def discard(self, hash: str) -> None:
+        """Resources are written as they are put, so there is nothing to drop"""
+
+
+class ResourceSink(Protocol):
+    def put(self, hash: str, data: bytes | bytearray) -> Any:
+        ...
+
+    def discard(self, hash: str) -> None:
+        """Called for resources of notes that are skipped rather than imported"""
+        ...
+
+
+class PendingResourceData:
+    """
+    Holds resource bytes in memory from when they are parsed until they are
+    written to the database with their note, for ResourceStorage.BLOB.
+    Each put is released by a pop or a discard, so only the resources of notes
+    parsed but not yet written or skipped are held. A hash put by several notes
+    is held until all of them are released.
+    """
+
+    def __init__(self) -> None:
+        self.data_by_hash: dict[str, bytes | bytearray] = {}
+        self.references: dict[str, int] = {}
+
+    def put(self, hash: str, data: bytes | bytearray) -> None:
+        self.data_by_hash[hash] = data
+        self.references[hash] = self.references.get(hash, 0) + 1
+
+    def pop(self, hash: str) -> Optional[bytes | bytearray]:
+        data: Optional[bytes | bytearray] = self.data_by_hash.get(hash)
+        self.discard(hash=hash)
+        return data
+
+    def discard(self, hash: str) -> None:
+        references: int = self.references.get(hash, 0) - 1
+        if references > 0:
+            self.references[hash] = references
+        else:
+            self.references.pop(hash, None)
+            self.data_by_hash.pop(hash, None)
+
+    def take(self, hashes: Iterable[str]) -> "PendingResourceData":
+        """
+        Move the bytes of the hashes, one reference each, to a new
+        PendingResourceData, e.g. to send with their notes to another process
+        """
+        taken = PendingResourceData()
+        for hash in hashes:
+            data: Optional[bytes | bytearray] = self.pop(hash=hash)
+            if data is not None:
+                taken.put(hash=hash, data=data)
+        return taken
+
+    def __len__(self) -> int:
+        return len(self.data_by_hash)
+
+    def __enter__(self) -> "PendingResourceData":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Nothing to wait for, unlike the ResourceWriter it can stand in for"""
+
+
+class ResourceWriteFailure(NamedTuple):
+    hash: str
+    error: str
+
+
+class ResourceWriter:
+    """
+    Writes resources to a ResourceStore from a pool of background threads so
+    parsing continues while files are written. put() blocks while queue_size
+    resources are waiting to be written, so memory use stays bounded.
+    Failed writes are collected in failures rather than stopping the import.
+    """
+
+    def __init__(
+        self, store: ResourceStore, threads: int = 4, queue_size: int = 16
+    ) -> None:
+        self.store: ResourceStore = store
+        self.queue: Queue[Optional[tuple[str, bytes | bytearray]]] = Queue(
+            maxsize=queue_size
+        )
+        self.hashes_seen: set[str] = set()
+        self.lock = threading.Lock()
+        self.written: int = 0
+        self.skipped: int = 0
+        self.failures: list[ResourceWriteFailure] = []
+        self.threads: list[threading.Thread] = [
+            threading.Thread(
+                target=self._write_from_queue, name=f"resource-writer-{i}", daemon=True
+            )
+            for i in range(threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, hash: str, data: bytes | bytearray) -> None:
+        """Queue a resource to be written. Repeats of a hash are skipped"""
+        if hash in self.hashes_seen:
+            with self.lock:
+                self.skipped += 1
+            return
+        self.hashes_seen.add(hash)
+        self.queue.put((hash, data))
+
+    def discard(self, hash: str) -> None:
+        """Resources are queued as they are put, so there is nothing to drop"""
+
+    def close(self) -> list[ResourceWriteFailure]:
+        """Wait for all queued resources to be written and return any failures"""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return self.failures
+
+    def __enter__(self) -> "ResourceWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _write_from_queue(self) -> None:
+        while (item := self.queue.get()) is not None:
+            hash, data = item
+            try:
+                written: bool = self.store.put(hash=hash, data=data)
+            except OSError as e:
+                with self.lock:
+                    self.failures.append(ResourceWriteFailure(hash=hash, error=str(e)))
+                continue
+            with self.lock:
+                if written:
+                    self.written += 1
+                else:
+                    self.skipped += 1
@@ -0,0 +1,438 @@
+""" The JSON API over tasks, notes, projects and tags, for the mobile and desktop clients
+
+Lists are paged by id, with a cursor to the next page, and fields= picks the
+fields to return. Each response has an ETag computed from the ids and updated
+times of its rows, so a client asking again with If-None-Match gets a 304
+after a single query on the ids and updated times, before any row is loaded
+or serialized. Single rows also have Last-Modified, for If-Modified-Since.
+A list's Last-Modified can't tell that one of its rows was deleted, so lists
+are only revalidated by ETag.
+
+/sync sends what changed after a seq of the change log, so a client that has
+every row keeps in step at the cost of what changed rather than of every row.
+"""
+
+import base64
+from dataclasses import dataclass
+import datetime as dt
+import hashlib
+import json
+from typing import Any, Callable, Optional
+
+from flask import Response, abort, request
+from sqlalchemy import Select, select, text
+from sqlalchemy.orm import Session
+
+from src.controller.change_log import CHANGE_LOG_KEYS
+from src.controller.repository import field_load_options
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    Base,
+    Note,
+    Project,
+    ReferenceTag,
+    Resource,
+    Task,
+    WhenTag,
+    WhereTag,
+    cfg,
+    db,
+)
+from src.controller.task_query import isoformat
+
+API_PAGE_SIZE: int = cfg.API.PAGE_SIZE
+API_MAX_PAGE_SIZE: int = cfg.API.MAX_PAGE_SIZE
+SYNC_BATCH_SIZE: int = cfg.API.SYNC_BATCH_SIZE
+SYNC_MAX_BATCH_SIZE: int = cfg.API.SYNC_MAX_BATCH_SIZE
+
+
+def tag_name(tag: Optional[Any]) -> Optional[str]:
+    return None if tag is None else tag.name
+
+
+def tag_names(tags: list[Any]) -> list[str]:
+    return sorted(tag.name for tag in tags)
+
+
+def related_ids(rows: list[Any]) -> list[int]:
+    return sorted(row.id for row in rows)
+
+
+@dataclass(frozen=True)
+class ApiResource:
+    model: type[Base]
+    fields: dict[str, Callable[[Any], Any]]  # Field name to its value for a row
+    list_fields: tuple[str, ...]  # Returned by lists when fields= isn't given
+
+    @property
+    def has_updated(self) -> bool:
+        return "updated" in self.fields
+
+
+API_RESOURCES: dict[str, ApiResource] = {
+    "tasks": ApiResource(
+        model=Task,
+        fields={
+            "id": lambda task: task.id,
+            "title": lambda task: task.title,
+            "body_text": lambda task: task.body_text,
+            "created": lambda task: isoformat(task.created),
+            "updated": lambda task: isoformat(task.updated),
+            "reminder_time": lambda task: isoformat(task.reminder_time),
+            "where_tag": lambda task: tag_name(task.where_tag),
+            "when_tag": lambda task: tag_name(task.when_tag),
+            "reference_tags": lambda task: tag_names(task.reference_tags),
+            "projects": lambda task: related_ids(task.projects),
+        },
+        list_fields=(
+            "id",
+            "title",
+            "created",
+            "updated",
+            "reminder_time",
+            "where_tag",
+            "when_tag",
+            "reference_tags",
+        ),
+    ),
+    "notes": ApiResource(
+        model=Note,
+        fields={
+            "id": lambda note: note.id,
+            "title": lambda note: note.title,
+            "body_text": lambda note: note.body_text,
+            "created": lambda note: isoformat(note.created),
+            "updated": lambda note: isoformat(note.updated),
+            "reminder_time": lambda note: isoformat(note.reminder_time),
+            "reference_tags": lambda note: tag_names(note.reference_tags),
+        },
+        list_fields=(
+            "id",
+            "title",
+            "created",
+            "updated",
+            "reminder_time",
+            "reference_tags",
+        ),
+    ),
+    "projects": ApiResource(
+        model=Project,
+        fields={
+            "id": lambda project: project.id,
+            "title": lambda project: project.title,
+            "created": lambda project: isoformat(project.created),
+            "updated": lambda project: isoformat(project.updated),
+            "tasks": lambda project: related_ids(project.tasks),
+        },
+        list_fields=("id", "title", "created", "updated"),
+    ),
+    **{
+        f"tags/{kind}": ApiResource(
+            model=model,
+            fields={"id": lambda tag: tag.id, "name": lambda tag: tag.name},
+            list_fields=("id", "name"),
+        )
+        for kind, model in (
+            ("where", WhereTag),
+            ("when", WhenTag),
+            ("reference", ReferenceTag),
+        )
+    },
+}
+# The rows /sync sends, by table. Association rows are sent as their pair of ids
+SYNC_RESOURCES: dict[str, ApiResource] = {
+    resource.model.__tablename__: resource
+    for resource in (
+        *API_RESOURCES.values(),
+        ApiResource(
+            model=Resource,
+            fields={
+                "id": lambda resource: resource.id,
+                "file_name": lambda resource: resource.file_name,
+                "hash": lambda resource: resource.hash,
+                "mime": lambda resource: resource.mime,
+                "width": lambda resource: resource.width,
+                "height": lambda resource: resource.height,
+            },
+            list_fields=("id", "file_name", "hash", "mime", "width", "height"),
+        ),
+    )
+}
+
+
+def requested_fields(resource: ApiResource, default: tuple[str, ...]) -> list[str]:
+    """
+    The fields named in fields=, comma separated, or else default, always
+    with id. Aborts with 400 on a field the resource doesn't have.
+    """
+    fields_arg: Optional[str] = request.args.get("fields")
+    if not fields_arg:
+        return list(default)
+    fields: list[str] = ["id"]
+    for name in fields_arg.split(","):
+        name = name.strip()
+        if name not in resource.fields:
+            abort(
+                400,
+                description=f"Unknown field: {name}. "
+                f"The fields are: {', '.join(resource.fields)}",
+            )
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+
+def encode_page_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_page_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        abort(400, description=f"Malformed cursor: {cursor}")
+
+
+def compute_etag(*parts: Any) -> str:
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def as_http_date(value: Optional[dt.datetime]) -> Optional[dt.datetime]:
+    """Stored times are naive UTC; HTTP dates are whole seconds"""
+    if value is None:
+        return None
+    return value.replace(tzinfo=dt.UTC, microsecond=0)
+
+
+def not_modified(etag: str, last_modified: Optional[dt.datetime]) -> bool:
+    """
+    Whether the client's copy is current, by If-None-Match or else, if
+    last_modified is given, If-Modified-Since
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return (
+        last_modified is not None
+        and request.if_modified_since is not None
+        and last_modified <= request.if_modified_since
+    )
+
+
+def conditional_response(
+    etag: str,
+    last_modified: Optional[dt.datetime],
+    body: Callable[[], Any],
+    revalidate_by_date: bool = True,
+) -> Response:
+    """
+    304 if the client's copy is current, or else the JSON of body(), which is
+    only called, loading and serializing the rows, when it is needed
+    """
+    if not_modified(
+        etag=etag, last_modified=last_modified if revalidate_by_date else None
+    ):
+        response = Response(status=304)
+    else:
+        response = Response(
+            json.dumps(body(), separators=(",", ":")), mimetype="application/json"
+        )
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Clients may keep responses, but must revalidate them before each use
+    response.cache_control.no_cache = True
+    return response
+
+
+def version_columns(resource: ApiResource) -> list[Any]:
+    """What a row's ETag is computed from: its id, and updated or a tag's name"""
+    model: Any = resource.model
+    return [model.id, model.updated] if resource.has_updated else [model.id, model.name]
+
+
+def serialize(resource: ApiResource, rows: list[Any], fields: list[str]) -> list[dict]:
+    return [{name: resource.fields[name](row) for name in fields} for row in rows]
+
+
+def load_rows(
+    resource: ApiResource, ids: list[int], fields: list[str], session: Session
+) -> list[Any]:
+    model: Any = resource.model
+    query: Select = (
+        select(model)
+        .where(model.id.in_(ids))
+        .order_by(model.id)
+        .options(*field_load_options(model=model, fields=fields))
+    )
+    return list(session.scalars(query))
+
+
+def list_response(resource_name: str) -> Response:
+    """
+    One page of the resource's rows by id, e.g.
+    /api/tasks?fields=title,when_tag&limit=200&cursor=...
+    """
+    resource: Optional[ApiResource] = API_RESOURCES.get(resource_name)
+    if resource is None:
+        abort(404)
+    model: Any = resource.model
+    fields: list[str] = requested_fields(
+        resource=resource, default=resource.list_fields
+    )
+    limit: int = min(
+        max(request.args.get("limit", API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE
+    )
+    cursor: Optional[str] = request.args.get("cursor")
+
+    query: Select = select(*version_columns(resource=resource))
+    if cursor:
+        query = query.where(model.id > decode_page_cursor(cursor=cursor))
+    versions: list[Any] = db.session.execute(
+        query.order_by(model.id).limit(limit + 1)
+    ).all()
+    next_cursor: Optional[str] = None
+    if len(versions) > limit:
+        versions = versions[:limit]
+        next_cursor = encode_page_cursor(last_id=versions[-1][0])
+    ids: list[int] = [version[0] for version in versions]
+
+    return conditional_response(
+        etag=compute_etag(resource_name, fields, versions, next_cursor),
+        last_modified=(
+            as_http_date(max((version[1] for version in versions), default=None))
+            if resource.has_updated
+            else None
+        ),
+        revalidate_by_date=False,
+        body=lambda: {
+            resource_name.split("/")[0]: serialize(
+                resource=resource,
+                rows=load_rows(
+                    resource=resource, ids=ids, fields=fields, session=db.session
+                ),
+                fields=fields,
+            ),
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+def item_response(resource_name: str, row_id: int) -> Response:
+    """One row, with all its fields unless fields= is given"""
+    resource: Optional[ApiResource] = API_RESOURCES.get(resource_name)
+    if resource is None:
+        abort(404)
+    model: Any = resource.model
+    fields: list[str] = requested_fields(
+        resource=resource, default=tuple(resource.fields)
+    )
+    version: Optional[Any] = db.session.execute(
+        select(*version_columns(resource=resource)).where(model.id == row_id)
+    ).first()
+    if version is None:
+        abort(404)
+
+    return conditional_response(
+        etag=compute_etag(resource_name, fields, tuple(version)),
+        last_modified=as_http_date(version[1]) if resource.has_updated else None,
+        body=lambda: load_item(resource=resource, row_id=row_id, fields=fields),
+    )
+
+
+def load_item(resource: ApiResource, row_id: int, fields: list[str]) -> dict:
+    rows: list[Any] = load_rows(
+        resource=resource, ids=[row_id], fields=fields, session=db.session
+    )
+    if not rows:  # Deleted since its version was read
+        abort(404)
+    return serialize(resource=resource, rows=rows, fields=fields)[0]
+
+
+def sync_limit(limit: Optional[int]) -> int:
+    if limit is None:
+        return SYNC_BATCH_SIZE
+    return min(max(limit, 1), SYNC_MAX_BATCH_SIZE)
+
+
+def sync_changes(session: Session, since: int, limit: int) -> dict[str, Any]:
+    """
+    The changes after seq since, oldest first, at most limit of them.
+    Each change is its seq, table and whether the row was deleted, with the
+    row as it is now, or only its key for a delete. A row changed more than
+    once in the batch is sent once, at its latest change. next_since is to be
+    passed back as since for the changes after these; has_more says if there
+    are some already. Starting from since=0 gets every row.
+    """
+    since = max(since, 0)
+    changes: list[Any] = session.execute(
+        text(
+            "SELECT seq, table_name, row_id, related_id, operation FROM change_log "
+            "WHERE seq > :since ORDER BY seq LIMIT :limit"
+        ),
+        {"since": since, "limit": limit + 1},
+    ).all()
+    has_more: bool = len(changes) > limit
+    changes = changes[:limit]
+    next_since: int = changes[-1].seq if changes else since
+
+    # The latest change of each row, in the order of those changes
+    latest: dict[tuple[str, int, Optional[int]], Any] = {
+        (change.table_name, change.row_id, change.related_id): change
+        for change in changes
+    }
+    latest_changes: list[Any] = sorted(latest.values(), key=lambda change: change.seq)
+
+    rows: dict[tuple[str, int], dict] = {}
+    for table, resource in SYNC_RESOURCES.items():
+        ids: list[int] = [
+            change.row_id
+            for change in latest_changes
+            if change.table_name == table and change.operation != "delete"
+        ]
+        if not ids:
+            continue
+        fields: list[str] = list(resource.fields)
+        for row in serialize(
+            resource=resource,
+            rows=load_rows(resource=resource, ids=ids, fields=fields, session=session),
+            fields=fields,
+        ):
+            rows[(table, row["id"])] = row
+
+    sent_changes: list[dict] = []
+    for change in latest_changes:
+        keys: tuple[str, ...] = CHANGE_LOG_KEYS[change.table_name]
+        key: dict[str, int] = dict(zip(keys, (change.row_id, change.related_id)))
+        row: Optional[dict] = (
+            key if len(keys) > 1 else rows.get((change.table_name, change.row_id))
+        )
+        # A row missing here was deleted since the log was read
+        deleted: bool = change.operation == "delete" or row is None
+        sent_changes.append(
+            {
+                "seq": change.seq,
+                "table": change.table_name,
+                "deleted": deleted,
+                "row": key if deleted else row,
+            }
+        )
+    return {"changes": sent_changes, "next_since": next_since, "has_more": has_more}
+
+
+def sync_response() -> Response:
+    """
+    The changes of sync_changes, e.g. /sync?since=1234&limit=500, where limit
+    is up to SYNC_MAX_BATCH_SIZE
+    """
+    response: Response = Response(
+        json.dumps(
+            sync_changes(
+                session=db.session,
+                since=request.args.get("since", 0, type=int),
+                limit=sync_limit(limit=request.args.get("limit", type=int)),
+            ),
+            separators=(",", ":"),
+        ),
+        mimetype="application/json",
+    )
+    response.cache_control.no_store = True
+    return response
@@ -1,33 +1,85 @@
+from contextlib import nullcontext
 import datetime as dt
+import logging
 from enum import Enum, auto
-from typing import Optional
+from itertools import islice
+import os
+from typing import Any, ContextManager, Iterable, Iterator, NamedTuple, Optional
 
 from box import Box
 from flask import Flask  # , render_template, request, url_for, redirect
 from flask_sqlalchemy import SQLAlchemy
 
-from sqlalchemy import select
+from sqlalchemy import (
+    Table,
+    case,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    literal,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
+    Session,
     mapped_column,
 )
 
-# from sqlalchemy.sql import func
 
-from src.controller.load_import_data import load_enex_backup
-from src.config.config_main import load_config
+from src.controller.change_log import compact_change_log
+from src.controller.content_hash import compute_content_hash
+from src.controller.load_import_data import (
+    RawNote,
+    file_fingerprint,
+    iter_enex_notes,
+    plain_text,
+)
+from src.controller.migrations import upgrade_database
+from src.controller.resource_store import (
+    PendingResourceData,
+    ResourceStorage,
+    ResourceStore,
+    ResourceWriter,
+)
+from src.controller.search_index import deferred_search_indexing, ensure_search_index
+from src.controller.sqlite_profile import SqliteProfile, apply_sqlite_profile
+from src.controller.tag_registry import TagRegistry
+from src.config.config_main import PROJECT_FOLDER, load_config
 from src.config.config_logging import logger
 
 cfg: Box = load_config()
 
+# Absolute, so every program opens the same database wherever it is run from
+DATABASE_PATHNAME: str = os.path.join(PROJECT_FOLDER, cfg.DATABASE.PATHNAME)
+
 MAX_TITLE_LEN: int = cfg.DATABASE.MAX_FIELD_LIMITS.TITLE
 MAX_TAG_NAME_LEN: int = cfg.DATABASE.MAX_FIELD_LIMITS.TAG_NAME
 MAX_BODY_TEXT_LEN: int = cfg.DATABASE.MAX_FIELD_LIMITS.BODY_TEXT
 MAX_IMAGE_FILENAME_LEN: int = cfg.DATABASE.MAX_FIELD_LIMITS.IMAGE_FILENAME
 MAX_IMAGE_DATA_LEN: int = cfg.DATABASE.MAX_FIELD_LIMITS.IMAGE_DATA
+MAX_FILE_PATH_LEN: int = cfg.DATABASE.MAX_FIELD_LIMITS.FILE_PATH
+FINGERPRINT_LEN: int = 64  # sha256 hex digest
 WHEN_TAGS: list[str] = cfg.DATABASE.TAGS.WHEN
 WHERE_TAGS: list[str] = cfg.DATABASE.TAGS.WHERE
+RESOURCE_STORAGE: ResourceStorage = ResourceStorage(cfg.RESOURCES.STORAGE)
+RESOURCE_STORE_FOLDER: str = os.path.join(PROJECT_FOLDER, cfg.RESOURCES.STORE_FOLDER)
+RESOURCE_WRITER_THREADS: int = cfg.RESOURCES.WRITER_THREADS
+RESOURCE_WRITER_QUEUE_SIZE: int = cfg.RESOURCES.WRITER_QUEUE_SIZE
+IMPORT_WORKERS: int = cfg.IMPORT.WORKERS
+IMPORT_CHUNK_SIZE: int = cfg.IMPORT.CHUNK_SIZE
+IMPORT_TAGS_TO_SKIP: list[str] = cfg.IMPORT.TAGS_TO_SKIP
+IMPORT_INCREMENTAL: bool = cfg.IMPORT.INCREMENTAL
+IMPORT_RESUME: bool = cfg.IMPORT.RESUME
+IMPORT_COMMIT_EVERY: int = cfg.IMPORT.COMMIT_EVERY
+IMPORT_DEFER_SEARCH_INDEX: bool = cfg.IMPORT.DEFER_SEARCH_INDEX
+IMPORT_LOG_ROWS: bool = cfg.IMPORT.LOG_ROWS
 
 
 class NoteType(Enum):
@@ -46,17 +98,26 @@ db = SQLAlchemy(model_class=Base)
 
 class Task(Base):
     __tablename__ = "tasks"
+    # A note's title and created time identify it across exports
+    __table_args__ = (
+        db.Index("ix_tasks_title_created", "title", "created", unique=True),
+    )
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
-    title: Mapped[str] = mapped_column(db.String(MAX_TITLE_LEN), default="")
+    title: Mapped[str] = mapped_column(db.String(MAX_TITLE_LEN), default="", index=True)
     body_text: Mapped[str] = mapped_column(db.String(MAX_BODY_TEXT_LEN), default="")
+    # The body without its markup, as indexed for search
+    plain_text: Mapped[str] = mapped_column(db.String, default="", server_default="")
     created: Mapped[dt.datetime] = mapped_column(
-        db.DateTime, default=dt.datetime.now(dt.UTC)
+        db.DateTime, default=dt.datetime.now(dt.UTC), index=True
     )
     updated: Mapped[dt.datetime] = mapped_column(
-        db.DateTime, default=dt.datetime.now(dt.UTC)
+        db.DateTime, default=dt.datetime.now(dt.UTC), index=True
     )
     reminder_time: Mapped[Optional[dt.datetime]] = mapped_column(
-        db.DateTime, default=None
+        db.DateTime, default=None, index=True
+    )
+    content_hash: Mapped[Optional[str]] = mapped_column(
+        db.String(FINGERPRINT_LEN), unique=True, index=True, default=None
     )
 
     where_tag: Mapped["WhereTag"] = db.relationship(
@@ -89,7 +150,9 @@ class Task(Base):
 class WhereTag(Base):
     __tablename__ = "where_tags_table"
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
-    name: Mapped[str] = mapped_column(db.String(MAX_TAG_NAME_LEN), nullable=False)
+    name: Mapped[str] = mapped_column(
+        db.String(MAX_TAG_NAME_LEN), nullable=False, unique=True, index=True
+    )
     tasks: Mapped[list["Task"]] = db.relationship(
         "Task",
         secondary="task_where_tags_association",
@@ -109,13 +172,23 @@ task_where_tags = db.Table(
         db.Integer,
         db.ForeignKey("where_tags_table.id", ondelete="CASCADE"),
     ),
+    # The pair is the association's key; the second column is for reverse lookups
+    db.Index(
+        "ix_task_where_tags_association_task_id_where_tag_id",
+        "task_id",
+        "where_tag_id",
+        unique=True,
+    ),
+    db.Index("ix_task_where_tags_association_where_tag_id", "where_tag_id"),
 )
 
 
 class WhenTag(Base):
     __tablename__ = "when_tags"
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
-    name: Mapped[str] = mapped_column(db.String(MAX_TAG_NAME_LEN))
+    name: Mapped[str] = mapped_column(
+        db.String(MAX_TAG_NAME_LEN), unique=True, index=True
+    )
     tasks: Mapped[list["Task"]] = db.relationship(
         "Task", secondary="task_when_tags_association", back_populates="when_tag"
     )
@@ -131,23 +204,38 @@ task_when_tags = db.Table(
     db.Column(
         "when_tag_id", db.Integer, db.ForeignKey("when_tags.id", ondelete="CASCADE")
     ),
+    db.Index(
+        "ix_task_when_tags_association_task_id_when_tag_id",
+        "task_id",
+        "when_tag_id",
+        unique=True,
+    ),
+    db.Index("ix_task_when_tags_association_when_tag_id", "when_tag_id"),
 )
 
 
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        db.Index("ix_notes_title_created", "title", "created", unique=True),
+    )
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
     title: Mapped[str] = mapped_column(db.String(MAX_TITLE_LEN), default="")
     created: Mapped[dt.datetime] = mapped_column(
-        db.DateTime, default=dt.datetime.now(dt.UTC)
+        db.DateTime, default=dt.datetime.now(dt.UTC), index=True
     )
     updated: Mapped[dt.datetime] = mapped_column(
-        db.DateTime, default=dt.datetime.now(dt.UTC)
+        db.DateTime, default=dt.datetime.now(dt.UTC), index=True
     )
     reminder_time: Mapped[Optional[dt.datetime]] = mapped_column(
-        db.DateTime, default=None
+        db.DateTime, default=None, index=True
     )
     body_text: Mapped[str] = mapped_column(db.String(MAX_BODY_TEXT_LEN), default="")
+    # The body without its markup, as indexed for search
+    plain_text: Mapped[str] = mapped_column(db.String, default="", server_default="")
+    content_hash: Mapped[Optional[str]] = mapped_column(
+        db.String(FINGERPRINT_LEN), unique=True, index=True, default=None
+    )
     reference_tags: Mapped[list["ReferenceTag"]] = db.relationship(
         "ReferenceTag",
         secondary="note_reference_tags_association",
@@ -166,7 +254,9 @@ class Note(Base):
 class ReferenceTag(Base):
     __tablename__ = "reference_tags"
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
-    name: Mapped[str] = mapped_column(db.String(MAX_TAG_NAME_LEN))
+    name: Mapped[str] = mapped_column(
+        db.String(MAX_TAG_NAME_LEN), unique=True, index=True
+    )
     notes: Mapped[list["Note"]] = db.relationship(
         "Note",
         secondary="note_reference_tags_association",
@@ -191,6 +281,13 @@ notes_reference_tags = db.Table(
         db.Integer,
         db.ForeignKey("reference_tags.id", ondelete="CASCADE"),
     ),
+    db.Index(
+        "ix_note_reference_tags_association_note_id_reference_tag_id",
+        "note_id",
+        "reference_tag_id",
+        unique=True,
+    ),
+    db.Index("ix_note_reference_tags_association_reference_tag_id", "reference_tag_id"),
 )
 
 tasks_reference_tags = db.Table(
@@ -202,6 +299,13 @@ tasks_reference_tags = db.Table(
         db.Integer,
         db.ForeignKey("reference_tags.id", ondelete="CASCADE"),
     ),
+    db.Index(
+        "ix_task_reference_tags_association_task_id_reference_tag_id",
+        "task_id",
+        "reference_tag_id",
+        unique=True,
+    ),
+    db.Index("ix_task_reference_tags_association_reference_tag_id", "reference_tag_id"),
 )
 
 
@@ -209,8 +313,12 @@ class Resource(Base):
     __tablename__ = "resources"
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
     file_name: Mapped[str] = mapped_column(db.String(MAX_TITLE_LEN))
-    hash: Mapped[str] = mapped_column(db.String(MAX_TITLE_LEN))
-    data: Mapped[str] = mapped_column(db.String(MAX_IMAGE_DATA_LEN))
+    hash: Mapped[str] = mapped_column(db.String(MAX_TITLE_LEN), unique=True, index=True)
+    # Only loaded when accessed, so metadata queries never read the bytes.
+    # NULL when the bytes are in the ResourceStore
+    data: Mapped[Optional[bytes]] = mapped_column(
+        db.LargeBinary(MAX_IMAGE_DATA_LEN), nullable=True, deferred=True
+    )
     mime: Mapped[str] = mapped_column(db.String(MAX_TITLE_LEN))
     width: Mapped[int] = mapped_column(db.Integer, nullable=True)
     height: Mapped[int] = mapped_column(db.Integer, nullable=True)
@@ -218,8 +326,7 @@ class Resource(Base):
     def __repr__(self) -> str:
         return (
             f"Resource: id: {self.id}, file_name: {self.file_name}, hash: {self.hash}, "
-            f"mime: {self.mime}, width: {self.width}, "
-            f"height: {self.height}, data[:16]: {self.data[:16]}"
+            f"mime: {self.mime}, width: {self.width}, height: {self.height}"
         )
 
 
@@ -251,12 +358,574 @@ project_tasks = db.Table(
         "project_id", db.Integer, db.ForeignKey("projects.id", ondelete="CASCADE")
     ),
     db.Column("task_id", db.Integer, db.ForeignKey("tasks.id", ondelete="CASCADE")),
+    db.Index(
+        "ix_project_task_association_project_id_task_id",
+        "project_id",
+        "task_id",
+        unique=True,
+    ),
+    db.Index("ix_project_task_association_task_id", "task_id"),
 )
 
+# Association tables of Tasks and Notes, with the column referring to them
+NOTE_ASSOCIATIONS: dict[str, list[tuple[Table, str]]] = {
+    "tasks": [
+        (task_where_tags, "task_id"),
+        (task_when_tags, "task_id"),
+        (tasks_reference_tags, "task_id"),
+        (project_tasks, "task_id"),
+    ],
+    "notes": [(notes_reference_tags, "note_id")],
+}
+# Columns an edited note changes. Its title and created time are its identity
+NOTE_CONTENT_COLUMNS: tuple[str, ...] = (
+    "body_text",
+    "plain_text",
+    "updated",
+    "reminder_time",
+    "content_hash",
+)
 
-def save_enex_backup_to_mysql_db(*, enex_backup_pathname: str, database_pathname: str):
-    # engine = create_engine(f"sqlite+pysqlite:///{database_pathname}", echo=True)
 
+@event.listens_for(Session, "before_flush")
+def touch_updated(session: Session, flush_context: Any, instances: Any) -> None:
+    """
+    Moves on updated for tasks, notes and projects changed through the ORM,
+    including their tags and projects, unless updated was set with the change.
+    Clients compare updated to tell whether they have the latest version.
+    """
+    now: dt.datetime = dt.datetime.now(dt.UTC).replace(tzinfo=None)
+    for instance in session.dirty:
+        if (
+            isinstance(instance, (Task, Note, Project))
+            and session.is_modified(instance)
+            and not inspect(instance).attrs.updated.history.has_changes()
+        ):
+            instance.updated = now
+
+
+@event.listens_for(Session, "before_flush")
+def fill_plain_text(session: Session, flush_context: Any, instances: Any) -> None:
+    """Fills plain_text for tasks and notes added, or whose body changed, via the ORM"""
+    for instance in [*session.new, *session.dirty]:
+        if isinstance(instance, (Task, Note)) and (
+            instance in session.new
+            or inspect(instance).attrs.body_text.history.has_changes()
+        ):
+            instance.plain_text = plain_text(content=instance.body_text or "")
+
+
+class ImportedNote(Base):
+    """Fingerprint of each version of a note already imported from an ENEX file"""
+
+    __tablename__ = "imported_notes"
+    id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(db.String(FINGERPRINT_LEN), unique=True)
+    imported: Mapped[dt.datetime] = mapped_column(
+        db.DateTime, default=lambda: dt.datetime.now(dt.UTC)
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"ImportedNote: id: {self.id}, fingerprint: {self.fingerprint}, "
+            f"imported: {self.imported}"
+        )
+
+
+class ImportedFile(Base):
+    """Fingerprint of each ENEX file already completely imported"""
+
+    __tablename__ = "imported_files"
+    id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(db.String(FINGERPRINT_LEN), unique=True)
+    path: Mapped[str] = mapped_column(db.String(MAX_FILE_PATH_LEN))
+    imported: Mapped[dt.datetime] = mapped_column(
+        db.DateTime, default=lambda: dt.datetime.now(dt.UTC)
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"ImportedFile: id: {self.id}, fingerprint: {self.fingerprint}, "
+            f"path: {self.path}, imported: {self.imported}"
+        )
+
+
+class ImportCheckpoint(Base):
+    """Last note committed from an ENEX file whose import has not finished"""
+
+    __tablename__ = "import_checkpoints"
+    id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(db.String(FINGERPRINT_LEN), unique=True)
+    path: Mapped[str] = mapped_column(db.String(MAX_FILE_PATH_LEN))
+    last_note_no: Mapped[int] = mapped_column(db.Integer, default=-1)
+    updated: Mapped[dt.datetime] = mapped_column(
+        db.DateTime, default=lambda: dt.datetime.now(dt.UTC)
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"ImportCheckpoint: id: {self.id}, fingerprint: {self.fingerprint}, "
+            f"path: {self.path}, last_note_no: {self.last_note_no}, "
+            f"updated: {self.updated}"
+        )
+
+
+class ClassifiedNote(NamedTuple):
+    """A note from the ENEX backup with its tags sorted into where, when and reference"""
+
+    note: dict[str, str | list[str]]
+    note_type: NoteType
+    where_tag: Optional[str]
+    when_tag: Optional[str]
+    reference_tags: set[str]
+
+
+def classify_note(note: dict[str, str | list[str]]) -> ClassifiedNote:
+    """
+    The first Where and When tags of a note make it a Task. Tags that are neither
+    are reference tags. Notes with no Where or When tag are reference Notes.
+    """
+    this_note_where_tag: str = ""
+    this_note_when_tag: str = ""
+    this_note_reference_tags: set[str] = set()
+    this_tag: str
+    empty_tags: list[str] = []
+    for this_tag in note.get("tags", empty_tags):
+        if not this_note_where_tag:  # find first where_tag
+            if this_tag in WHERE_TAGS:
+                this_note_where_tag = this_tag
+                continue
+        if not this_note_when_tag:  # find first when_tag
+            if this_tag in WHEN_TAGS:
+                this_note_when_tag = this_tag
+                continue
+        if this_tag not in WHERE_TAGS and this_tag not in WHEN_TAGS:
+            this_note_reference_tags.add(this_tag)
+
+    note_type: NoteType = (
+        NoteType.TASK
+        if this_note_where_tag or this_note_when_tag
+        else NoteType.REFERENCE_NOTE
+    )
+    return ClassifiedNote(
+        note=note,
+        note_type=note_type,
+        where_tag=this_note_where_tag or None,
+        when_tag=this_note_when_tag or None,
+        reference_tags=this_note_reference_tags,
+    )
+
+
+def parse_note_datetime(
+    note: dict[str, str | list[str]], key: str
+) -> Optional[dt.datetime]:
+    try:
+        return dt.datetime.fromisoformat(note[key])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+class ImportTagRegistries(NamedTuple):
+    where: TagRegistry
+    when: TagRegistry
+    reference: TagRegistry
+
+    def close(self) -> None:
+        for registry in self:
+            registry.close()
+
+    def __enter__(self) -> "ImportTagRegistries":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def load_tag_registries() -> ImportTagRegistries:
+    """Load every tag once, for all the notes of an import"""
+    session: Session = db.session()
+    return ImportTagRegistries(
+        where=TagRegistry(session=session, tag_model=WhereTag),
+        when=TagRegistry(session=session, tag_model=WhenTag),
+        reference=TagRegistry(session=session, tag_model=ReferenceTag),
+    )
+
+
+def add_notes_to_db(
+    notes: list[dict[str, str | list[str]]], tag_registries: ImportTagRegistries
+) -> int:
+    """
+    Add a batch of notes from the ENEX backup as Tasks or reference Notes, with
+    their tag associations. Tags are resolved from the registries, then the rows
+    and associations go in as multi-row statements.
+    Rows are upserted against the note's title and created time: a note
+    already stored is updated if it changed and left alone if not.
+    Returns the number of Tasks and Notes added or updated.
+    Changes are flushed, not committed. The caller commits in batches.
+    """
+    classified_notes: list[ClassifiedNote] = [classify_note(note) for note in notes]
+
+    where_tag_ids: dict[str, int] = tag_registries.where.ids_for(
+        names={a_note.where_tag for a_note in classified_notes if a_note.where_tag}
+    )
+    when_tag_ids: dict[str, int] = tag_registries.when.ids_for(
+        names={a_note.when_tag for a_note in classified_notes if a_note.when_tag}
+    )
+    reference_tag_ids: dict[str, int] = tag_registries.reference.ids_for(
+        names=set().union(*(a_note.reference_tags for a_note in classified_notes))
+    )
+
+    tasks: list[ClassifiedNote] = [
+        a_note for a_note in classified_notes if a_note.note_type == NoteType.TASK
+    ]
+    reference_notes: list[ClassifiedNote] = [
+        a_note
+        for a_note in classified_notes
+        if a_note.note_type == NoteType.REFERENCE_NOTE
+    ]
+    notes_written: int = 0
+
+    written_tasks: list[tuple[int, ClassifiedNote]] = upsert_notes(
+        model=Task, classified_notes=tasks
+    )
+    if written_tasks:
+        task_ids: list[int] = [task_id for task_id, _ in written_tasks]
+        replace_association_rows(
+            table=task_where_tags,
+            owner_column="task_id",
+            owner_ids=task_ids,
+            rows=[
+                {"task_id": task_id, "where_tag_id": where_tag_ids[a_task.where_tag]}
+                for task_id, a_task in written_tasks
+                if a_task.where_tag
+            ],
+        )
+        replace_association_rows(
+            table=task_when_tags,
+            owner_column="task_id",
+            owner_ids=task_ids,
+            rows=[
+                {"task_id": task_id, "when_tag_id": when_tag_ids[a_task.when_tag]}
+                for task_id, a_task in written_tasks
+                if a_task.when_tag
+            ],
+        )
+        replace_association_rows(
+            table=tasks_reference_tags,
+            owner_column="task_id",
+            owner_ids=task_ids,
+            rows=[
+                {"task_id": task_id, "reference_tag_id": reference_tag_ids[a_tag]}
+                for task_id, a_task in written_tasks
+                for a_tag in sorted(a_task.reference_tags)
+            ],
+        )
+        delete_moved_notes(model=Note, moved_to=Task, ids=task_ids)
+        notes_written += len(written_tasks)
+
+    written_notes: list[tuple[int, ClassifiedNote]] = upsert_notes(
+        model=Note, classified_notes=reference_notes
+    )
+    if written_notes:
+        note_ids: list[int] = [note_id for note_id, _ in written_notes]
+        replace_association_rows(
+            table=notes_reference_tags,
+            owner_column="note_id",
+            owner_ids=note_ids,
+            rows=[
+                {"note_id": note_id, "reference_tag_id": reference_tag_ids[a_tag]}
+                for note_id, a_note in written_notes
+                for a_tag in sorted(a_note.reference_tags)
+            ],
+        )
+        delete_moved_notes(model=Task, moved_to=Note, ids=note_ids)
+        notes_written += len(written_notes)
+
+    logger.debug(msg=f"Added or updated {notes_written} of {len(notes)} notes")
+    return notes_written
+
+
+NoteKey = tuple[str, dt.datetime]
+
+
+def note_key(title: str, created: dt.datetime) -> NoteKey:
+    """A note's identity, with created as stored, i.e. without its time zone"""
+    return title, created.replace(tzinfo=None)
+
+
+def upsert_notes(
+    model: type[Task] | type[Note], classified_notes: list[ClassifiedNote]
+) -> list[tuple[int, ClassifiedNote]]:
+    """
+    Upsert the Task or Note rows of a batch in one multi-row statement. A note
+    is found by its title and created time, so a note edited since it was
+    imported updates its row. It is not found by its content hash, which
+    covers the body and updated time: an edited note would get a second row
+    rather than update its first. The unique content hash tells whether a note
+    changed, with its reminder time; rows that have not are not written at
+    all. Of the notes of a batch with the same title and created time, the
+    last is written, and the others are logged. A changed row's
+    updated always moves on, to the export's if that is later or else to now,
+    as clients tell changed rows by it, e.g. when only its tags were changed.
+    Returns the ids and notes of the rows added or updated, i.e. whose tag
+    associations may have changed.
+    """
+    rows_by_key: dict[NoteKey, tuple[ClassifiedNote, dict[str, Any]]] = {}
+    collisions: int = 0
+    for a_note in classified_notes:
+        row: dict[str, Any] = note_row(note=a_note.note)
+        key: NoteKey = note_key(title=row["title"], created=row["created"])
+        earlier: Optional[tuple[ClassifiedNote, dict[str, Any]]] = rows_by_key.get(key)
+        if earlier is not None and earlier[1]["content_hash"] != row["content_hash"]:
+            collisions += 1
+            logger.warning(
+                msg=f"Not writing a {model.__name__} {key[0]!r} created {key[1]}, "
+                "as a later note in the batch has the same title and created time"
+            )
+        rows_by_key[key] = (a_note, row)  # A later version in the batch wins
+    if collisions:
+        logger.warning(
+            msg=f"{collisions} {model.__name__}s were not written, as they had "
+            "the title and created time of another"
+        )
+    if not rows_by_key:
+        return []
+
+    # Core insert keeps None values, so every row is in one multi-row statement.
+    # Ids are assigned by SQLite, as the apps may be adding rows at the same
+    # time, and matched back to the rows by their identity
+    table: Table = model.__table__
+    upsert = sqlite_insert(table)
+    now: dt.datetime = dt.datetime.now(dt.UTC).replace(tzinfo=None)
+    written: list[tuple[int, ClassifiedNote]] = [
+        (row_id, rows_by_key[note_key(title=title, created=created)][0])
+        for row_id, title, created in db.session.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[table.c.title, table.c.created],
+                set_={
+                    **{
+                        column: upsert.excluded[column]
+                        for column in NOTE_CONTENT_COLUMNS
+                    },
+                    "updated": case(
+                        (
+                            upsert.excluded.updated > table.c.updated,
+                            upsert.excluded.updated,
+                        ),
+                        else_=literal(now, type_=table.c.updated.type),
+                    ),
+                },
+                where=or_(
+                    table.c.content_hash.is_distinct_from(upsert.excluded.content_hash),
+                    table.c.reminder_time.is_distinct_from(
+                        upsert.excluded.reminder_time
+                    ),
+                ),
+            ).returning(table.c.id, table.c.title, table.c.created),
+            [row for _, row in rows_by_key.values()],
+        )
+    ]
+    if len(written) < len(rows_by_key):
+        logger.debug(
+            msg=f"{len(rows_by_key) - len(written)} {model.__name__}s already "
+            "stored were unchanged"
+        )
+    return written
+
+
+def note_row(note: dict[str, str | list[str]]) -> dict[str, Any]:
+    """Column values of a Task or Note row for a note from the ENEX backup"""
+    now: dt.datetime = dt.datetime.now(dt.UTC)
+    created_dt: Optional[dt.datetime] = parse_note_datetime(note=note, key="created")
+    updated_dt: Optional[dt.datetime] = parse_note_datetime(note=note, key="updated")
+    empty_tags: list[str] = []
+    return {
+        "title": note.get("title", ""),
+        "created": created_dt or now,
+        "updated": updated_dt or now,
+        "body_text": note.get("content", ""),
+        "plain_text": note.get("text", ""),
+        "reminder_time": parse_note_datetime(note=note, key="reminder-time"),
+        "content_hash": compute_content_hash(
+            title=note.get("title", ""),
+            body_text=note.get("content", ""),
+            tags=note.get("tags", empty_tags),
+            created=created_dt,
+            updated=updated_dt,
+        ),
+    }
+
+
+def insert_association_rows(table: Table, rows: list[dict[str, int]]) -> None:
+    if rows:
+        db.session.execute(insert(table), rows)
+
+
+def replace_association_rows(
+    table: Table, owner_column: str, owner_ids: list[int], rows: list[dict[str, int]]
+) -> None:
+    """
+    Make rows the associations of the Tasks or Notes just written. Only pairs
+    that changed are deleted or inserted, so tags kept are not logged as changed
+    """
+    tag_column: str = next(
+        column.name for column in table.columns if column.name != owner_column
+    )
+    stored_pairs: set[tuple[int, int]] = set(
+        db.session.execute(
+            select(table.c[owner_column], table.c[tag_column]).where(
+                table.c[owner_column].in_(owner_ids)
+            )
+        ).tuples()
+    )
+    pairs: set[tuple[int, int]] = {(row[owner_column], row[tag_column]) for row in rows}
+    if stale_pairs := stored_pairs - pairs:
+        db.session.execute(
+            delete(table).where(
+                tuple_(table.c[owner_column], table.c[tag_column]).in_(stale_pairs)
+            )
+        )
+    insert_association_rows(
+        table=table,
+        rows=[
+            row
+            for row in rows
+            if (row[owner_column], row[tag_column]) not in stored_pairs
+        ],
+    )
+
+
+def delete_moved_notes(
+    model: type[Task] | type[Note], moved_to: type[Task] | type[Note], ids: list[int]
+) -> None:
+    """
+    A note whose tags changed it from a Task to a reference Note, or back, is
+    written to the other table, so its row in this one is deleted
+    """
+    moved_ids: list[int] = list(
+        db.session.scalars(
+            select(model.id).where(
+                tuple_(model.title, model.created).in_(
+                    select(moved_to.title, moved_to.created).where(moved_to.id.in_(ids))
+                )
+            )
+        )
+    )
+    if not moved_ids:
+        return
+    if model is Task:
+        # The projects lose the task, so they changed too
+        db.session.execute(
+            update(Project)
+            .where(
+                Project.id.in_(
+                    select(project_tasks.c.project_id).where(
+                        project_tasks.c.task_id.in_(moved_ids)
+                    )
+                )
+            )
+            .values(updated=dt.datetime.now(dt.UTC).replace(tzinfo=None))
+        )
+    for table, column in NOTE_ASSOCIATIONS[model.__tablename__]:
+        db.session.execute(delete(table).where(table.c[column].in_(moved_ids)))
+    db.session.execute(delete(model).where(model.id.in_(moved_ids)))
+
+
+def resource_rows(
+    resources: list[dict[str, str]],
+    resource_data: Optional[PendingResourceData] = None,
+) -> list[dict[str, Any]]:
+    """
+    The resources table rows of the resources from the ENEX backup, one per
+    hash. With resource_data, i.e. ResourceStorage.BLOB, their bytes go in the
+    data column; otherwise they are in the ResourceStore.
+    """
+    resources_by_hash: dict[str, dict[str, str]] = {}
+    data_by_hash: dict[str, Optional[bytes | bytearray]] = {}
+    for resource in resources:
+        resources_by_hash.setdefault(resource["hash"], resource)
+        if resource_data is not None:
+            # Every resource is popped, so none are left held in memory
+            data: Optional[bytes | bytearray] = resource_data.pop(resource["hash"])
+            data_by_hash[resource["hash"]] = data_by_hash.get(resource["hash"]) or data
+    return [
+        {
+            "file_name": resource["file_name"],
+            "hash": hash,
+            "mime": resource["mime"],
+            # Only images have a size
+            "width": resource.get("width"),
+            "height": resource.get("height"),
+            "data": (
+                None if data_by_hash.get(hash) is None else bytes(data_by_hash[hash])
+            ),
+        }
+        for hash, resource in resources_by_hash.items()
+    ]
+
+
+def add_resources_to_db(
+    resources: list[dict[str, str]],
+    resource_data: Optional[PendingResourceData] = None,
+) -> None:
+    """
+    Add the resources from the ENEX backup whose hash is not already stored, in
+    one multi-row insert.
+    Changes are flushed, not committed. The caller commits in batches.
+    """
+    rows: list[dict[str, Any]] = resource_rows(
+        resources=resources, resource_data=resource_data
+    )
+    if not rows:
+        return
+    stored_hashes: set[str] = set(
+        db.session.scalars(
+            select(Resource.hash).where(Resource.hash.in_(row["hash"] for row in rows))
+        )
+    )
+    new_rows: list[dict[str, Any]] = [
+        row for row in rows if row["hash"] not in stored_hashes
+    ]
+    if new_rows:
+        db.session.execute(insert(Resource.__table__), new_rows)
+
+
+def record_imported_notes(
+    fingerprints: Iterable[str], imported_fingerprints: set[str]
+) -> None:
+    """
+    Record the fingerprints of imported notes so unchanged re-imports skip them
+    Changes are flushed, not committed. The caller commits in batches.
+    """
+    new_fingerprints: list[str] = []
+    for fingerprint in fingerprints:
+        if fingerprint not in imported_fingerprints:
+            imported_fingerprints.add(fingerprint)
+            new_fingerprints.append(fingerprint)
+    if new_fingerprints:
+        db.session.execute(
+            insert(ImportedNote),
+            [{"fingerprint": fingerprint} for fingerprint in new_fingerprints],
+        )
+
+
+def save_checkpoint(fingerprint: str, path: str, note_no: int) -> None:
+    """
+    Record the last note of an ENEX file written to the database. Committed with
+    the batch of notes it covers, so a resumed import neither repeats nor misses
+    any notes.
+    """
+    checkpoint: Optional[ImportCheckpoint] = db.session.scalars(
+        select(ImportCheckpoint).where(ImportCheckpoint.fingerprint == fingerprint)
+    ).first()
+    if checkpoint is None:
+        checkpoint = ImportCheckpoint(fingerprint=fingerprint, path=path)
+        db.session.add(checkpoint)
+    checkpoint.last_note_no = note_no
+    checkpoint.updated = dt.datetime.now(dt.UTC)
+
+
+def create_import_app(database_pathname: str) -> Flask:
     """
     What kind of database are we communicating with? This is the sqlite portion above,
     which links in SQLAlchemy to an object known as the dialect.
@@ -264,6 +933,7 @@ def save_enex_backup_to_mysql_db(*, enex_backup_pathname: str, database_pathname
     particular database. In this case, we’re using the name pysqlite, which in modern
     Python use is the sqlite3 standard library interface for SQLite.
     """
+    # engine = create_engine(f"sqlite+pysqlite:///{database_pathname}", echo=True)
     app = Flask(__name__)
     app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite+pysqlite:///{database_pathname}"
     # app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
@@ -271,230 +941,272 @@ def save_enex_backup_to_mysql_db(*, enex_backup_pathname: str, database_pathname
     db.init_app(app)
 
     with app.app_context():
+        apply_sqlite_profile(engine=db.engine, profile=SqliteProfile.BULK_IMPORT)
         db.create_all()
+        with db.engine.begin() as connection:
+            upgrade_database(connection=connection)
+            ensure_search_index(connection=connection)
+            compact_change_log(connection=connection)
+
+    return app
+
+
+def get_import_state(enex_fingerprint: str) -> tuple[bool, int]:
+    """
+    Returns whether the ENEX file has already been completely imported and the
+    note number to resume from if an earlier import of it was interrupted
+    """
+    file_imported: bool = (
+        db.session.scalars(
+            select(ImportedFile).where(ImportedFile.fingerprint == enex_fingerprint)
+        ).first()
+        is not None
+    )
+    checkpoint: Optional[ImportCheckpoint] = db.session.scalars(
+        select(ImportCheckpoint).where(ImportCheckpoint.fingerprint == enex_fingerprint)
+    ).first()
+    start_note_no: int = 0 if checkpoint is None else checkpoint.last_note_no + 1
+    return file_imported, start_note_no
+
+
+def write_enex_notes_to_db(
+    *,
+    notes: Iterable[RawNote],
+    enex_backup_pathname: str,
+    enex_fingerprint: str,
+    file_imported: bool,
+    imported_fingerprints: set[str],
+    tag_registries: ImportTagRegistries,
+    resource_data: Optional[PendingResourceData] = None,
+    commit_every: int = IMPORT_COMMIT_EVERY,
+) -> int:
+    """
+    Write the notes and resources of one ENEX file in chunks of commit_every
+    notes, each written with multi-row inserts and committed with its
+    checkpoint, then record the file as imported.
+    Returns the number of Tasks and Notes written.
+    """
+    notes_written: int = 0
+    notes_iter: Iterator[RawNote] = iter(notes)
+
+    while chunk := list(islice(notes_iter, commit_every)):
+        notes_written += write_enex_chunk_to_db(
+            chunk=chunk,
+            enex_backup_pathname=enex_backup_pathname,
+            enex_fingerprint=enex_fingerprint,
+            imported_fingerprints=imported_fingerprints,
+            tag_registries=tag_registries,
+            resource_data=resource_data,
+        )
+    finish_enex_import(
+        enex_backup_pathname=enex_backup_pathname,
+        enex_fingerprint=enex_fingerprint,
+        file_imported=file_imported,
+    )
+    return notes_written
+
+
+def write_enex_chunk_to_db(
+    *,
+    chunk: list[RawNote],
+    enex_backup_pathname: str,
+    enex_fingerprint: str,
+    imported_fingerprints: set[str],
+    tag_registries: ImportTagRegistries,
+    resource_data: Optional[PendingResourceData] = None,
+) -> int:
+    """
+    Write a chunk of notes of an ENEX file and their resources, and commit them
+    with the file's checkpoint. Returns the number of Tasks and Notes written.
+    """
+    notes_written: int = add_notes_to_db(
+        notes=[note for note, _ in chunk], tag_registries=tag_registries
+    )
+    add_resources_to_db(
+        resources=[
+            resource for _, note_resources in chunk for resource in note_resources
+        ],
+        resource_data=resource_data,
+    )
+    record_imported_notes(
+        fingerprints=[note["fingerprint"] for note, _ in chunk],
+        imported_fingerprints=imported_fingerprints,
+    )
+    # Committed with the chunk it covers
+    save_checkpoint(
+        fingerprint=enex_fingerprint,
+        path=enex_backup_pathname,
+        note_no=chunk[-1][0]["note_no"],
+    )
+    db.session.commit()
+    return notes_written
+
+
+def finish_enex_import(
+    enex_backup_pathname: str, enex_fingerprint: str, file_imported: bool
+) -> None:
+    """Once all its notes are written, record the ENEX file as imported"""
+    # Import finished, so the checkpoint is replaced by the imported file record
+    db.session.execute(
+        delete(ImportCheckpoint).where(ImportCheckpoint.fingerprint == enex_fingerprint)
+    )
+
+    if not file_imported:
+        db.session.add(
+            ImportedFile(fingerprint=enex_fingerprint, path=enex_backup_pathname)
+        )
+    db.session.commit()
+
+
+def log_resource_writer_results(resource_writer: ResourceWriter) -> None:
+    for failure in resource_writer.failures:
+        logger.warning(
+            msg=f"Cannot save resource with hash: {failure.hash} due to error: {failure.error}"
+        )
+    logger.debug(
+        msg=f"Resources written: {resource_writer.written}, "
+        f"already stored: {resource_writer.skipped}, "
+        f"failed: {len(resource_writer.failures)}"
+    )
+
+
+def log_database_contents(log_rows: bool = IMPORT_LOG_ROWS) -> None:
+    logger.debug(msg=f"Let's see what's in database...")
+    for model in (Task, Note, Resource):
+        logger.debug(
+            msg=f"There are {db.session.scalar(select(func.count(model.id)))} "
+            f"{model.__tablename__} in the database"
+        )
+
+    # Logs every row, so only when asked for and debug logging is on. Rows are
+    # read with the relationships their __repr__ shows, not one query per row
+    if log_rows and logger.isEnabledFor(logging.DEBUG):
+        # Imported here, as the repository imports the models from this module
+        from src.controller.repository import LoadProfile, iter_loaded
 
-    # Load Data from ENEX file(s)
-    notes, resources = load_enex_backup(filepath=enex_backup_pathname, logger=logger)
+        for model in (Task, Note):
+            for row in iter_loaded(model=model, profile=LoadProfile.EXPORT):
+                logger.debug(msg=f"{row!r}")
+
+
+def resource_sink_for(
+    resource_storage: ResourceStorage, resource_folder: str
+) -> ResourceWriter | PendingResourceData:
+    """
+    Where resource bytes go while parsing: written to the ResourceStore in
+    background threads, or held until written to the database with their note
+    """
+    if resource_storage == ResourceStorage.BLOB:
+        return PendingResourceData()
+    return ResourceWriter(
+        store=ResourceStore(folder=resource_folder),
+        threads=RESOURCE_WRITER_THREADS,
+        queue_size=RESOURCE_WRITER_QUEUE_SIZE,
+    )
+
+
+def search_indexing_for(
+    defer_search_index: bool, incremental: bool
+) -> ContextManager[None]:
+    """
+    Index imported notes in one pass at the end, or row by row as written.
+    Only a full import, or the first, is indexed at the end: an incremental
+    import writes few rows, and rebuilding would cost as much as a full one,
+    with the rows the apps write meanwhile left out until it is done
+    """
+    if defer_search_index and (not incremental or not has_notes()):
+        return deferred_search_indexing(session=db.session)
+    return nullcontext()
+
+
+def has_notes() -> bool:
+    return any(
+        db.session.scalar(select(model.id).limit(1)) is not None
+        for model in (Task, Note)
+    )
+
+
+def save_enex_backup_to_mysql_db(
+    *,
+    enex_backup_pathname: str,
+    database_pathname: str,
+    resource_folder: str = RESOURCE_STORE_FOLDER,
+    resource_storage: ResourceStorage = RESOURCE_STORAGE,
+    incremental: bool = IMPORT_INCREMENTAL,
+    resume: bool = IMPORT_RESUME,
+    commit_every: int = IMPORT_COMMIT_EVERY,
+    defer_search_index: bool = IMPORT_DEFER_SEARCH_INDEX,
+):
+    app: Flask = create_import_app(database_pathname=database_pathname)
 
     # Add all Where and When Tags to their respective databases if they're not there already
     # Remvoe the adding of them for each note below
     # For Tags in note that are not in Where or When tags, add tag as Reference Tag or something like that
 
+    enex_fingerprint: str = file_fingerprint(path=enex_backup_pathname)
+
     with app.app_context():
-        for note in notes:
-            logger.debug(msg=f"{note['title']=}")
-            logger.debug(msg=f"{note.keys()=}")
-            note_type: NoteType = NoteType.REFERENCE_NOTE  # default
-            this_note_where_tag: str = ""
-            this_note_when_tag: str = ""
-            this_note_reference_tags: set[str] = set()
-            this_tag: str
-            empty_tags: list[str] = []
-            for this_tag in note.get("tags", empty_tags):
-                if not this_note_where_tag:  # find first where_tag
-                    if this_tag in WHERE_TAGS:
-                        this_note_where_tag = this_tag
-                        continue
-                if not this_note_when_tag:  # find first when_tag
-                    if this_tag in WHEN_TAGS:
-                        this_note_when_tag = this_tag
-                        continue
-                if this_tag not in WHERE_TAGS and this_tag not in WHEN_TAGS:
-                    this_note_reference_tags.add(this_tag)
-
-            logger.debug(msg=f"{this_note_where_tag=}, {this_note_when_tag=}")
-
-            # Add Where Tag  to WhereTag if doesn't exist yet
-            logger.debug(msg=f"{this_note_where_tag=}")
-            where_tag_in_db: Optional[WhereTag] = None
-            if this_note_where_tag:
-                note_type = NoteType.TASK  # If there is a Where Tag, this is a task
-                where_tag_in_db = db.session.scalars(
-                    select(WhereTag).where(WhereTag.name == this_note_where_tag)
-                ).first()
-                logger.debug(msg=f"{where_tag_in_db=}")
-                if where_tag_in_db is None:
-                    logger.debug(msg=f"Adding {this_note_where_tag} to WhereTag")
-                    new_where_tag = WhereTag(name=this_note_where_tag)
-                    db.session.add(new_where_tag)
-                    db.session.commit()
-                    logger.debug(msg=f"Let's check if new_where_tag has been added...")
-                    where_tag_query1_5 = db.session.scalars(
-                        select(WhereTag).where(WhereTag.name == this_note_where_tag)
-                    ).first()
-                    logger.debug(msg=f"{where_tag_query1_5=}")
-
-            # Add Where Tag to Task if there is one
-            if this_note_where_tag:
-                this_note_where_tag = db.session.scalars(
-                    select(WhereTag).where(WhereTag.name == this_note_where_tag)
-                ).first()
-            else:
-                this_note_where_tag = None
-
-            # Add When Tag to WhenTag if doesn't exist yet
-            when_tag_in_db: Optional[WhenTag] = None
-            if this_note_when_tag:
-                note_type = NoteType.TASK  # If there is a When Tag, this is a task
-                when_tag_in_db = db.session.scalars(
-                    select(WhenTag).where(WhenTag.name == this_note_when_tag)
-                ).first()
-                logger.debug(msg=f"{when_tag_in_db=}")
-                if when_tag_in_db is None:
-                    logger.debug(msg=f"Adding {this_note_when_tag} to WhenTag")
-                    new_when_tag = WhenTag(name=this_note_when_tag)
-                    db.session.add(new_when_tag)
-                    db.session.commit()
-                    logger.debug(msg=f"Let's check if new_when_tag has been added...")
-                    when_tag_in_db1_5 = db.session.scalars(
-                        select(WhenTag).where(WhenTag.name == this_note_when_tag)
-                    ).first()
-                    logger.debug(msg=f"{when_tag_in_db1_5=}")
-
-            # Add When Tag to Task if there is one
-            if this_note_when_tag:
-                new_when_tag = db.session.scalars(
-                    select(WhenTag).where(WhenTag.name == this_note_when_tag)
-                ).first()
-            else:
-                this_note_when_tag = None
-
-            # Add Reference Tag to ReferenceTag if doesn't exist yet
-            reference_tag_in_db: Optional[ReferenceTag] = None
-            reference_tags_in_note: list[ReferenceTag] = []
-            a_tag: str
-            for a_tag in this_note_reference_tags:
-                reference_tag_in_db = db.session.scalars(
-                    select(ReferenceTag).where(ReferenceTag.name == a_tag)
-                ).first()
-                logger.debug(msg=f"{reference_tag_in_db=}")
-                if reference_tag_in_db is None:
-                    logger.debug(msg=f"Adding {a_tag} to ReferenceTag")
-                    new_reference_tag = ReferenceTag(name=a_tag)
-                    db.session.add(new_reference_tag)
-                    db.session.commit()
-                    logger.debug(
-                        msg=f"Let's check if new_reference_tag has been added..."
-                    )
-                    reference_tag_in_db = db.session.scalars(
-                        select(ReferenceTag).where(ReferenceTag.name == a_tag)
-                    ).first()
-                    logger.debug(msg=f"{reference_tag_in_db=}")
-
-                # Add Reference Tag to Note
-                reference_tags_in_note.append(reference_tag_in_db)
-
-            try:
-                created_dt: dt.datetime = dt.datetime.fromisoformat(note["created"])
-            except (TypeError, KeyError):
-                created_dt = dt.datetime.now(dt.UTC)
-            try:
-                updated_dt: dt.datetime = dt.datetime.fromisoformat(note["updated"])
-            except (TypeError, KeyError):
-                updated_dt = dt.datetime.now(dt.UTC)
-            try:
-                reminder_dt: Optional[dt.datetime] = dt.datetime.fromisoformat(
-                    note["reminder-time"]
-                )
-            except (TypeError, KeyError):
-                reminder_dt = None
-
-            match note_type:
-                case NoteType.TASK:
-                    a_task = Task(
-                        title=note.get("title", ""),
-                        created=created_dt,
-                        updated=updated_dt,
-                        body_text=note.get("content", ""),
-                        reminder_time=reminder_dt,
-                    )
-                    logger.debug(msg=f"{a_task=}")
-
-                    task_exists: bool = db.session.scalars(
-                        select(Task).where(
-                            Task.title == a_task.title
-                            and Task.body_text == a_task.body_text
-                            and Task.when_tag == a_task.when_tag
-                            and Task.where_tag == a_task.where_tag
-                        )
-                    ).first()
-                    if not task_exists:
-                        db.session.add(a_task)
-                        db.session.commit()
-                case NoteType.REFERENCE_NOTE:
-                    a_note = Note(
-                        title=note.get("title", ""),
-                        created=created_dt,
-                        updated=updated_dt,
-                        body_text=note.get("content", ""),
-                        reference_tags=reference_tags_in_note,
-                        reminder_time=reminder_dt,
-                    )
-                    logger.debug(msg=f"{a_note=}")
-
-                    note_exists: bool = db.session.scalars(
-                        select(Note).where(
-                            Note.title == a_note.title
-                            and Note.body_text == a_note.body_text
-                            and Note.reference_tags == a_note.reference_tags
-                        )
-                    ).first()
-                    if not note_exists:
-                        db.session.add(a_note)
-                        db.session.commit()
-                case _:
-                    pass
-
-            logger.debug(msg=f"Task added. Let's see if it's correct...")
-            task1 = db.session.scalars(
-                select(Task).where(Task.title == note["title"])
-            ).first()
-            logger.debug(msg=f"{task1=}")
-            task_list = db.session.scalars(select(Task)).all()
-            logger.debug(msg=f"Current number of tasks: {len(task_list)=}")
-
-        for resource in resources:
-            logger.debug(msg=f"{resource['file_name']=}")
-
-            a_resource = Resource(
-                file_name=resource["file_name"],
-                hash=resource["hash"],
-                mime=resource["mime"],
-                width=resource["width"],
-                height=resource["height"],
-                data=resource["data"],
+        file_imported, start_note_no = get_import_state(
+            enex_fingerprint=enex_fingerprint
+        )
+        if incremental and file_imported:
+            logger.info(
+                msg=f"Skipping {enex_backup_pathname}, it has already been imported unchanged"
             )
+            return
 
-            resource_exists: bool = db.session.scalars(
-                select(Resource).where(Resource.hash == a_resource.hash)
-            ).first()
-            if not resource_exists:
-                db.session.add(a_resource)
-                db.session.commit()
-
-        resource_list = db.session.scalars(select(Resource)).all()
-        logger.debug(msg=f"Current number of resources: {len(resource_list)=}")
+        # In incremental mode, notes already imported and unchanged are skipped
+        imported_fingerprints: set[str] = set(
+            db.session.scalars(select(ImportedNote.fingerprint))
+        )
 
-        logger.debug(msg=f"Let's see what's in database...")
-        tasks_in_db = db.session.scalars(select(Task)).all()
-        logger.debug(msg=f"{tasks_in_db=}")
-        logger.debug(msg=f"There are {len(tasks_in_db)} tasks in the database")
+        # Continue after the last note committed by an interrupted import
+        if not resume:
+            start_note_no = 0
+        elif start_note_no:
+            logger.info(
+                msg=f"Resuming import of {enex_backup_pathname} from note {start_note_no}"
+            )
 
-        notes_in_db = db.session.scalars(select(Note)).all()
-        logger.debug(msg=f"{notes_in_db=}")
-        logger.debug(msg=f"There are {len(notes_in_db)} notes in the database")
+        # Resource files are written in background threads while parsing
+        # continues, or with ResourceStorage.BLOB held until their chunk is written
+        with search_indexing_for(
+            defer_search_index=defer_search_index, incremental=incremental
+        ), load_tag_registries() as tag_registries, resource_sink_for(
+            resource_storage=resource_storage, resource_folder=resource_folder
+        ) as resource_sink:
+            write_enex_notes_to_db(
+                notes=iter_enex_notes(
+                    filepath=enex_backup_pathname,
+                    logger=logger,
+                    workers=IMPORT_WORKERS,
+                    chunk_size=IMPORT_CHUNK_SIZE,
+                    tags_to_skip=IMPORT_TAGS_TO_SKIP,
+                    resource_sink=resource_sink,
+                    skip_fingerprints=imported_fingerprints if incremental else None,
+                    start_note_no=start_note_no,
+                ),
+                enex_backup_pathname=enex_backup_pathname,
+                enex_fingerprint=enex_fingerprint,
+                file_imported=file_imported,
+                imported_fingerprints=imported_fingerprints,
+                tag_registries=tag_registries,
+                resource_data=(
+                    resource_sink
+                    if isinstance(resource_sink, PendingResourceData)
+                    else None
+                ),
+                commit_every=commit_every,
+            )
 
-        resources_in_db = db.session.scalars(
-            select(Resource).order_by(Resource.file_name)
-        ).all()
-        logger.debug(msg=f"There are {len(resources_in_db)} resources in the database")
+        if isinstance(resource_sink, ResourceWriter):
+            log_resource_writer_results(resource_writer=resource_sink)
+        log_database_contents()
 
 
 if __name__ == "__main__":
-    # database_pathname: str = "data/database/notes_data.db"
-    database_pathname: str = "../../../data/database/notes_data.db"
     enex_backup_pathname: str = "data/import_data/Test Export Tasks (2023-10-20).enex"
 
     save_enex_backup_to_mysql_db(
-        enex_backup_pathname=enex_backup_pathname, database_pathname=database_pathname
+        enex_backup_pathname=enex_backup_pathname, database_pathname=DATABASE_PATHNAME
     )
@@ -15,6 +15,8 @@ from sqlalchemy.orm import mapped_column
 # from sqlalchemy.orm import relationship
 
 from src.controller.load_import_data import load_enex_backup
+from src.controller.resource_store import ResourceStore, ResourceWriter
+from src.controller.sqlite_profile import SqliteProfile, apply_sqlite_profile
 from src.config.config_main import load_config
 from src.config.config_logging import logger
 
@@ -27,6 +29,9 @@ MAX_IMAGE_FILENAME_LEN: int = cfg.DATABASE.MAX_FIELD_LIMITS.IMAGE_FILENAME
 MAX_IMAGE_DATA_LEN: int = cfg.DATABASE.MAX_FIELD_LIMITS.IMAGE_DATA
 WHEN_TAGS: list[str] = cfg.DATABASE.TAGS.WHEN
 WHERE_TAGS: list[str] = cfg.DATABASE.TAGS.WHERE
+RESOURCE_STORE_FOLDER: str = cfg.RESOURCES.STORE_FOLDER
+RESOURCE_WRITER_THREADS: int = cfg.RESOURCES.WRITER_THREADS
+RESOURCE_WRITER_QUEUE_SIZE: int = cfg.RESOURCES.WRITER_QUEUE_SIZE
 
 
 class Base(DeclarativeBase):
@@ -118,8 +123,14 @@ class Project(Base):
 """
 
 
-def save_enex_backup_to_mysql_db(*, enex_backup_pathname: str, database_pathname: str):
-    engine = create_engine(f"sqlite+pysqlite:///{database_pathname}", echo=True)
+def save_enex_backup_to_mysql_db(
+    *,
+    enex_backup_pathname: str,
+    database_pathname: str,
+    resource_folder: str = RESOURCE_STORE_FOLDER,
+):
+    engine = create_engine(f"sqlite+pysqlite:///{database_pathname}")
+    apply_sqlite_profile(engine=engine, profile=SqliteProfile.BULK_IMPORT)
     """
     What kind of database are we communicating with? This is the sqlite portion above,
     which links in SQLAlchemy to an object known as the dialect.
@@ -135,7 +146,20 @@ def save_enex_backup_to_mysql_db(*, enex_backup_pathname: str, database_pathname
 
 
 
-    tasks, resources = load_enex_backup(filepath=enex_backup_pathname, logger=logger)
+    with ResourceWriter(
+        store=ResourceStore(folder=resource_folder),
+        threads=RESOURCE_WRITER_THREADS,
+        queue_size=RESOURCE_WRITER_QUEUE_SIZE,
+    ) as resource_writer:
+        tasks, resources = load_enex_backup(
+            filepath=enex_backup_pathname,
+            logger=logger,
+            resource_sink=resource_writer,
+        )
+    for failure in resource_writer.failures:
+        logger.warning(
+            msg=f"Cannot save resource with hash: {failure.hash} due to error: {failure.error}"
+        )
 
     with Session(engine) as session:
         for task in tasks:
@@ -228,7 +252,7 @@ def save_enex_backup_to_mysql_db(*, enex_backup_pathname: str, database_pathname
                 mime=resource["mime"],
                 width=resource["width"],
                 height=resource["height"],
-                data=resource["data"],
+                data="",  # Resource bytes are in the ResourceStore, keyed by hash
             )
 
             session.add(a_resource)
@@ -0,0 +1,124 @@
+""" Full-text search over the title and body of tasks and notes, ranked by relevance """
+
+import html
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import bindparam, text
+
+from src.controller.save_enex_backup_to_flask_mysql_db import cfg, db
+
+SEARCH_PAGE_SIZE: int = cfg.SEARCH.PAGE_SIZE
+SEARCH_MAX_PAGE_SIZE: int = cfg.SEARCH.MAX_PAGE_SIZE
+SEARCH_SNIPPET_TOKENS: int = cfg.SEARCH.SNIPPET_TOKENS
+SEARCH_TITLE_WEIGHT: float = cfg.SEARCH.TITLE_WEIGHT
+SEARCH_TABLES_BY_KIND: dict[str, str] = {"task": "tasks", "note": "notes"}
+
+# Marks around matches in snippets, replaced by <mark> once the text is escaped
+MATCH_START: str = "\x02"
+MATCH_END: str = "\x03"
+
+
+class SearchHit(NamedTuple):
+    kind: str  # "task" or "note"
+    id: int
+    title: str
+    snippet: str  # HTML, with the matching words in <mark>
+    rank: float  # Lower is more relevant
+
+
+class SearchPage(NamedTuple):
+    query: str
+    page: int
+    per_page: int
+    hits: list[SearchHit]
+    has_more: bool
+
+
+def fts_query(query: str) -> str:
+    """
+    Each word of the query as an FTS5 string, so every word must match and
+    quotes, operators or column names typed by the user are searched for as
+    text rather than being FTS5 syntax
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def search(
+    query: str,
+    kinds: Iterable[str] = SEARCH_TABLES_BY_KIND,
+    page: int = 1,
+    per_page: int = SEARCH_PAGE_SIZE,
+) -> SearchPage:
+    """
+    Tasks and notes matching every word of the query, best first, one page at
+    a time. Title matches weigh SEARCH_TITLE_WEIGHT times body matches.
+    Only the rows on the page are fetched and given snippets; the rest of the
+    matches are only ranked, from the index.
+    """
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), SEARCH_MAX_PAGE_SIZE)
+    match: str = fts_query(query=query)
+    kinds = [kind for kind in kinds if kind in SEARCH_TABLES_BY_KIND]
+    if not match or not kinds:
+        return SearchPage(
+            query=query, page=page, per_page=per_page, hits=[], has_more=False
+        )
+
+    ranked_sql: str = " UNION ALL ".join(
+        f"SELECT '{kind}' AS kind, rowid AS id, "
+        f"bm25({table}_fts, {SEARCH_TITLE_WEIGHT}, 1.0) AS rank "
+        f"FROM {table}_fts WHERE {table}_fts MATCH :match"
+        for kind, table in SEARCH_TABLES_BY_KIND.items()
+        if kind in kinds
+    )
+    ranked_rows = db.session.execute(
+        text(f"{ranked_sql} ORDER BY rank, kind, id LIMIT :limit OFFSET :offset"),
+        {"match": match, "limit": per_page + 1, "offset": (page - 1) * per_page},
+    ).all()
+    has_more: bool = len(ranked_rows) > per_page
+    ranked_rows = ranked_rows[:per_page]
+
+    details: dict[tuple[str, int], tuple[str, str]] = {}
+    for kind, table in SEARCH_TABLES_BY_KIND.items():
+        ids: list[int] = [row.id for row in ranked_rows if row.kind == kind]
+        if not ids:
+            continue
+        for row_id, title, snippet in db.session.execute(
+            text(
+                f"SELECT {table}.id, {table}.title, "
+                f"snippet({table}_fts, -1, :match_start, :match_end, '…', :tokens) "
+                f"FROM {table}_fts JOIN {table} ON {table}.id = {table}_fts.rowid "
+                f"WHERE {table}_fts MATCH :match AND {table}_fts.rowid IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {
+                "match": match,
+                "match_start": MATCH_START,
+                "match_end": MATCH_END,
+                "tokens": SEARCH_SNIPPET_TOKENS,
+                "ids": ids,
+            },
+        ):
+            details[(kind, row_id)] = (title, snippet_html(snippet=snippet))
+
+    hits: list[SearchHit] = [
+        SearchHit(
+            kind=row.kind,
+            id=row.id,
+            title=details[(row.kind, row.id)][0],
+            snippet=details[(row.kind, row.id)][1],
+            rank=row.rank,
+        )
+        for row in ranked_rows
+        if (row.kind, row.id) in details
+    ]
+    return SearchPage(
+        query=query, page=page, per_page=per_page, hits=hits, has_more=has_more
+    )
+
+
+def snippet_html(snippet: str) -> str:
+    return (
+        html.escape(snippet)
+        .replace(MATCH_START, "<mark>")
+        .replace(MATCH_END, "</mark>")
+    )
@@ -0,0 +1,116 @@
+""" Upkeep of the full-text search index over the title and text of tasks, notes
+
+Each table has an external content FTS5 table, <table>_fts, holding only the
+index; the text itself stays in the table, in plain_text, the body without its
+ENML markup, so tag and attribute names are not matched. Triggers keep the
+index in step with every insert, update and delete. Bulk imports drop the
+triggers and rebuild the index once at the end, which is much faster than
+indexing row by row.
+"""
+
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import Connection
+from sqlalchemy.orm import Session
+
+from src.config.config_logging import logger
+
+SEARCH_TABLES: list[str] = ["tasks", "notes"]
+SEARCH_TABLE_SQL: str = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+        title, plain_text, content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+"""
+SEARCH_TRIGGERS: dict[str, str] = {
+    "insert": """
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_fts (rowid, title, plain_text)
+            VALUES (new.id, new.title, new.plain_text);
+        END
+    """,
+    "delete": """
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, title, plain_text)
+            VALUES ('delete', old.id, old.title, old.plain_text);
+        END
+    """,
+    "update": """
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_update
+        AFTER UPDATE OF title, plain_text ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, title, plain_text)
+            VALUES ('delete', old.id, old.title, old.plain_text);
+            INSERT INTO {table}_fts (rowid, title, plain_text)
+            VALUES (new.id, new.title, new.plain_text);
+        END
+    """,
+}
+
+
+def trigger_names() -> list[str]:
+    return [
+        f"{table}_fts_{operation}"
+        for table in SEARCH_TABLES
+        for operation in SEARCH_TRIGGERS
+    ]
+
+
+def create_search_tables(connection: Connection) -> None:
+    for table in SEARCH_TABLES:
+        connection.exec_driver_sql(SEARCH_TABLE_SQL.format(table=table))
+
+
+def create_search_triggers(connection: Connection) -> None:
+    for table in SEARCH_TABLES:
+        for trigger_sql in SEARCH_TRIGGERS.values():
+            connection.exec_driver_sql(trigger_sql.format(table=table))
+
+
+def drop_search_triggers(connection: Connection) -> None:
+    for trigger_name in trigger_names():
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger_name}")
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    """Index every row again from the tables, and restore the triggers"""
+    for table in SEARCH_TABLES:
+        connection.exec_driver_sql(
+            f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')"
+        )
+    create_search_triggers(connection=connection)
+
+
+def ensure_search_index(connection: Connection) -> None:
+    """
+    Rebuild the index if its triggers are missing, as they are after a bulk
+    import that did not get to rebuild it
+    """
+    existing_triggers: set[str] = set(
+        connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+        ).scalars()
+    )
+    if set(trigger_names()) <= existing_triggers:
+        return
+    logger.warning(msg="The search index is out of date, rebuilding it")
+    rebuild_search_index(connection=connection)
+
+
+@contextmanager
+def deferred_search_indexing(session: Session) -> Iterator[None]:
+    """
+    Leave the rows written inside the block out of the search index until the
+    end of the block, then index all rows in one pass. The rows committed
+    before an error are indexed too.
+    """
+    drop_search_triggers(connection=session.connection())
+    session.commit()
+    try:
+        yield
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        rebuild_search_index(connection=session.connection())
+        session.commit()
@@ -0,0 +1,59 @@
+""" SQLite performance settings, applied to every connection an engine opens """
+
+from enum import Enum
+from typing import Any
+
+from box import Box
+from sqlalchemy import Engine, event
+
+from src.config.config_main import load_config
+
+cfg: Box = load_config()
+
+SQLITE_PROFILES: Box = cfg.DATABASE.SQLITE
+PRAGMAS: frozenset[str] = frozenset(
+    [
+        "JOURNAL_MODE",
+        "SYNCHRONOUS",
+        "CACHE_SIZE",
+        "MMAP_SIZE",
+        "TEMP_STORE",
+        "BUSY_TIMEOUT",
+        "WAL_AUTOCHECKPOINT",
+    ]
+)
+
+
+class SqliteProfile(Enum):
+    BULK_IMPORT = "BULK_IMPORT"
+    SERVING = "SERVING"
+
+
+def sqlite_pragmas(profile: SqliteProfile) -> dict[str, Any]:
+    """The PRAGMAs of a DATABASE.SQLITE profile in notis_config.yaml"""
+    pragmas: dict[str, Any] = dict(SQLITE_PROFILES[profile.value] or {})
+    unknown_pragmas: set[str] = pragmas.keys() - PRAGMAS
+    if unknown_pragmas:
+        raise ValueError(
+            f"Unknown SQLite settings in DATABASE.SQLITE.{profile.value}: "
+            f"{sorted(unknown_pragmas)}"
+        )
+    return pragmas
+
+
+def apply_sqlite_profile(engine: Engine, profile: SqliteProfile) -> None:
+    """
+    Set the profile's PRAGMAs on each connection as the engine opens it.
+    Connections already open are not changed, so call this before the engine
+    is first used. Engines for other databases are left alone.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas: dict[str, Any] = sqlite_pragmas(profile=profile)
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name.lower()} = {value}")
+        cursor.close()
@@ -0,0 +1,100 @@
+""" In-process cache of tag names to ids, so the import does not look tags up per note """
+
+from typing import Any, Iterable
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session
+
+
+class TagRegistry:
+    """
+    All rows of one tag table (WhereTag, WhenTag or ReferenceTag), loaded once
+    into a name to id map. Tags missing from the map are created in one
+    multi-row insert per batch of names.
+    The map stays consistent with the session: tags created since the last
+    commit are forgotten again if the session rolls back, and names not in the
+    map are looked up in the table before being created, so tags added by
+    other code are reused rather than duplicated.
+    """
+
+    def __init__(self, session: Session, tag_model: type[Any]) -> None:
+        self.session: Session = session
+        self.tag_model: type[Any] = tag_model
+        self.ids_by_name: dict[str, int] = {}
+        self.uncommitted_names: set[str] = set()
+        self.load()
+        event.listen(session, "after_commit", self._after_commit)
+        event.listen(session, "after_rollback", self._after_rollback)
+
+    def load(self) -> None:
+        self.ids_by_name = {
+            name: tag_id
+            for tag_id, name in self.session.execute(
+                select(self.tag_model.id, self.tag_model.name)
+            )
+        }
+        self.uncommitted_names = set()
+
+    def close(self) -> None:
+        """Stop following the session's commits and rollbacks"""
+        event.remove(self.session, "after_commit", self._after_commit)
+        event.remove(self.session, "after_rollback", self._after_rollback)
+
+    def __enter__(self) -> "TagRegistry":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids_by_name
+
+    def __len__(self) -> int:
+        return len(self.ids_by_name)
+
+    def id_for(self, name: str) -> int:
+        return self.ids_for(names=[name])[name]
+
+    def tag_for(self, name: str) -> Any:
+        """The tag object, from the session's identity map if already loaded"""
+        return self.session.get(self.tag_model, self.id_for(name=name))
+
+    def ids_for(self, names: Iterable[str]) -> dict[str, int]:
+        """
+        Returns the id of each tag name, creating the tags not in the database
+        Changes are flushed, not committed. The caller commits in batches.
+        """
+        names = set(names)
+        missing_names: set[str] = names - self.ids_by_name.keys()
+        if missing_names:
+            self._add(names=missing_names)
+        return {name: self.ids_by_name[name] for name in names}
+
+    def _add(self, names: set[str]) -> None:
+        # Tags may have been added outside the registry since it was loaded
+        for tag_id, name in self.session.execute(
+            select(self.tag_model.id, self.tag_model.name).where(
+                self.tag_model.name.in_(names)
+            )
+        ):
+            self.ids_by_name[name] = tag_id
+        new_names: list[str] = sorted(names - self.ids_by_name.keys())
+        if not new_names:
+            return
+
+        # Ids are assigned by SQLite, as the apps may be adding tags at the same time
+        table: Any = self.tag_model.__table__
+        for tag_id, name in self.session.execute(
+            insert(table).returning(table.c.id, table.c.name),
+            [{"name": name} for name in new_names],
+        ):
+            self.ids_by_name[name] = tag_id
+        self.uncommitted_names.update(new_names)
+
+    def _after_commit(self, session: Session) -> None:
+        self.uncommitted_names = set()
+
+    def _after_rollback(self, session: Session) -> None:
+        for name in self.uncommitted_names:
+            self.ids_by_name.pop(name, None)
+        self.uncommitted_names = set()
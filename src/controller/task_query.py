@@ -0,0 +1,241 @@
+""" Listing tasks by context and tag, sorted, one page at a time
+
+Pages are fetched by keyset rather than OFFSET: each page ends with a cursor
+holding the sort key of its last task, and the next page starts after that key.
+With the sort column indexed, fetching any page reads about one page of rows
+from the index, however far into the list it is and however large the table.
+"""
+
+import base64
+from dataclasses import dataclass, field
+import datetime as dt
+from enum import Enum
+import json
+from typing import Any, Optional
+
+from sqlalchemy import ColumnElement, Select, select, tuple_
+
+from src.controller.repository import LoadProfile, select_loaded
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    ReferenceTag,
+    Task,
+    WhenTag,
+    WhereTag,
+    cfg,
+    db,
+    project_tasks,
+    task_when_tags,
+    task_where_tags,
+    tasks_reference_tags,
+)
+
+TASK_LIST_PAGE_SIZE: int = cfg.TASK_LIST.PAGE_SIZE
+TASK_LIST_MAX_PAGE_SIZE: int = cfg.TASK_LIST.MAX_PAGE_SIZE
+
+
+class TaskSort(Enum):
+    CREATED = "created"
+    REMINDER = "reminder"  # Only tasks with a reminder
+    TITLE = "title"
+
+
+class SortOrder(Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+
+SORT_COLUMNS: dict[TaskSort, Any] = {
+    TaskSort.CREATED: Task.created,
+    TaskSort.REMINDER: Task.reminder_time,
+    TaskSort.TITLE: Task.title,
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class TaskFilter:
+    """
+    Tasks with any of the given tags of each kind, and in the project if given.
+    Filters left empty don't restrict the tasks.
+    """
+
+    where: list[str] = field(default_factory=list)
+    when: list[str] = field(default_factory=list)
+    reference: list[str] = field(default_factory=list)
+    project_id: Optional[int] = None
+
+
+@dataclass
+class TaskPage:
+    tasks: list[Task]
+    next_cursor: Optional[str]  # None on the last page
+
+
+def encode_cursor(sort: TaskSort, order: SortOrder, task: Task) -> str:
+    value: Any = getattr(task, SORT_COLUMNS[sort].key)
+    if isinstance(value, dt.datetime):
+        value = value.isoformat()
+    cursor: str = json.dumps([sort.value, order.value, value, task.id])
+    return base64.urlsafe_b64encode(cursor.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: TaskSort, order: SortOrder) -> tuple[Any, int]:
+    """
+    The sort key of the last task of the previous page.
+    Raises InvalidCursor if the cursor is malformed or was made for another
+    sort order, whose keys mean something else.
+    """
+    try:
+        cursor_sort, cursor_order, value, task_id = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        if sort == TaskSort.CREATED or sort == TaskSort.REMINDER:
+            value = dt.datetime.fromisoformat(value)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Malformed cursor: {cursor}") from e
+    if cursor_sort != sort.value or cursor_order != order.value:
+        raise InvalidCursor(
+            f"The cursor is for tasks sorted by {cursor_sort} {cursor_order}"
+        )
+    return value, task_id
+
+
+def tagged_task_ids(
+    association_table: Any, tag_id_column: str, tag_model: type[Any], names: list[str]
+) -> Select:
+    association_tag_id: Any = association_table.c[tag_id_column]
+    return (
+        select(association_table.c.task_id)
+        .join(tag_model, tag_model.id == association_tag_id)
+        .where(tag_model.name.in_(names))
+    )
+
+
+def filter_conditions(task_filter: TaskFilter) -> list[ColumnElement[bool]]:
+    conditions: list[ColumnElement[bool]] = []
+    if task_filter.where:
+        conditions.append(
+            Task.id.in_(
+                tagged_task_ids(
+                    task_where_tags, "where_tag_id", WhereTag, task_filter.where
+                )
+            )
+        )
+    if task_filter.when:
+        conditions.append(
+            Task.id.in_(
+                tagged_task_ids(
+                    task_when_tags, "when_tag_id", WhenTag, task_filter.when
+                )
+            )
+        )
+    if task_filter.reference:
+        conditions.append(
+            Task.id.in_(
+                tagged_task_ids(
+                    tasks_reference_tags,
+                    "reference_tag_id",
+                    ReferenceTag,
+                    task_filter.reference,
+                )
+            )
+        )
+    if task_filter.project_id is not None:
+        conditions.append(
+            Task.id.in_(
+                select(project_tasks.c.task_id).where(
+                    project_tasks.c.project_id == task_filter.project_id
+                )
+            )
+        )
+    return conditions
+
+
+def page_size(limit: int) -> int:
+    return min(max(limit, 1), TASK_LIST_MAX_PAGE_SIZE)
+
+
+def task_page_query(
+    task_filter: TaskFilter = TaskFilter(),
+    sort: TaskSort = TaskSort.CREATED,
+    order: SortOrder = SortOrder.ASC,
+    limit: int = TASK_LIST_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> Select:
+    """
+    The query for one page of tasks, and one more to tell if there is a next
+    page, for list_tasks or a session of another kind, e.g. an AsyncSession.
+    Tags are loaded with the page by the list loading profile, in one query
+    per kind of tag.
+    """
+    sort_column: Any = SORT_COLUMNS[sort]
+    sort_key: Any = tuple_(sort_column, Task.id)
+
+    query: Select = select_loaded(model=Task, profile=LoadProfile.LIST).where(
+        *filter_conditions(task_filter=task_filter)
+    )
+    if sort == TaskSort.REMINDER:
+        query = query.where(Task.reminder_time.is_not(None))
+    if cursor is not None:
+        after_key: Any = tuple_(*decode_cursor(cursor=cursor, sort=sort, order=order))
+        query = query.where(
+            sort_key > after_key if order == SortOrder.ASC else sort_key < after_key
+        )
+    if order == SortOrder.ASC:
+        query = query.order_by(sort_column, Task.id)
+    else:
+        query = query.order_by(sort_column.desc(), Task.id.desc())
+    return query.limit(page_size(limit=limit) + 1)
+
+
+def task_page(
+    tasks: list[Task], sort: TaskSort, order: SortOrder, limit: int
+) -> TaskPage:
+    """The page from the tasks task_page_query returned"""
+    limit = page_size(limit=limit)
+    next_cursor: Optional[str] = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(sort=sort, order=order, task=tasks[-1])
+    return TaskPage(tasks=tasks, next_cursor=next_cursor)
+
+
+def list_tasks(
+    task_filter: TaskFilter = TaskFilter(),
+    sort: TaskSort = TaskSort.CREATED,
+    order: SortOrder = SortOrder.ASC,
+    limit: int = TASK_LIST_PAGE_SIZE,
+    cursor: Optional[str] = None,
+) -> TaskPage:
+    """
+    One page of tasks matching the filter, sorted by the sort column and then
+    by id, so tasks with the same value keep a stable order across pages.
+    Pass the next_cursor of a page as cursor to get the page after it.
+    """
+    query: Select = task_page_query(
+        task_filter=task_filter, sort=sort, order=order, limit=limit, cursor=cursor
+    )
+    return task_page(
+        tasks=list(db.session.scalars(query)), sort=sort, order=order, limit=limit
+    )
+
+
+def isoformat(value: Optional[dt.datetime]) -> Optional[str]:
+    return None if value is None else value.isoformat()
+
+
+def task_summary(task: Task) -> dict[str, Any]:
+    """The task without its body, as listed"""
+    return {
+        "id": task.id,
+        "title": task.title,
+        "created": isoformat(task.created),
+        "updated": isoformat(task.updated),
+        "reminder_time": isoformat(task.reminder_time),
+        "where_tag": None if task.where_tag is None else task.where_tag.name,
+        "when_tag": None if task.when_tag is None else task.when_tag.name,
+        "reference_tags": sorted(tag.name for tag in task.reference_tags),
+    }
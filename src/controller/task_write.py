@@ -0,0 +1,117 @@
+""" Adding and changing tasks from the apps' JSON bodies, the same way in both
+
+The bodies are validated by TaskIn and TaskPatch. The writes run on a sync
+Session: the Flask app's, or the async app's through AsyncSession.run_sync.
+Both end with the caller's commit.
+"""
+
+import datetime as dt
+from typing import Annotated, Any, Optional
+
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    MAX_BODY_TEXT_LEN,
+    MAX_TAG_NAME_LEN,
+    MAX_TITLE_LEN,
+    ReferenceTag,
+    Task,
+    WhenTag,
+    WhereTag,
+)
+
+
+class TaskIn(BaseModel):
+    title: str = Field(max_length=MAX_TITLE_LEN)
+    body_text: str = Field(default="", max_length=MAX_BODY_TEXT_LEN)
+    reminder_time: Optional[dt.datetime] = None  # UTC if it has no time zone
+    where_tag: Optional[str] = None  # One of the configured where tags
+    when_tag: Optional[str] = None  # One of the configured when tags
+    reference_tags: list[Annotated[str, Field(max_length=MAX_TAG_NAME_LEN)]] = []
+
+
+class TaskPatch(BaseModel):
+    """Only the fields sent are changed"""
+
+    title: Optional[str] = Field(default=None, max_length=MAX_TITLE_LEN)
+    body_text: Optional[str] = Field(default=None, max_length=MAX_BODY_TEXT_LEN)
+    reminder_time: Optional[dt.datetime] = None
+    where_tag: Optional[str] = None
+    when_tag: Optional[str] = None
+    reference_tags: Optional[
+        list[Annotated[str, Field(max_length=MAX_TAG_NAME_LEN)]]
+    ] = None
+
+
+class UnknownTag(ValueError):
+    """A where or when tag that is not in the database"""
+
+
+def utc_naive(value: Optional[dt.datetime]) -> Optional[dt.datetime]:
+    """Times are stored as naive UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(dt.UTC).replace(tzinfo=None)
+
+
+def tag_named(
+    session: Session, model: type[WhereTag] | type[WhenTag], name: Optional[str]
+) -> Optional[WhereTag | WhenTag]:
+    """The where or when tag, which must already exist"""
+    if name is None:
+        return None
+    tag: Optional[WhereTag | WhenTag] = session.scalar(
+        select(model).where(model.name == name)
+    )
+    if tag is None:
+        raise UnknownTag(f"Unknown tag: {name}")
+    return tag
+
+
+def reference_tags_named(session: Session, names: list[str]) -> list[ReferenceTag]:
+    """The reference tags, adding the ones that don't exist yet"""
+    tags: dict[str, ReferenceTag] = {
+        tag.name: tag
+        for tag in session.scalars(
+            select(ReferenceTag).where(ReferenceTag.name.in_(names))
+        )
+    }
+    for name in names:
+        if name not in tags:
+            tags[name] = ReferenceTag(name=name)
+            session.add(tags[name])
+    return [tags[name] for name in dict.fromkeys(names)]
+
+
+def apply_task_fields(session: Session, task: Task, fields: dict[str, Any]) -> None:
+    """Raises UnknownTag for a where or when tag that doesn't exist"""
+    # Not flushed part way, which would write the task before all its changes
+    with session.no_autoflush:
+        for name in ("title", "body_text"):
+            if fields.get(name) is not None:
+                setattr(task, name, fields[name])
+        if "reminder_time" in fields:
+            task.reminder_time = utc_naive(fields["reminder_time"])
+        if "where_tag" in fields:
+            task.where_tag = tag_named(
+                session=session, model=WhereTag, name=fields["where_tag"]
+            )
+        if "when_tag" in fields:
+            task.when_tag = tag_named(
+                session=session, model=WhenTag, name=fields["when_tag"]
+            )
+        if "reference_tags" in fields:
+            task.reference_tags = reference_tags_named(
+                session=session, names=fields["reference_tags"]
+            )
+
+
+def add_task(session: Session, fields: dict[str, Any]) -> Task:
+    """A new task with the fields of a TaskIn, added to the session"""
+    now: dt.datetime = dt.datetime.now(dt.UTC).replace(tzinfo=None)
+    task = Task(created=now, updated=now, reference_tags=[])
+    session.add(task)
+    apply_task_fields(session=session, task=task, fields=fields)
+    return task
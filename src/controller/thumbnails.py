@@ -0,0 +1,169 @@
+""" Thumbnails of image resources, made once per size and kept by hash and size
+
+A thumbnail is made from its image the first time it is asked for, or ahead of
+time for every image and each of THUMBNAIL_SIZES by running this module, and
+stored in a ResourceStore under <hash>_<width>x<height>.<jpg|png>. Afterwards
+it is served from that file, without reading or decoding the image again.
+Only THUMBNAIL_SIZES are made, so requests can't fill the store with sizes.
+"""
+
+import argparse
+import os
+from io import BytesIO
+from typing import BinaryIO, NamedTuple, Optional
+
+from flask import Flask
+from PIL import Image, ImageOps
+from sqlalchemy import select
+
+from src.controller.resource_access import iter_resource_data, resource_mime
+from src.controller.resource_store import ResourceStore
+from src.controller.save_enex_backup_to_flask_mysql_db import (
+    DATABASE_PATHNAME,
+    RESOURCE_STORE_FOLDER,
+    Resource,
+    cfg,
+    create_import_app,
+    db,
+)
+from src.config.config_main import PROJECT_FOLDER
+from src.config.config_logging import logger
+
+THUMBNAIL_FOLDER: str = os.path.join(PROJECT_FOLDER, cfg.RESOURCES.THUMBNAIL_FOLDER)
+THUMBNAIL_SIZES: list[tuple[int, int]] = [
+    (width, height) for width, height in cfg.RESOURCES.THUMBNAIL_SIZES
+]
+THUMBNAIL_QUALITY: int = cfg.RESOURCES.THUMBNAIL_QUALITY
+THUMBNAIL_MIMES: dict[str, str] = {"jpg": "image/jpeg", "png": "image/png"}
+
+
+class Thumbnail(NamedTuple):
+    path: str
+    key: str  # Also its ETag, as a thumbnail never changes
+    mime: str
+
+
+def thumbnail_key(resource_hash: str, width: int, height: int, extension: str) -> str:
+    # Starts with the image's hash, so it is stored in the same subfolder
+    return f"{resource_hash}_{width}x{height}.{extension}"
+
+
+def stored_thumbnail(
+    store: ResourceStore, resource_hash: str, width: int, height: int
+) -> Optional[Thumbnail]:
+    for extension, mime in THUMBNAIL_MIMES.items():
+        key: str = thumbnail_key(
+            resource_hash=resource_hash, width=width, height=height, extension=extension
+        )
+        if store.exists(hash=key):
+            return Thumbnail(path=store.path_for(hash=key), key=key, mime=mime)
+    return None
+
+
+def make_thumbnail(image_file: BinaryIO, width: int, height: int) -> tuple[bytes, str]:
+    """
+    The image scaled down to fit width x height, and its file extension: PNG
+    if it has transparency, otherwise JPEG. JPEGs are decoded at the smallest
+    scale still larger than the thumbnail, rather than at full size.
+    """
+    with Image.open(image_file) as image:
+        # Larger than the box both ways, in case the image is then rotated
+        image.draft("RGB", (max(width, height), max(width, height)))
+        thumbnail: Image.Image = ImageOps.exif_transpose(image)
+        thumbnail.thumbnail((width, height))
+        output = BytesIO()
+        if thumbnail.mode in ("RGBA", "LA") or (
+            thumbnail.mode == "P" and "transparency" in thumbnail.info
+        ):
+            thumbnail.save(output, format="PNG", optimize=True)
+            return output.getvalue(), "png"
+        thumbnail.convert("RGB").save(
+            output, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True
+        )
+        return output.getvalue(), "jpg"
+
+
+def thumbnail_for(
+    resource: Resource,
+    width: int,
+    height: int,
+    thumbnail_folder: str = THUMBNAIL_FOLDER,
+    resource_folder: str = RESOURCE_STORE_FOLDER,
+) -> Optional[Thumbnail]:
+    """
+    The stored thumbnail of the image at this size, made and stored first if
+    needed. None if the resource isn't an image that can be read.
+    """
+    store = ResourceStore(folder=thumbnail_folder)
+    thumbnail: Optional[Thumbnail] = stored_thumbnail(
+        store=store, resource_hash=resource.hash, width=width, height=height
+    )
+    if thumbnail is not None:
+        return thumbnail
+    if not resource_mime(resource=resource).startswith("image/"):
+        return None
+
+    try:
+        image_data = BytesIO(
+            b"".join(
+                iter_resource_data(resource=resource, resource_folder=resource_folder)
+            )
+        )
+        data, extension = make_thumbnail(
+            image_file=image_data, width=width, height=height
+        )
+    # OSError includes missing data and files Pillow can't identify; corrupt
+    # images can also raise ValueError or SyntaxError as they are decoded
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+        logger.warning(
+            msg=f"Cannot make a thumbnail of resource with hash: {resource.hash} "
+            f"due to error: {e}"
+        )
+        return None
+    key: str = thumbnail_key(
+        resource_hash=resource.hash, width=width, height=height, extension=extension
+    )
+    # Written atomically, so a request making the same thumbnail does no harm
+    store.put(hash=key, data=data)
+    return Thumbnail(
+        path=store.path_for(hash=key), key=key, mime=THUMBNAIL_MIMES[extension]
+    )
+
+
+def precompute_thumbnails(
+    sizes: list[tuple[int, int]] = THUMBNAIL_SIZES,
+    thumbnail_folder: str = THUMBNAIL_FOLDER,
+    resource_folder: str = RESOURCE_STORE_FOLDER,
+) -> int:
+    """Makes the thumbnails of every image not made yet. Returns how many were made"""
+    store = ResourceStore(folder=thumbnail_folder)
+    made: int = 0
+    for resource in db.session.scalars(
+        select(Resource)
+        .where(Resource.mime.like("image/%"))
+        .execution_options(yield_per=1_000)
+    ):
+        for width, height in sizes:
+            if stored_thumbnail(
+                store=store, resource_hash=resource.hash, width=width, height=height
+            ):
+                continue
+            if thumbnail_for(
+                resource=resource,
+                width=width,
+                height=height,
+                thumbnail_folder=thumbnail_folder,
+                resource_folder=resource_folder,
+            ):
+                made += 1
+    return made
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database", default=DATABASE_PATHNAME)
+    args = parser.parse_args()
+
+    app: Flask = create_import_app(database_pathname=args.database)
+    with app.app_context():
+        logger.info(msg=f"Made {precompute_thumbnails()} thumbnails")
@@ -0,0 +1,107 @@
+""" Fixtures shared by the tests: small ENEX exports written to a temporary folder
+
+Run the tests from the project folder, as the config is read from there, e.g.
+    python -m pytest -q
+"""
+
+import base64
+import hashlib
+import os
+from typing import Callable, Iterable, NamedTuple, Optional
+
+import pytest
+
+ENEX_HEADER: str = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<!DOCTYPE en-export SYSTEM "http://xml.evernote.com/pub/evernote-export4.dtd">\n'
+    '<en-export export-date="20231020T000000Z" application="Evernote">\n'
+)
+ENEX_FOOTER: str = "</en-export>\n"
+ENML_HEADER: str = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+    '<!DOCTYPE en-note SYSTEM "http://xml.evernote.com/pub/enml2.dtd">\n'
+)
+
+
+class EnexNote(NamedTuple):
+    title: str
+    content: str  # ENML inside <en-note>
+    created: str = "20231001T100000Z"
+    updated: str = "20231002T100000Z"
+    tags: Iterable[str] = ()
+    reminder_time: Optional[str] = None
+    resources: Iterable[bytes] = ()
+
+
+def resource_hash(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+def enex_note_xml(note: EnexNote) -> str:
+    tags: str = "".join(f"<tag>{tag}</tag>" for tag in note.tags)
+    reminder: str = (
+        f"<reminder-time>{note.reminder_time}</reminder-time>"
+        if note.reminder_time
+        else ""
+    )
+    resources: str = "".join(
+        "<resource>"
+        f'<data encoding="base64">\n{base64.encodebytes(data).decode()}</data>'
+        "<mime>image/png</mime>"
+        "<resource-attributes>"
+        f"<file-name>{resource_hash(data)}.png</file-name>"
+        "</resource-attributes>"
+        "</resource>"
+        for data in note.resources
+    )
+    return (
+        f"<note><title>{note.title}</title>"
+        f"<created>{note.created}</created><updated>{note.updated}</updated>"
+        f"{tags}<note-attributes>{reminder}</note-attributes>"
+        f"<content><![CDATA[{ENML_HEADER}<en-note>{note.content}</en-note>]]>"
+        f"</content>{resources}</note>\n"
+    )
+
+
+@pytest.fixture
+def write_enex(tmp_path) -> Callable[..., str]:
+    """Writes the notes as an ENEX export and returns its path"""
+
+    def write(notes: Iterable[EnexNote], name: str = "export.enex") -> str:
+        path: str = os.path.join(tmp_path, name)
+        with open(path, "w") as fp:
+            fp.write(ENEX_HEADER)
+            for note in notes:
+                fp.write(enex_note_xml(note=note))
+            fp.write(ENEX_FOOTER)
+        return path
+
+    return write
+
+
+@pytest.fixture
+def database_pathname(tmp_path) -> str:
+    # Absolute, as Flask-SQLAlchemy resolves relative paths to its instance folder
+    return os.path.join(tmp_path, "notes_data.db")
+
+
+@pytest.fixture
+def import_enex(database_pathname, tmp_path) -> Callable[..., None]:
+    """Imports an ENEX file into the test database, every note each time"""
+    from src.controller.resource_store import ResourceStorage
+    from src.controller.save_enex_backup_to_flask_mysql_db import (
+        save_enex_backup_to_mysql_db,
+    )
+
+    def import_file(path: str, **options) -> None:
+        save_enex_backup_to_mysql_db(
+            enex_backup_pathname=path,
+            database_pathname=database_pathname,
+            resource_folder=os.path.join(tmp_path, "resources"),
+            resource_storage=options.pop("resource_storage", ResourceStorage.FILES),
+            incremental=options.pop("incremental", False),
+            resume=options.pop("resume", False),
+            **options,
+        )
+
+    return import_file
@@ -0,0 +1,55 @@
+from typing import Iterator
+
+import pytest
+from flask.testing import FlaskClient
+
+from tests.conftest import EnexNote
+
+
+@pytest.fixture
+def client(write_enex, import_enex, database_pathname) -> Iterator[FlaskClient]:
+    from src.controller.app import create_app
+
+    import_enex(
+        path=write_enex(notes=[EnexNote(title="Call", content="Bank", tags=["@Phone"])])
+    )
+    app = create_app(database_pathname=database_pathname)
+    yield app.test_client()
+    app.extensions["read_cache"].stop()
+    app.extensions["reminder_scheduler"].stop()
+
+
+def test_task_is_added_and_changed(client) -> None:
+    added = client.post(
+        "/tasks",
+        json={"title": "Plan", "where_tag": "@Phone", "reference_tags": ["trip"]},
+    )
+    assert added.status_code == 201
+    assert added.json["body_text"] == ""
+    task_id: int = added.json["id"]
+
+    changed = client.patch(
+        f"/tasks/{task_id}",
+        json={"body_text": "Book trains", "reminder_time": "2023-10-02T09:00:00+02:00"},
+    )
+    assert changed.status_code == 200
+    assert changed.json["title"] == "Plan"
+    assert changed.json["body_text"] == "Book trains"
+    assert changed.json["reminder_time"].startswith("2023-10-02T07:00:00")
+    assert changed.json["where_tag"] == "@Phone"
+    assert changed.json["reference_tags"] == ["trip"]
+
+    # Read again, not from what was written
+    assert client.get(f"/tasks/{task_id}").json["body_text"] == "Book trains"
+    assert task_id in [task["id"] for task in client.get("/tasks").json["tasks"]]
+
+
+def test_invalid_writes_are_refused(client) -> None:
+    assert client.post("/tasks", json={"body_text": "No title"}).status_code == 422
+    assert (
+        client.post("/tasks", json={"title": "Plan", "where_tag": "@Moon"}).status_code
+        == 422
+    )
+    assert client.patch("/tasks/1", json={"when_tag": "Never"}).status_code == 422
+    assert client.patch("/tasks/99", json={"title": "Plan"}).status_code == 404
+    assert client.get("/tasks/1").json["title"] == "Call"
@@ -0,0 +1,146 @@
+import asyncio
+import datetime as dt
+import sqlite3
+from typing import Any, Awaitable, Callable
+
+import httpx
+import pytest
+
+from tests.conftest import EnexNote
+
+
+@pytest.fixture
+def with_async_client(database_pathname) -> Callable[..., None]:
+    """Runs the test with a client of the async app, started as uvicorn would"""
+    from src.controller.async_app import create_async_app
+
+    def run(test: Callable[[httpx.AsyncClient], Awaitable[None]]) -> None:
+        async def run_test() -> None:
+            app = create_async_app(
+                database_pathname=database_pathname, long_poll_check_seconds=0.01
+            )
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(
+                    transport=httpx.ASGITransport(app=app), base_url="http://test"
+                ) as client:
+                    await test(client)
+
+        asyncio.run(run_test())
+
+    return run
+
+
+def changed_rows(changes: dict[str, Any], table: str) -> list[tuple[bool, dict]]:
+    return [
+        (change["deleted"], change["row"])
+        for change in changes["changes"]
+        if change["table"] == table
+    ]
+
+
+def test_waiting_clients_get_imports_and_deletes(
+    write_enex, import_enex, with_async_client, database_pathname
+) -> None:
+    import_enex(path=write_enex(notes=[EnexNote(title="Call", content="Bank")]))
+
+    async def test(client: httpx.AsyncClient) -> None:
+        first: dict[str, Any] = (await client.get("/sync")).json()
+        assert not first["has_more"]
+        since: int = first["next_since"]
+
+        # Nothing yet
+        waited = await client.get("/sync", params={"since": since, "wait": 0.05})
+        assert waited.json()["changes"] == []
+
+        waiter = asyncio.create_task(
+            client.get("/sync", params={"since": since, "wait": 10})
+        )
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await asyncio.to_thread(
+            import_enex,
+            path=write_enex(
+                notes=[
+                    EnexNote(title="Call", content="Bank"),
+                    EnexNote(title="Plan", content="Trip", tags=["@Phone"]),
+                ],
+                name="second.enex",
+            ),
+        )
+        imported: dict[str, Any] = (await asyncio.wait_for(waiter, 5)).json()
+        [(deleted, task)] = changed_rows(changes=imported, table="tasks")
+        assert not deleted and task["title"] == "Plan"
+        since = imported["next_since"]
+
+        waiter = asyncio.create_task(
+            client.get("/sync", params={"since": since, "wait": 10})
+        )
+        await asyncio.sleep(0.05)
+        with sqlite3.connect(database_pathname) as connection:
+            connection.execute("DELETE FROM tasks WHERE id = ?", (task["id"],))
+        deletes: dict[str, Any] = (await asyncio.wait_for(waiter, 5)).json()
+        assert changed_rows(changes=deletes, table="tasks") == [
+            (True, {"id": task["id"]})
+        ]
+
+    with_async_client(test)
+
+
+def test_written_task_wakes_waiting_clients(
+    write_enex, import_enex, with_async_client
+) -> None:
+    import_enex(
+        path=write_enex(notes=[EnexNote(title="Call", content="Bank", tags=["@Phone"])])
+    )
+
+    async def test(client: httpx.AsyncClient) -> None:
+        since: int = (await client.get("/sync")).json()["next_since"]
+        waiter = asyncio.create_task(
+            client.get("/sync", params={"since": since, "wait": 10})
+        )
+        await asyncio.sleep(0.05)
+
+        added = await client.post(
+            "/tasks", json={"title": "Plan", "where_tag": "@Phone"}
+        )
+        assert added.status_code == 201
+        changes: dict[str, Any] = (await asyncio.wait_for(waiter, 1)).json()
+        assert (False, added.json()["id"]) in [
+            (deleted, row["id"])
+            for deleted, row in changed_rows(changes=changes, table="tasks")
+        ]
+
+        changed = await client.patch(
+            f"/tasks/{added.json()['id']}", json={"when_tag": "Never"}
+        )
+        assert changed.status_code == 422
+
+    with_async_client(test)
+
+
+def test_written_reminder_is_scheduled(database_pathname) -> None:
+    from src.controller.async_app import create_async_app
+    from src.controller.reminders import utc_now
+    from src.controller.save_enex_backup_to_flask_mysql_db import create_import_app
+
+    create_import_app(database_pathname=database_pathname)
+    app = create_async_app(database_pathname=database_pathname)
+    due: dt.datetime = utc_now() + dt.timedelta(hours=1)
+
+    async def run_test() -> None:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://test"
+            ) as client:
+                added = await client.post(
+                    "/tasks", json={"title": "Call", "reminder_time": due.isoformat()}
+                )
+                assert added.status_code == 201
+                # Once the scheduler has loaded the reminders, if not yet
+                for _ in range(500):
+                    if app.state.reminder_scheduler.next_due() == due:
+                        break
+                    await asyncio.sleep(0.01)
+                assert app.state.reminder_scheduler.next_due() == due
+
+    asyncio.run(run_test())
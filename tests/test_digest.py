@@ -0,0 +1,45 @@
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+from sqlalchemy.orm import Session
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+
+def test_reminders_of_the_local_day_are_in_the_digest(database_pathname) -> None:
+    from src.controller.digest import build_digest, render_digest_text
+    from src.controller.save_enex_backup_to_flask_mysql_db import (
+        Task,
+        create_import_app,
+        db,
+    )
+
+    with create_import_app(database_pathname=database_pathname).app_context():
+        # Stored in UTC: New York is 4 hours behind in October
+        for title, reminder_time in (
+            ("Late yesterday", dt.datetime(2023, 10, 2, 3, 59)),
+            ("Early today", dt.datetime(2023, 10, 2, 4, 0)),
+            ("Late today", dt.datetime(2023, 10, 3, 3, 59)),
+            ("Early tomorrow", dt.datetime(2023, 10, 3, 4, 0)),
+        ):
+            db.session.add(Task(title=title, reminder_time=reminder_time))
+        db.session.commit()
+
+        with Session(db.engine) as session:
+            digest = build_digest(
+                session=session, day=dt.date(2023, 10, 2), time_zone=NEW_YORK
+            )
+
+    assert [task.title for task in digest.reminders] == ["Early today", "Late today"]
+    assert "  00:00  Early today" in render_digest_text(digest=digest)
+    assert "  23:59  Late today" in render_digest_text(digest=digest)
+
+
+def test_day_bounds_follow_clock_changes() -> None:
+    from src.controller.digest import day_bounds_utc
+
+    # The clocks went back an hour on November 5th, 2023
+    assert day_bounds_utc(day=dt.date(2023, 11, 5), time_zone=NEW_YORK) == (
+        dt.datetime(2023, 11, 5, 4, 0),
+        dt.datetime(2023, 11, 6, 5, 0),
+    )
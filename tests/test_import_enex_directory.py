@@ -0,0 +1,108 @@
+import os
+import sqlite3
+
+from src.controller.import_enex_directory import import_enex_directory
+from src.controller.resource_store import ResourceStorage
+from tests.conftest import EnexNote, resource_hash
+
+
+def rows(database_pathname: str, sql: str) -> list[tuple]:
+    with sqlite3.connect(database_pathname) as connection:
+        return connection.execute(sql).fetchall()
+
+
+def write_files(write_enex, pictures: list[bytes]) -> str:
+    for file_no in range(3):
+        path: str = write_enex(
+            notes=[
+                EnexNote(
+                    title=f"File {file_no} note {note_no}",
+                    content="Text",
+                    tags=["@Phone"],
+                    resources=[pictures[note_no % len(pictures)]],
+                )
+                for note_no in range(5)
+            ],
+            name=f"export_{file_no}.enex",
+        )
+    return os.path.dirname(path)
+
+
+def import_directory(directory: str, database_pathname: str, tmp_path, **options):
+    return import_enex_directory(
+        directory_or_glob=directory,
+        database_pathname=database_pathname,
+        file_workers=2,
+        resource_folder=os.path.join(tmp_path, "resources"),
+        commit_every=2,
+        **options,
+    )
+
+
+def test_directory_is_written_in_batches(
+    write_enex, database_pathname, tmp_path
+) -> None:
+    pictures: list[bytes] = [bytes([no]) * 1_000 for no in range(2)]
+    directory: str = write_files(write_enex=write_enex, pictures=pictures)
+
+    summary = import_directory(
+        directory=directory,
+        database_pathname=database_pathname,
+        tmp_path=tmp_path,
+        resource_storage=ResourceStorage.BLOB,
+        incremental=True,
+    )
+
+    assert summary.notes_written == 15
+    assert all(file.error is None for file in summary.files)
+    assert rows(database_pathname, "SELECT count(*) FROM tasks") == [(15,)]
+    assert rows(database_pathname, "SELECT count(*) FROM imported_files") == [(3,)]
+    assert rows(database_pathname, "SELECT count(*) FROM import_checkpoints") == [(0,)]
+    # The bytes were sent with the batches and written once per hash
+    assert sorted(rows(database_pathname, "SELECT hash, data FROM resources")) == (
+        sorted((resource_hash(picture), picture) for picture in pictures)
+    )
+
+
+def test_unchanged_directory_is_skipped(
+    write_enex, database_pathname, tmp_path
+) -> None:
+    directory: str = write_files(write_enex=write_enex, pictures=[b"picture"])
+    import_directory(
+        directory=directory,
+        database_pathname=database_pathname,
+        tmp_path=tmp_path,
+        incremental=True,
+    )
+
+    summary = import_directory(
+        directory=directory,
+        database_pathname=database_pathname,
+        tmp_path=tmp_path,
+        incremental=True,
+    )
+
+    assert [file.skipped for file in summary.files] == [True, True, True]
+    assert rows(database_pathname, "SELECT count(*) FROM tasks") == [(15,)]
+    assert os.path.exists(
+        os.path.join(tmp_path, "resources", resource_hash(b"picture")[:2])
+    )
+
+
+def test_file_that_cannot_be_parsed_is_reported(
+    write_enex, database_pathname, tmp_path
+) -> None:
+    directory: str = write_files(write_enex=write_enex, pictures=[b"picture"])
+    with open(os.path.join(directory, "broken.enex"), "w") as fp:
+        fp.write("<en-export><note><title>Cut off")
+
+    summary = import_directory(
+        directory=directory,
+        database_pathname=database_pathname,
+        tmp_path=tmp_path,
+        incremental=True,
+    )
+
+    errors = {os.path.basename(file.path): file.error for file in summary.files}
+    assert errors["broken.enex"] is not None
+    assert rows(database_pathname, "SELECT count(*) FROM tasks") == [(15,)]
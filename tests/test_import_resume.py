@@ -0,0 +1,105 @@
+import logging
+import os
+import sqlite3
+
+import pytest
+
+from src.config.config_logging import logger
+from tests.conftest import EnexNote
+
+TITLES: list[str] = [f"Note {note_no}" for note_no in range(10)]
+
+
+def rows(database_pathname: str, sql: str) -> list[tuple]:
+    with sqlite3.connect(database_pathname) as connection:
+        return connection.execute(sql).fetchall()
+
+
+@pytest.fixture
+def interrupt_at_checkpoint(monkeypatch):
+    """Fails the import as it saves its checkpoint_no'th checkpoint, uncommitted"""
+    from src.controller import save_enex_backup_to_flask_mysql_db as models
+
+    def interrupt(checkpoint_no: int) -> None:
+        save_checkpoint = models.save_checkpoint
+        saved: list[int] = []
+
+        def save_or_fail(**kwargs) -> None:
+            saved.append(kwargs["note_no"])
+            if len(saved) == checkpoint_no:
+                raise KeyboardInterrupt
+            save_checkpoint(**kwargs)
+
+        monkeypatch.setattr(models, "save_checkpoint", save_or_fail)
+
+    return interrupt
+
+
+def write_notes(write_enex) -> str:
+    return write_enex(notes=[EnexNote(title=title, content=title) for title in TITLES])
+
+
+def test_resumed_import_writes_every_note_once(
+    write_enex,
+    import_enex,
+    database_pathname,
+    interrupt_at_checkpoint,
+    monkeypatch,
+    caplog,
+) -> None:
+    path: str = write_notes(write_enex=write_enex)
+    # The third batch, notes 6 to 8, is flushed but never committed
+    interrupt_at_checkpoint(checkpoint_no=3)
+    with pytest.raises(KeyboardInterrupt):
+        import_enex(path=path, resume=True, commit_every=3)
+
+    assert rows(database_pathname, "SELECT title FROM notes ORDER BY id") == [
+        (title,) for title in TITLES[:6]
+    ]
+    assert rows(database_pathname, "SELECT last_note_no FROM import_checkpoints") == [
+        (5,)
+    ]
+
+    monkeypatch.undo()
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        import_enex(path=path, resume=True, commit_every=3)
+
+    assert "from note 6" in caplog.text
+    assert rows(database_pathname, "SELECT title FROM notes ORDER BY id") == [
+        (title,) for title in TITLES
+    ]
+    assert rows(database_pathname, "SELECT count(*) FROM import_checkpoints") == [(0,)]
+    assert rows(database_pathname, "SELECT count(*) FROM imported_files") == [(1,)]
+
+
+def test_resumed_directory_import_writes_every_note_once(
+    write_enex, database_pathname, tmp_path, interrupt_at_checkpoint, monkeypatch
+) -> None:
+    from src.controller.import_enex_directory import import_enex_directory
+
+    directory: str = os.path.dirname(write_notes(write_enex=write_enex))
+
+    def import_directory():
+        return import_enex_directory(
+            directory_or_glob=directory,
+            database_pathname=database_pathname,
+            file_workers=1,
+            resource_folder=os.path.join(tmp_path, "resources"),
+            incremental=False,
+            resume=True,
+            commit_every=3,
+        )
+
+    interrupt_at_checkpoint(checkpoint_no=3)
+    with pytest.raises(KeyboardInterrupt):
+        import_directory()
+    assert rows(database_pathname, "SELECT count(*) FROM notes") == [(6,)]
+
+    monkeypatch.undo()
+    summary = import_directory()
+
+    assert summary.notes_written == 4
+    assert rows(database_pathname, "SELECT title FROM notes ORDER BY id") == [
+        (title,) for title in TITLES
+    ]
+    assert rows(database_pathname, "SELECT count(*) FROM import_checkpoints") == [(0,)]
@@ -0,0 +1,271 @@
+import logging
+import sqlite3
+
+from sqlalchemy import Engine, event
+
+from src.config.config_logging import logger
+from tests.conftest import EnexNote
+
+
+def rows(database_pathname: str, sql: str) -> list[tuple]:
+    with sqlite3.connect(database_pathname) as connection:
+        return connection.execute(sql).fetchall()
+
+
+def test_import_adds_tasks_notes_and_tags(
+    write_enex, import_enex, database_pathname
+) -> None:
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(title="Call bank", content="Loan", tags=["@Phone", "money"]),
+                EnexNote(title="Recipe", content="Soup", tags=["recipes"]),
+            ]
+        )
+    )
+    assert rows(database_pathname, "SELECT title FROM tasks") == [("Call bank",)]
+    assert rows(database_pathname, "SELECT title FROM notes") == [("Recipe",)]
+    assert rows(
+        database_pathname,
+        "SELECT t.title, w.name FROM tasks t "
+        "JOIN task_where_tags_association a ON a.task_id = t.id "
+        "JOIN where_tags_table w ON w.id = a.where_tag_id",
+    ) == [("Call bank", "@Phone")]
+    assert rows(
+        database_pathname,
+        "SELECT n.title, r.name FROM notes n "
+        "JOIN note_reference_tags_association a ON a.note_id = n.id "
+        "JOIN reference_tags r ON r.id = a.reference_tag_id",
+    ) == [("Recipe", "recipes")]
+
+
+def test_import_gets_ids_from_sqlite_alongside_other_writers(
+    write_enex, import_enex, database_pathname
+) -> None:
+    import_enex(
+        path=write_enex(notes=[EnexNote(title="First", content="a", tags=["@Phone"])])
+    )
+
+    def add_task_first(conn, cursor, statement, *args) -> None:
+        # Another writer adds a task just before the import inserts its own
+        if statement.startswith("INSERT INTO tasks") and not added:
+            added.append(True)
+            with sqlite3.connect(database_pathname) as connection:
+                connection.execute(
+                    "INSERT INTO tasks (title, body_text, created, updated) "
+                    "VALUES ('Added by the app', '', '2023-01-01', '2023-01-01')"
+                )
+
+    added: list[bool] = []
+    event.listen(Engine, "before_cursor_execute", add_task_first)
+    try:
+        import_enex(
+            path=write_enex(
+                notes=[EnexNote(title="Second", content="b", tags=["@Phone"])],
+                name="second.enex",
+            )
+        )
+    finally:
+        event.remove(Engine, "before_cursor_execute", add_task_first)
+
+    assert added
+    assert rows(database_pathname, "SELECT id, title FROM tasks ORDER BY id") == [
+        (1, "First"),
+        (2, "Added by the app"),
+        (3, "Second"),
+    ]
+    assert rows(
+        database_pathname,
+        "SELECT t.title FROM tasks t "
+        "JOIN task_where_tags_association a ON a.task_id = t.id ORDER BY t.id",
+    ) == [("First",), ("Second",)]
+
+
+def test_reimport_of_edited_note_updates_its_row(
+    write_enex, import_enex, database_pathname
+) -> None:
+    import_enex(
+        path=write_enex(
+            notes=[EnexNote(title="Call bank", content="Loan", tags=["@Phone", "car"])]
+        )
+    )
+    [(task_id,)] = rows(database_pathname, "SELECT id FROM tasks")
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(
+                    title="Call bank",
+                    content="Loan and mortgage",
+                    updated="20231005T100000Z",
+                    tags=["@Home-Inside", "car", "money"],
+                    reminder_time="20231101T120000Z",
+                )
+            ],
+            name="edited.enex",
+        )
+    )
+    assert rows(
+        database_pathname, "SELECT id, body_text, updated, reminder_time FROM tasks"
+    ) == [
+        (
+            task_id,
+            "Loan and mortgage",
+            "2023-10-05 10:00:00.000000",
+            "2023-11-01 12:00:00.000000",
+        )
+    ]
+    assert rows(
+        database_pathname,
+        "SELECT w.name FROM task_where_tags_association a "
+        "JOIN where_tags_table w ON w.id = a.where_tag_id",
+    ) == [("@Home-Inside",)]
+    assert rows(
+        database_pathname,
+        "SELECT r.name FROM task_reference_tags_association a "
+        "JOIN reference_tags r ON r.id = a.reference_tag_id ORDER BY r.name",
+    ) == [("car",), ("money",)]
+
+
+def test_reimport_of_unchanged_file_writes_nothing(
+    write_enex, import_enex, database_pathname
+) -> None:
+    path: str = write_enex(
+        notes=[
+            EnexNote(title="Call bank", content="Loan", tags=["@Phone"]),
+            EnexNote(title="Recipe", content="Soup", tags=["recipes"]),
+        ]
+    )
+    import_enex(path=path)
+    changes: list[tuple] = rows(database_pathname, "SELECT * FROM change_log")
+    import_enex(path=path)
+    assert rows(database_pathname, "SELECT * FROM change_log") == changes
+
+
+def test_reimport_moves_note_that_became_a_task(
+    write_enex, import_enex, database_pathname
+) -> None:
+    import_enex(path=write_enex(notes=[EnexNote(title="Soup", content="Leeks")]))
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(
+                    title="Soup",
+                    content="Leeks",
+                    updated="20231005T100000Z",
+                    tags=["1-Now"],
+                )
+            ],
+            name="edited.enex",
+        )
+    )
+    assert rows(database_pathname, "SELECT title FROM tasks") == [("Soup",)]
+    assert rows(database_pathname, "SELECT title FROM notes") == []
+
+
+def test_notes_with_the_same_title_created_apart_are_kept(
+    write_enex, import_enex, database_pathname
+) -> None:
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(title="Shopping", content="Milk", created="20231001T100000Z"),
+                EnexNote(title="Shopping", content="Eggs", created="20231008T100000Z"),
+            ]
+        )
+    )
+    assert rows(database_pathname, "SELECT body_text FROM notes ORDER BY id") == [
+        ("Milk",),
+        ("Eggs",),
+    ]
+
+
+def test_notes_with_the_same_title_and_created_are_logged(
+    write_enex, import_enex, database_pathname, caplog
+) -> None:
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(title="Shopping", content="Milk", created="20231001T100000Z"),
+                EnexNote(title="Shopping", content="Eggs", created="20231001T100000Z"),
+            ]
+        )
+    )
+    assert rows(database_pathname, "SELECT body_text FROM notes") == [("Eggs",)]
+    assert "1 Notes were not written" in caplog.text
+
+
+def test_dates_that_cannot_be_parsed_are_left_empty() -> None:
+    from src.controller.save_enex_backup_to_flask_mysql_db import parse_note_datetime
+
+    note: dict = {"created": "not a date", "updated": None}
+    assert parse_note_datetime(note=note, key="created") is None
+    assert parse_note_datetime(note=note, key="updated") is None
+    assert parse_note_datetime(note=note, key="reminder-time") is None
+
+
+def test_rows_are_only_logged_when_asked_for(
+    write_enex, import_enex, database_pathname, caplog
+) -> None:
+    from src.controller.save_enex_backup_to_flask_mysql_db import (
+        create_import_app,
+        log_database_contents,
+    )
+
+    import_enex(path=write_enex(notes=[EnexNote(title="Recipe", content="Soup")]))
+    with create_import_app(database_pathname=database_pathname).app_context():
+        with caplog.at_level(logging.DEBUG, logger=logger.name):
+            log_database_contents()
+            assert "Recipe" not in caplog.text
+            log_database_contents(log_rows=True)
+            assert "Recipe" in caplog.text
+
+
+def test_import_in_pool_writes_the_same_rows_as_serial(
+    write_enex, tmp_path, monkeypatch
+) -> None:
+    from src.controller import save_enex_backup_to_flask_mysql_db as models
+    from src.controller.resource_store import ResourceStorage
+
+    path: str = write_enex(
+        notes=[
+            EnexNote(
+                title=f"Note {no}",
+                content=f"<div>Line {no}</div>",
+                tags=["@Phone", "1-Now", f"tag {no % 3}"] if no % 2 else ["recipes"],
+                resources=[bytes([no % 3]) * 100],
+            )
+            for no in range(9)
+        ]
+    )
+    tables: list[str] = [
+        "SELECT title, body_text, created, updated, content_hash FROM tasks",
+        "SELECT title, body_text, created, updated, content_hash FROM notes",
+        "SELECT hash, file_name, mime, data FROM resources",
+        "SELECT name FROM where_tags_table",
+        "SELECT name FROM reference_tags",
+        "SELECT t.title, w.name FROM tasks t "
+        "JOIN task_where_tags_association a ON a.task_id = t.id "
+        "JOIN where_tags_table w ON w.id = a.where_tag_id",
+        "SELECT n.title, r.name FROM notes n "
+        "JOIN note_reference_tags_association a ON a.note_id = n.id "
+        "JOIN reference_tags r ON r.id = a.reference_tag_id",
+    ]
+
+    def import_with(workers: int) -> list[list[tuple]]:
+        database_pathname: str = str(tmp_path / f"workers_{workers}.db")
+        monkeypatch.setattr(models, "IMPORT_WORKERS", workers)
+        monkeypatch.setattr(models, "IMPORT_CHUNK_SIZE", 2)
+        models.save_enex_backup_to_mysql_db(
+            enex_backup_pathname=path,
+            database_pathname=database_pathname,
+            resource_folder=str(tmp_path / "resources"),
+            resource_storage=ResourceStorage.BLOB,
+            incremental=False,
+            resume=False,
+            commit_every=4,
+        )
+        return [sorted(rows(database_pathname, sql)) for sql in tables]
+
+    serial: list[list[tuple]] = import_with(workers=1)
+    assert all(serial)
+    assert import_with(workers=3) == serial
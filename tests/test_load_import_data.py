@@ -0,0 +1,195 @@
+import logging
+
+from src.controller.load_import_data import (
+    EnmlConverter,
+    convert_note,
+    iter_enex_notes,
+    iter_note_elements,
+)
+from tests.conftest import EnexNote, resource_hash
+
+logger = logging.getLogger(__name__)
+
+
+def test_converter_drops_skipped_tags_from_body() -> None:
+    converted = EnmlConverter().convert(
+        content="<en-note><div>Buy <b>milk</b></div><div><br/></div></en-note>"
+    )
+    assert converted.body == "Buy <b>milk</b>"
+
+
+def test_converter_text_has_no_tags_and_breaks_lines() -> None:
+    converted = EnmlConverter().convert(
+        content='<en-note><div>Buy milk</div><div>and eggs <en-media hash="ab" '
+        'type="image/png" /></div></en-note>'
+    )
+    assert converted.text.split() == ["Buy", "milk", "and", "eggs"]
+    assert "png" not in converted.text
+
+
+def test_first_sentence_ends_at_skipped_tags() -> None:
+    converted = EnmlConverter().convert(
+        content="<en-note><div>Buy milk</div><div>and eggs tomorrow</div></en-note>"
+    )
+    assert converted.first_sentence == "Buy milk"
+
+
+def test_first_sentence_ends_at_line_break() -> None:
+    converted = EnmlConverter().convert(
+        content="<en-note>Call the bank<br/>about the loan</en-note>"
+    )
+    assert converted.first_sentence == "Call the bank"
+
+
+def test_first_sentence_is_at_most_50_characters() -> None:
+    converted = EnmlConverter().convert(content=f"<en-note>{'x' * 80}</en-note>")
+    assert converted.first_sentence == "x" * 50
+
+
+def test_untitled_note_is_titled_by_first_sentence() -> None:
+    this_note, _ = convert_note(
+        raw_note=(
+            {
+                "title": "Untitled Note",
+                "content": "<en-note><div>Buy milk</div><div>and eggs</div></en-note>",
+            },
+            [],
+        )
+    )
+    assert this_note["title"] == "Buy milk"
+
+
+def test_untitled_note_with_whitespace_between_tags_is_titled() -> None:
+    # As exported: a line break and indentation between the tags
+    content: str = (
+        "<en-note>\n  <div>  Buy milk. Then more</div>\n  <div><br/></div>\n"
+        "  <div>and eggs</div>\n</en-note>\n"
+    )
+    this_note, _ = convert_note(
+        raw_note=({"title": "Untitled Note", "content": content}, [])
+    )
+    assert this_note["title"] == "Buy milk"
+
+
+def test_untitled_note_of_only_whitespace_is_not_titled() -> None:
+    converted = EnmlConverter().convert(content="<en-note>\n  <div> </div>\n</en-note>")
+    assert converted.first_sentence == ""
+
+
+def test_untitled_picture_is_titled_saved_image() -> None:
+    this_note, _ = convert_note(
+        raw_note=(
+            {"title": "Untitled Note", "content": '<en-media hash="ab" />'},
+            [],
+        )
+    )
+    assert this_note["title"] == "Saved Image"
+
+
+def test_note_elements_are_streamed_one_at_a_time(write_enex) -> None:
+    path: str = write_enex(
+        notes=[EnexNote(title=f"Note {no}", content="Text") for no in range(3)]
+    )
+    note_elements = iter_note_elements(path=path, read_chunk_size=64)
+    first = next(note_elements)
+    assert first.findtext("title") == "Note 0"
+    assert [note.findtext("title") for note in note_elements] == ["Note 1", "Note 2"]
+
+
+def test_iter_enex_notes_decodes_resources_to_sink(write_enex) -> None:
+    picture: bytes = bytes(range(256)) * 8
+    path: str = write_enex(
+        notes=[
+            EnexNote(title="Picture", content="Look", resources=[picture]),
+            EnexNote(title="Untitled Note", content="<div>Buy milk</div>"),
+        ]
+    )
+    received: dict[str, bytes] = {}
+
+    class Sink:
+        def put(self, hash: str, data: bytes) -> None:
+            received[hash] = bytes(data)
+
+        def discard(self, hash: str) -> None:
+            received.pop(hash, None)
+
+    notes = list(iter_enex_notes(filepath=path, logger=logger, resource_sink=Sink()))
+    assert [this_note["title"] for this_note, _ in notes] == ["Picture", "Buy milk"]
+    assert notes[0][1][0]["hash"] == resource_hash(picture)
+    assert notes[0][1][0]["size"] == str(len(picture))
+    assert received == {resource_hash(picture): picture}
+
+
+def test_iter_enex_notes_skips_empty_notes(write_enex) -> None:
+    path: str = write_enex(
+        notes=[
+            EnexNote(title="Untitled Note", content=""),
+            EnexNote(title="Kept", content="Text"),
+        ]
+    )
+    notes = list(iter_enex_notes(filepath=path, logger=logger))
+    assert [this_note["title"] for this_note, _ in notes] == ["Kept"]
+
+
+def test_iter_enex_notes_in_pool_keeps_order(write_enex) -> None:
+    path: str = write_enex(
+        notes=[EnexNote(title=f"Note {no}", content="Text") for no in range(10)]
+    )
+    notes = list(iter_enex_notes(filepath=path, logger=logger, workers=2, chunk_size=3))
+    assert [this_note["title"] for this_note, _ in notes] == [
+        f"Note {no}" for no in range(10)
+    ]
+
+
+def test_skipped_notes_are_logged(write_enex, caplog) -> None:
+    path: str = write_enex(notes=[EnexNote(title="Untitled Note", content="")])
+    with caplog.at_level(logging.INFO, logger=logger.name):
+        assert list(iter_enex_notes(filepath=path, logger=logger)) == []
+    assert "Skipping note 0 due to empty title and content" in caplog.text
+
+
+def test_iter_enex_notes_in_pool_matches_serial(write_enex) -> None:
+    pictures: list[bytes] = [bytes([no]) * 300 for no in range(3)]
+    path: str = write_enex(
+        notes=[
+            EnexNote(
+                title=f"Note {no}" if no % 4 else "Untitled Note",
+                content=f"<div>Line {no}.</div><br/><div>More <b>text</b></div>",
+                tags=["@Phone", f"tag {no % 3}"] if no % 2 else ["recipes"],
+                reminder_time="20231101T120000Z" if no % 5 == 0 else None,
+                resources=pictures[: no % 4],
+            )
+            for no in range(11)
+        ]
+        + [EnexNote(title="Untitled Note", content="", resources=[pictures[0]])]
+    )
+
+    class Sink:
+        def __init__(self) -> None:
+            self.calls: list[tuple[str, str, bytes]] = []
+
+        def put(self, hash: str, data: bytes) -> None:
+            self.calls.append(("put", hash, bytes(data)))
+
+        def discard(self, hash: str) -> None:
+            self.calls.append(("discard", hash, b""))
+
+    serial_sink, pool_sink = Sink(), Sink()
+    serial = list(
+        iter_enex_notes(filepath=path, logger=logger, resource_sink=serial_sink)
+    )
+    in_pool = list(
+        iter_enex_notes(
+            filepath=path,
+            logger=logger,
+            workers=3,
+            chunk_size=2,
+            resource_sink=pool_sink,
+        )
+    )
+
+    assert len(serial) == 11
+    assert in_pool == serial
+    assert pool_sink.calls == serial_sink.calls
+    assert any(this_note["tags"] for this_note, _ in serial)
+    assert any(resources for _, resources in serial)
@@ -0,0 +1,193 @@
+import base64
+import sqlite3
+
+from sqlalchemy import create_engine
+
+from src.controller.change_log import change_log_trigger_sql
+from src.controller.migrations import LATEST_VERSION, upgrade_database
+from tests.conftest import resource_hash
+
+# The tables as the first version created them, with no user_version set
+BASELINE_SCHEMA_SQL: str = """
+    CREATE TABLE notes (
+        id INTEGER NOT NULL, title VARCHAR(63) NOT NULL,
+        created DATETIME NOT NULL, updated DATETIME NOT NULL,
+        reminder_time DATETIME, body_text VARCHAR(4096) NOT NULL, PRIMARY KEY (id)
+    );
+    CREATE TABLE projects (
+        id INTEGER NOT NULL, title VARCHAR(63) NOT NULL,
+        created DATETIME NOT NULL, updated DATETIME NOT NULL, PRIMARY KEY (id)
+    );
+    CREATE TABLE reference_tags (
+        id INTEGER NOT NULL, name VARCHAR(16) NOT NULL, PRIMARY KEY (id)
+    );
+    CREATE TABLE resources (
+        id INTEGER NOT NULL, file_name VARCHAR(63) NOT NULL,
+        hash VARCHAR(63) NOT NULL, data VARCHAR(8388607) NOT NULL,
+        mime VARCHAR(63) NOT NULL, width INTEGER, height INTEGER, PRIMARY KEY (id)
+    );
+    CREATE TABLE tasks (
+        id INTEGER NOT NULL, title VARCHAR(63) NOT NULL,
+        body_text VARCHAR(4096) NOT NULL, created DATETIME NOT NULL,
+        updated DATETIME NOT NULL, reminder_time DATETIME, PRIMARY KEY (id)
+    );
+    CREATE TABLE when_tags (
+        id INTEGER NOT NULL, name VARCHAR(16) NOT NULL, PRIMARY KEY (id)
+    );
+    CREATE TABLE where_tags_table (
+        id INTEGER NOT NULL, name VARCHAR(16) NOT NULL, PRIMARY KEY (id)
+    );
+    CREATE TABLE note_reference_tags_association (
+        note_id INTEGER, reference_tag_id INTEGER
+    );
+    CREATE TABLE project_task_association (project_id INTEGER, task_id INTEGER);
+    CREATE TABLE task_reference_tags_association (
+        task_id INTEGER, reference_tag_id INTEGER
+    );
+    CREATE TABLE task_when_tags_association (task_id INTEGER, when_tag_id INTEGER);
+    CREATE TABLE task_where_tags_association (task_id INTEGER, where_tag_id INTEGER);
+"""
+
+
+def upgrade(database_pathname: str) -> int:
+    engine = create_engine(f"sqlite+pysqlite:///{database_pathname}")
+    with engine.begin() as connection:
+        from_version: int = upgrade_database(connection=connection)
+    engine.dispose()
+    return from_version
+
+
+def test_latest_versions_of_duplicated_notes_are_kept(
+    write_enex, import_enex, database_pathname
+) -> None:
+    import_enex(path=write_enex(notes=[]))
+    with sqlite3.connect(database_pathname) as connection:
+        connection.executescript(
+            """
+            DROP INDEX ix_tasks_title_created;
+            DROP INDEX ix_notes_title_created;
+            INSERT INTO tasks (id, title, body_text, created, updated) VALUES
+                (1, 'Call bank', 'old', '2023-10-01', '2023-10-02'),
+                (2, 'Call bank', 'new', '2023-10-01', '2023-10-05'),
+                (3, 'Call bank', 'other', '2023-10-09', '2023-10-09'),
+                (4, 'Soup', 'task', '2023-10-01', '2023-10-02');
+            INSERT INTO notes (id, title, body_text, created, updated) VALUES
+                (1, 'Soup', 'note', '2023-10-01', '2023-10-03');
+            INSERT INTO task_where_tags_association VALUES (1, 1), (2, 1);
+            PRAGMA user_version = 6;
+            """
+        )
+
+    assert upgrade(database_pathname=database_pathname) == 6
+
+    with sqlite3.connect(database_pathname) as connection:
+        assert connection.execute("SELECT id, body_text FROM tasks").fetchall() == [
+            (2, "new"),
+            (3, "other"),
+        ]
+        assert connection.execute("SELECT id FROM notes").fetchall() == [(1,)]
+        assert connection.execute(
+            "SELECT task_id FROM task_where_tags_association"
+        ).fetchall() == [(2,)]
+        assert connection.execute("PRAGMA user_version").fetchone() == (LATEST_VERSION,)
+
+
+def test_baseline_database_is_upgraded(database_pathname) -> None:
+    from src.controller.save_enex_backup_to_flask_mysql_db import create_import_app
+
+    picture: bytes = bytes(range(256)) * 4
+    with sqlite3.connect(database_pathname) as connection:
+        connection.executescript(BASELINE_SCHEMA_SQL)
+        connection.executemany(
+            "INSERT INTO resources (id, file_name, hash, data, mime) "
+            "VALUES (?, ?, ?, ?, 'image/png')",
+            [
+                # As the ENEX file has it, in lines
+                (
+                    1,
+                    "a.png",
+                    resource_hash(picture),
+                    base64.encodebytes(picture).decode(),
+                ),
+                (2, "b.png", resource_hash(b"stored"), ""),
+                (3, "c.png", resource_hash(b"other"), "not base64!"),
+            ],
+        )
+        connection.executescript(
+            """
+            INSERT INTO where_tags_table VALUES (1, '@Phone');
+            INSERT INTO tasks VALUES
+                (1, 'Call bank', '<b>About the loan</b>', '2023-10-01', '2023-10-02', NULL);
+            INSERT INTO task_where_tags_association VALUES (1, 1);
+            """
+        )
+
+    create_import_app(database_pathname=database_pathname)
+
+    with sqlite3.connect(database_pathname) as connection:
+        assert connection.execute("PRAGMA user_version").fetchone() == (LATEST_VERSION,)
+        assert connection.execute("SELECT id, data FROM resources").fetchall() == [
+            (1, picture),
+            (2, None),
+            (3, "not base64!"),
+        ]
+        assert connection.execute(
+            "SELECT title, content_hash IS NOT NULL FROM tasks"
+        ).fetchall() == [("Call bank", 1)]
+        assert connection.execute(
+            "SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH 'loan'"
+        ).fetchall() == [(1,)]
+        assert (
+            connection.execute(
+                "SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH 'b'"
+            ).fetchall()
+            == []
+        )
+
+
+def test_search_index_is_rebuilt_over_plain_text(
+    write_enex, import_enex, database_pathname
+) -> None:
+    import_enex(path=write_enex(notes=[]))
+    with sqlite3.connect(database_pathname) as connection:
+        # The index, the tasks table and its triggers as version 8 had them
+        connection.executescript(
+            f"""
+            DROP TRIGGER tasks_fts_insert;
+            DROP TRIGGER tasks_fts_delete;
+            DROP TRIGGER tasks_fts_update;
+            DROP TRIGGER tasks_change_log_update;
+            DROP TABLE tasks_fts;
+            ALTER TABLE tasks DROP COLUMN plain_text;
+            {change_log_trigger_sql(table="tasks", operation="update")};
+            CREATE VIRTUAL TABLE tasks_fts USING fts5(
+                title, body_text, content='tasks', content_rowid='id'
+            );
+            INSERT INTO tasks (id, title, body_text, created, updated) VALUES
+                (1, 'Receipt', '<en-media type="image/png" />Paid', '2023-10-01',
+                 '2023-10-02');
+            INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild');
+            PRAGMA user_version = 8;
+            """
+        )
+
+    assert upgrade(database_pathname=database_pathname) == 8
+
+    with sqlite3.connect(database_pathname) as connection:
+        assert connection.execute("SELECT plain_text FROM tasks").fetchall() == [
+            ("Paid",)
+        ]
+        for word, rowids in (("png", []), ("paid", [(1,)])):
+            assert (
+                connection.execute(
+                    "SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?", (word,)
+                ).fetchall()
+                == rowids
+            )
+
+        # The update trigger of version 8 logged updates changing nothing
+        seq: int = connection.execute("SELECT max(seq) FROM change_log").fetchone()[0]
+        connection.execute("UPDATE tasks SET title = title")
+        assert connection.execute("SELECT max(seq) FROM change_log").fetchone() == (
+            seq,
+        )
@@ -0,0 +1,47 @@
+import sqlite3
+import time
+
+from sqlalchemy import create_engine
+
+
+def test_external_changes_invalidate_only_their_tables(database_pathname) -> None:
+    from src.controller.read_cache import ReadCache
+    from src.controller.save_enex_backup_to_flask_mysql_db import (
+        Project,
+        Task,
+        create_import_app,
+    )
+
+    create_import_app(database_pathname=database_pathname)
+    engine = create_engine(f"sqlite+pysqlite:///{database_pathname}")
+    loads: list[str] = []
+
+    def load(key: str) -> str:
+        loads.append(key)
+        return key
+
+    with ReadCache(engine=engine, external_check_seconds=0.001) as cache:
+        for _ in range(2):
+            cache.get_or_load(
+                key="tasks", depends_on=[Task], load=lambda: load("tasks")
+            )
+            cache.get_or_load(
+                key="projects", depends_on=[Project], load=lambda: load("projects")
+            )
+            time.sleep(0.01)
+        assert loads == ["tasks", "projects"]
+
+        # Another process adds a task
+        with sqlite3.connect(database_pathname) as connection:
+            connection.execute(
+                "INSERT INTO tasks (title, body_text, created, updated) "
+                "VALUES ('Call', '', '2023-10-01', '2023-10-01')"
+            )
+        time.sleep(0.01)
+        cache.get_or_load(key="tasks", depends_on=[Task], load=lambda: load("tasks"))
+        cache.get_or_load(
+            key="projects", depends_on=[Project], load=lambda: load("projects")
+        )
+
+    engine.dispose()
+    assert loads == ["tasks", "projects", "tasks"]
@@ -0,0 +1,181 @@
+import datetime as dt
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterator
+
+import pytest
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from src.controller.reminders import (
+    Reminder,
+    ReminderScheduler,
+    create_reminder_engine,
+    utc_now,
+)
+
+
+class RecordingNotifier:
+    """Keeps the reminders fired, with when they were"""
+
+    def __init__(self) -> None:
+        self.fired: list[tuple[Reminder, dt.datetime]] = []
+        self.event = threading.Event()
+
+    def notify(self, reminder: Reminder) -> None:
+        self.fired.append((reminder, utc_now()))
+        self.event.set()
+
+    def wait(self, seconds: float = 5.0) -> list[tuple[Reminder, dt.datetime]]:
+        assert self.event.wait(timeout=seconds)
+        self.event.clear()
+        return self.fired
+
+
+def wait_until(condition: Callable[[], bool], seconds: float = 5.0) -> bool:
+    deadline: float = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def engine(database_pathname) -> Iterator[Engine]:
+    from src.controller.save_enex_backup_to_flask_mysql_db import create_import_app
+
+    create_import_app(database_pathname=database_pathname)
+    engine: Engine = create_reminder_engine(database_pathname=database_pathname)
+    yield engine
+    engine.dispose()
+
+
+def add_task(engine: Engine, title: str, reminder_time: dt.datetime) -> int:
+    from src.controller.save_enex_backup_to_flask_mysql_db import Task
+
+    with Session(engine) as session:
+        task = Task(title=title, reminder_time=reminder_time)
+        session.add(task)
+        session.commit()
+        return task.id
+
+
+def set_reminder(engine: Engine, task_id: int, reminder_time: dt.datetime) -> None:
+    from src.controller.save_enex_backup_to_flask_mysql_db import Task
+
+    with Session(engine) as session:
+        session.get(Task, task_id).reminder_time = reminder_time
+        session.commit()
+
+
+def test_reminder_fires_when_due(engine) -> None:
+    notifier = RecordingNotifier()
+    with ReminderScheduler(
+        engine=engine, notifier=notifier, external_check_seconds=0
+    ) as scheduler:
+        due: dt.datetime = utc_now() + dt.timedelta(seconds=0.3)
+        task_id: int = add_task(engine=engine, title="Call", reminder_time=due)
+        assert wait_until(lambda: scheduler.next_due() == due)
+
+        [(reminder, fired)] = notifier.wait()
+    assert (reminder.kind, reminder.id, reminder.title) == ("task", task_id, "Call")
+    assert dt.timedelta(0) <= fired - due < dt.timedelta(seconds=0.5)
+    assert len(scheduler) == 0
+
+
+def test_rescheduled_reminder_fires_at_its_new_time(engine) -> None:
+    notifier = RecordingNotifier()
+    later: dt.datetime = utc_now() + dt.timedelta(hours=1)
+    task_id: int = add_task(engine=engine, title="Call", reminder_time=later)
+    with ReminderScheduler(
+        engine=engine, notifier=notifier, external_check_seconds=0
+    ) as scheduler:
+        # Once the reminders are loaded
+        assert wait_until(lambda: scheduler.next_due() == later)
+
+        sooner: dt.datetime = utc_now() + dt.timedelta(seconds=0.3)
+        set_reminder(engine=engine, task_id=task_id, reminder_time=sooner)
+        [(reminder, _)] = notifier.wait()
+    assert reminder.due == sooner
+
+
+def test_cancelled_reminders_do_not_fire(engine) -> None:
+    from src.controller.save_enex_backup_to_flask_mysql_db import Task
+
+    notifier = RecordingNotifier()
+    due: dt.datetime = utc_now() + dt.timedelta(seconds=0.3)
+    with ReminderScheduler(
+        engine=engine, notifier=notifier, external_check_seconds=0
+    ) as scheduler:
+        cleared: int = add_task(engine=engine, title="Call", reminder_time=due)
+        deleted: int = add_task(engine=engine, title="Plan", reminder_time=due)
+        assert wait_until(lambda: len(scheduler) == 2)
+
+        set_reminder(engine=engine, task_id=cleared, reminder_time=None)
+        with Session(engine) as session:
+            session.delete(session.get(Task, deleted))
+            session.commit()
+        assert len(scheduler) == 0
+        time.sleep(0.5)
+    assert notifier.fired == []
+
+
+def test_reminders_of_other_processes_are_fired(engine, database_pathname) -> None:
+    notifier = RecordingNotifier()
+    with ReminderScheduler(
+        engine=engine, notifier=notifier, external_check_seconds=0.05
+    ):
+        due: dt.datetime = utc_now() + dt.timedelta(seconds=0.3)
+        with sqlite3.connect(database_pathname) as connection:
+            connection.execute(
+                "INSERT INTO tasks (title, body_text, created, updated, "
+                "reminder_time) VALUES ('Call', '', ?, ?, ?)",
+                (f"{due:%Y-%m-%d %H:%M:%S}",) * 2 + (f"{due:%Y-%m-%d %H:%M:%S.%f}",),
+            )
+        [(reminder, _)] = notifier.wait()
+    assert reminder.title == "Call"
+
+
+def test_scheduler_recovers_from_database_errors(tmp_path) -> None:
+    from src.controller.save_enex_backup_to_flask_mysql_db import create_import_app
+
+    # No tables yet, so loading the reminders fails until they are made
+    database_pathname: str = str(tmp_path / "later.db")
+    engine: Engine = create_reminder_engine(database_pathname=database_pathname)
+    notifier = RecordingNotifier()
+    with ReminderScheduler(
+        engine=engine,
+        notifier=notifier,
+        external_check_seconds=0.05,
+        retry_seconds=0.05,
+    ) as scheduler:
+        time.sleep(0.2)
+        assert scheduler.thread.is_alive()
+
+        create_import_app(database_pathname=database_pathname)
+        add_task(
+            engine=engine,
+            title="Call",
+            reminder_time=utc_now() + dt.timedelta(seconds=0.3),
+        )
+        [(reminder, _)] = notifier.wait()
+    engine.dispose()
+    assert reminder.title == "Call"
+
+
+def test_flask_app_fires_reminders_of_tasks_it_writes(engine, database_pathname):
+    from src.controller.app import create_app
+
+    app = create_app(database_pathname=database_pathname)
+    scheduler: ReminderScheduler = app.extensions["reminder_scheduler"]
+    try:
+        due: dt.datetime = utc_now() + dt.timedelta(seconds=1)
+        response = app.test_client().post(
+            "/tasks", json={"title": "Call", "reminder_time": due.isoformat()}
+        )
+        assert response.status_code == 201
+        assert wait_until(lambda: scheduler.next_due() == due)
+        assert wait_until(lambda: scheduler.fired_count == 1)
+    finally:
+        scheduler.stop()
+        app.extensions["read_cache"].stop()
@@ -0,0 +1,146 @@
+from typing import Iterator
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+
+from tests.conftest import EnexNote
+
+# What each profile loads, by model
+PROFILE_RELATIONSHIPS: dict[tuple[str, str], list[str]] = {
+    ("Task", "list"): ["where_tag", "when_tag", "reference_tags"],
+    ("Task", "detail"): ["where_tag", "when_tag", "reference_tags", "projects"],
+    ("Task", "export"): ["where_tag", "when_tag", "reference_tags", "projects"],
+    ("Note", "list"): ["reference_tags"],
+    ("Note", "detail"): ["reference_tags"],
+    ("Note", "export"): ["reference_tags"],
+    ("Project", "detail"): ["tasks"],
+    ("Project", "export"): ["tasks"],
+    ("WhereTag", "detail"): ["tasks"],
+    ("ReferenceTag", "detail"): ["tasks", "notes"],
+}
+
+
+@pytest.fixture
+def app(write_enex, import_enex, database_pathname) -> Iterator[Flask]:
+    """Five tasks with tags, in a project, and two notes"""
+    from src.controller.save_enex_backup_to_flask_mysql_db import (
+        Project,
+        Task,
+        create_import_app,
+        db,
+    )
+
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(
+                    title=f"Task {task_no}",
+                    content="",
+                    tags=["@Phone", "1-Now", "money"],
+                )
+                for task_no in range(5)
+            ]
+            + [
+                EnexNote(title=f"Note {note_no}", content="", tags=["money"])
+                for note_no in range(2)
+            ]
+        )
+    )
+    app: Flask = create_import_app(database_pathname=database_pathname)
+    with app.app_context():
+        db.session.add(
+            Project(title="Trip", tasks=list(db.session.scalars(db.select(Task))))
+        )
+        db.session.commit()
+        db.session.expunge_all()
+        yield app
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count: int = 0
+
+    def __call__(self, *args) -> None:
+        self.count += 1
+
+
+@pytest.fixture
+def queries(app) -> Iterator[QueryCounter]:
+    from src.controller.save_enex_backup_to_flask_mysql_db import db
+
+    counter = QueryCounter()
+    event.listen(db.engine, "before_cursor_execute", counter)
+    yield counter
+    event.remove(db.engine, "before_cursor_execute", counter)
+
+
+def model_named(name: str) -> type:
+    from src.controller import save_enex_backup_to_flask_mysql_db as models
+
+    return getattr(models, name)
+
+
+@pytest.mark.parametrize("model_name, profile", list(PROFILE_RELATIONSHIPS))
+def test_profile_loads_its_relationships_up_front(model_name, profile, queries) -> None:
+    from src.controller.repository import LoadProfile, select_loaded
+    from src.controller.save_enex_backup_to_flask_mysql_db import db
+
+    rows: list = list(
+        db.session.scalars(
+            select_loaded(model=model_named(model_name), profile=LoadProfile(profile))
+        )
+    )
+    assert rows
+    queries_loading: int = queries.count
+
+    for row in rows:
+        for name in PROFILE_RELATIONSHIPS[(model_name, profile)]:
+            related = getattr(row, name)
+            assert related is not None and related != []
+    assert queries.count == queries_loading
+
+
+@pytest.mark.parametrize(
+    "model_name, profile, relationship",
+    [
+        ("Task", "list", "projects"),
+        ("Project", "list", "tasks"),
+        ("WhereTag", "list", "tasks"),
+        ("ReferenceTag", "list", "notes"),
+    ],
+)
+def test_relationship_outside_the_profile_raises(
+    model_name, profile, relationship, queries
+) -> None:
+    from src.controller.repository import LoadProfile, select_loaded
+    from src.controller.save_enex_backup_to_flask_mysql_db import db
+
+    row = db.session.scalars(
+        select_loaded(model=model_named(model_name), profile=LoadProfile(profile))
+    ).first()
+    queries_loading: int = queries.count
+
+    with pytest.raises(InvalidRequestError):
+        getattr(row, relationship)
+    assert queries.count == queries_loading
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 5, 10])
+def test_batches_hold_every_row_once(batch_size, queries) -> None:
+    from src.controller.repository import LoadProfile, iter_loaded
+    from src.controller.save_enex_backup_to_flask_mysql_db import Task, db
+
+    all_ids: list[int] = sorted(db.session.scalars(db.select(Task.id)))
+    queries_before: int = queries.count
+
+    tasks: list = list(
+        iter_loaded(model=Task, profile=LoadProfile.EXPORT, batch_size=batch_size)
+    )
+
+    assert [task.id for task in tasks] == all_ids
+    assert all(task.projects for task in tasks)
+    # The rows, then one query per relationship, for each batch read
+    batches: int = len(all_ids) // batch_size + 1
+    assert queries.count - queries_before <= batches * 5
@@ -0,0 +1,141 @@
+import os
+import struct
+import zlib
+from typing import Iterator
+
+import pytest
+from flask.testing import FlaskClient
+
+from tests.conftest import EnexNote, resource_hash
+
+DATA: bytes = bytes(range(256)) * 40
+DATA_HASH: str = resource_hash(DATA)
+
+
+@pytest.fixture(params=["files", "blob"])
+def client(
+    request, write_enex, import_enex, database_pathname, tmp_path
+) -> Iterator[FlaskClient]:
+    """The Flask app, serving a resource stored in the ResourceStore or the database"""
+    from src.controller.app import create_app
+    from src.controller.resource_store import ResourceStorage
+
+    import_enex(
+        path=write_enex(notes=[EnexNote(title="Photo", content="", resources=[DATA])]),
+        resource_storage=ResourceStorage(request.param),
+    )
+    app = create_app(
+        database_pathname=database_pathname,
+        resource_folder=os.path.join(tmp_path, "resources"),
+    )
+    yield app.test_client()
+    app.extensions["read_cache"].stop()
+    app.extensions["reminder_scheduler"].stop()
+
+
+def test_whole_resource(client) -> None:
+    response = client.get(f"/resources/{DATA_HASH}")
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Length"] == str(len(DATA))
+    assert response.mimetype == "image/png"
+    assert response.get_etag() == (DATA_HASH, False)
+
+    cached = client.get(
+        f"/resources/{DATA_HASH}", headers={"If-None-Match": f'"{DATA_HASH}"'}
+    )
+    assert cached.status_code == 304
+    assert client.get(f"/resources/{resource_hash(b'other')}").status_code == 404
+
+
+@pytest.mark.parametrize(
+    "byte_range, start, end",
+    [
+        ("bytes=10-19", 10, 20),
+        ("bytes=10000-", 10_000, 10_240),
+        ("bytes=-5", 10_235, 10_240),
+    ],
+)
+def test_range_of_bytes(client, byte_range, start, end) -> None:
+    response = client.get(f"/resources/{DATA_HASH}", headers={"Range": byte_range})
+    assert response.status_code == 206
+    assert response.data == DATA[start:end]
+    assert response.headers["Content-Range"] == f"bytes {start}-{end - 1}/10240"
+    assert response.headers["Content-Length"] == str(end - start)
+
+
+def test_range_past_the_end_is_not_satisfiable(client) -> None:
+    response = client.get(f"/resources/{DATA_HASH}", headers={"Range": "bytes=10240-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */10240"
+
+
+def test_if_range_for_other_bytes_gets_the_whole_resource(client) -> None:
+    same = client.get(
+        f"/resources/{DATA_HASH}",
+        headers={"Range": "bytes=0-9", "If-Range": f'"{DATA_HASH}"'},
+    )
+    assert same.status_code == 206
+    assert same.data == DATA[:10]
+
+    other = client.get(
+        f"/resources/{DATA_HASH}",
+        headers={"Range": "bytes=0-9", "If-Range": '"other"'},
+    )
+    assert other.status_code == 200
+    assert other.data == DATA
+
+
+def test_folders_are_in_the_project_wherever_it_is_run_from() -> None:
+    from src.config.config_main import PROJECT_FOLDER
+    from src.controller.save_enex_backup_to_flask_mysql_db import (
+        RESOURCE_STORE_FOLDER,
+    )
+    from src.controller.thumbnails import THUMBNAIL_FOLDER
+
+    for folder in (RESOURCE_STORE_FOLDER, THUMBNAIL_FOLDER):
+        assert os.path.isabs(folder)
+        assert os.path.commonpath([folder, PROJECT_FOLDER]) == PROJECT_FOLDER
+
+
+def png_chunk(kind: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data))
+    )
+
+
+# A 10x10 PNG whose text chunk inflates past what Pillow allows, a ValueError
+CORRUPT_PNG: bytes = (
+    b"\x89PNG\r\n\x1a\n"
+    + png_chunk(b"IHDR", struct.pack(">IIBBBBB", 10, 10, 8, 2, 0, 0, 0))
+    + png_chunk(b"zTXt", b"k\x00\x00" + zlib.compress(bytes(2_000_000)))
+    + png_chunk(b"IDAT", zlib.compress(bytes(31 * 10)))
+    + png_chunk(b"IEND", b"")
+)
+
+
+@pytest.mark.parametrize("data", [DATA, CORRUPT_PNG], ids=["not_an_image", "corrupt"])
+def test_thumbnail_of_image_that_cannot_be_read_is_not_found(
+    data, write_enex, import_enex, database_pathname, tmp_path
+) -> None:
+    from src.controller.app import create_app
+
+    import_enex(
+        path=write_enex(notes=[EnexNote(title="Photo", content="", resources=[data])])
+    )
+    app = create_app(
+        database_pathname=database_pathname,
+        resource_folder=os.path.join(tmp_path, "resources"),
+    )
+    try:
+        response = app.test_client().get(
+            f"/resources/{resource_hash(data)}/thumbnail/160x160"
+        )
+        assert response.status_code == 404
+    finally:
+        app.extensions["read_cache"].stop()
+        app.extensions["reminder_scheduler"].stop()
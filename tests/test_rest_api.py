@@ -0,0 +1,82 @@
+import sqlite3
+from typing import Callable
+
+import pytest
+from flask import Response
+
+from tests.conftest import EnexNote
+
+
+@pytest.fixture
+def api_get(database_pathname) -> Callable[..., Response]:
+    """Calls the JSON API on the test database, as the Flask app does"""
+    from src.controller.rest_api import item_response, list_response
+    from src.controller.save_enex_backup_to_flask_mysql_db import create_import_app
+
+    def get(path: str, etag: str = "") -> Response:
+        app = create_import_app(database_pathname=database_pathname)
+        headers: dict[str, str] = {"If-None-Match": f'"{etag}"'} if etag else {}
+        with app.test_request_context(path, headers=headers):
+            resource_name, _, row_id = path.removeprefix("/api/").partition("/")
+            if row_id:
+                return item_response(resource_name=resource_name, row_id=int(row_id))
+            return list_response(resource_name=resource_name)
+
+    return get
+
+
+def test_etag_changes_when_an_import_changes_a_task(
+    write_enex, import_enex, api_get
+) -> None:
+    import_enex(
+        path=write_enex(notes=[EnexNote(title="Call", content="Bank", tags=["@Phone"])])
+    )
+    first: Response = api_get("/api/tasks/1")
+    first_list: Response = api_get("/api/tasks")
+    assert first.status_code == 200
+    assert api_get("/api/tasks/1", etag=first.get_etag()[0]).status_code == 304
+
+    # Only the tags changed, so the export's updated time is the same
+    import_enex(
+        path=write_enex(
+            notes=[EnexNote(title="Call", content="Bank", tags=["@Home-Inside"])]
+        )
+    )
+    second: Response = api_get("/api/tasks/1", etag=first.get_etag()[0])
+    assert second.status_code == 200
+    assert second.json["where_tag"] == "@Home-Inside"
+    assert api_get("/api/tasks", etag=first_list.get_etag()[0]).status_code == 200
+
+    # Unchanged since
+    import_enex(
+        path=write_enex(
+            notes=[EnexNote(title="Call", content="Bank", tags=["@Home-Inside"])]
+        )
+    )
+    assert api_get("/api/tasks/1", etag=second.get_etag()[0]).status_code == 304
+
+
+def test_etag_of_a_project_changes_when_its_task_becomes_a_note(
+    write_enex, import_enex, api_get, database_pathname
+) -> None:
+    import_enex(
+        path=write_enex(notes=[EnexNote(title="Call", content="Bank", tags=["@Phone"])])
+    )
+    with sqlite3.connect(database_pathname) as connection:
+        connection.executescript(
+            """
+            INSERT INTO projects (id, title, created, updated)
+            VALUES (1, 'Move', '2023-10-01', '2023-10-01');
+            INSERT INTO project_task_association VALUES (1, 1);
+            """
+        )
+    first: Response = api_get("/api/projects/1")
+    assert first.json["tasks"] == [1]
+
+    import_enex(
+        path=write_enex(notes=[EnexNote(title="Call", content="Bank", tags=["money"])])
+    )
+
+    second: Response = api_get("/api/projects/1", etag=first.get_etag()[0])
+    assert second.status_code == 200
+    assert second.json["tasks"] == []
@@ -0,0 +1,121 @@
+import sqlite3
+
+import pytest
+
+from tests.conftest import EnexNote
+
+
+@pytest.fixture
+def search_in(database_pathname):
+    from src.controller.save_enex_backup_to_flask_mysql_db import create_import_app
+    from src.controller.search import search
+
+    def search_for(query: str) -> list[tuple[str, str]]:
+        with create_import_app(database_pathname=database_pathname).app_context():
+            return [(hit.title, hit.snippet) for hit in search(query=query).hits]
+
+    return search_for
+
+
+def test_markup_is_not_searched(write_enex, import_enex, search_in) -> None:
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(
+                    title="Receipt",
+                    content='<div>Paid the plumber</div><en-media hash="ab" '
+                    'type="image/png" />',
+                    tags=["Bills"],
+                ),
+            ]
+        )
+    )
+
+    assert search_in("png") == []
+    assert search_in("div") == []
+    assert search_in("plumber") == [("Receipt", "Paid the <mark>plumber</mark>")]
+
+
+def test_words_of_separate_lines_do_not_run_together(
+    write_enex, import_enex, search_in
+) -> None:
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(title="Shopping", content="<div>milk</div><div>eggs</div>"),
+            ]
+        )
+    )
+
+    assert [title for title, _ in search_in("eggs")] == ["Shopping"]
+
+
+def test_edited_note_is_searched_as_edited(
+    write_enex, import_enex, search_in, database_pathname
+) -> None:
+    import_enex(path=write_enex(notes=[EnexNote(title="Call", content="the bank")]))
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(
+                    title="Call",
+                    content="the plumber",
+                    updated="20231003T100000Z",
+                )
+            ]
+        )
+    )
+
+    assert search_in("bank") == []
+    assert [title for title, _ in search_in("plumber")] == ["Call"]
+    with sqlite3.connect(database_pathname) as connection:
+        connection.execute("UPDATE notes SET title = 'Ring'")
+    assert [title for title, _ in search_in("ring plumber")] == ["Ring"]
+
+
+def test_task_written_through_the_orm_is_searched(database_pathname, search_in) -> None:
+    from src.controller.save_enex_backup_to_flask_mysql_db import (
+        Task,
+        create_import_app,
+        db,
+    )
+
+    with create_import_app(database_pathname=database_pathname).app_context():
+        task = Task(title="Plan", body_text="<div>book</div><div>flights</div>")
+        db.session.add(task)
+        db.session.commit()
+        task.body_text = "<div>book trains</div>"
+        db.session.commit()
+
+    assert search_in("flights") == []
+    assert search_in("trains") == [("Plan", "book <mark>trains</mark>")]
+
+
+def test_only_full_or_first_imports_defer_indexing(
+    write_enex, import_enex, database_pathname
+) -> None:
+    from src.controller.save_enex_backup_to_flask_mysql_db import (
+        create_import_app,
+        db,
+        search_indexing_for,
+    )
+    from src.controller.search_index import trigger_names
+
+    def indexed_per_row(incremental: bool) -> bool:
+        with create_import_app(database_pathname=database_pathname).app_context():
+            with search_indexing_for(defer_search_index=True, incremental=incremental):
+                triggers: set[str] = set(
+                    db.session.connection()
+                    .exec_driver_sql(
+                        "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+                    )
+                    .scalars()
+                )
+            return set(trigger_names()) <= triggers
+
+    # The first import
+    assert not indexed_per_row(incremental=True)
+
+    import_enex(path=write_enex(notes=[EnexNote(title="Call", content="the bank")]))
+    assert indexed_per_row(incremental=True)
+    assert not indexed_per_row(incremental=False)
@@ -0,0 +1,49 @@
+import sqlite3
+from typing import Any
+
+import pytest
+from sqlalchemy import Engine, create_engine, text
+
+from src.controller.sqlite_profile import (
+    SqliteProfile,
+    apply_sqlite_profile,
+    sqlite_pragmas,
+)
+
+# How SQLite reports the named values of PRAGMAs when read back
+READ_BACK_VALUES: dict[str, dict[str, Any]] = {
+    "SYNCHRONOUS": {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3},
+    "TEMP_STORE": {"DEFAULT": 0, "FILE": 1, "MEMORY": 2},
+}
+
+
+def read_back(name: str, value: Any) -> Any:
+    if isinstance(value, str):
+        return READ_BACK_VALUES.get(name, {}).get(value.upper(), value.lower())
+    return value
+
+
+@pytest.mark.parametrize("profile", list(SqliteProfile))
+def test_new_connections_have_the_profile_pragmas(profile, database_pathname) -> None:
+    engine: Engine = create_engine(f"sqlite+pysqlite:///{database_pathname}")
+    apply_sqlite_profile(engine=engine, profile=profile)
+    pragmas: dict[str, Any] = sqlite_pragmas(profile=profile)
+    assert pragmas
+    try:
+        # A connection the engine has not opened before, each time
+        for _ in range(2):
+            engine.dispose()
+            with engine.connect() as connection:
+                for name, value in pragmas.items():
+                    assert connection.execute(
+                        text(f"PRAGMA {name.lower()}")
+                    ).scalar() == read_back(name=name, value=value), name
+    finally:
+        engine.dispose()
+
+    # WAL is kept in the database file, so other connections use it too
+    if "JOURNAL_MODE" in pragmas:
+        with sqlite3.connect(database_pathname) as connection:
+            assert connection.execute("PRAGMA journal_mode").fetchone() == (
+                read_back(name="JOURNAL_MODE", value=pragmas["JOURNAL_MODE"]),
+            )
@@ -0,0 +1,118 @@
+import sqlite3
+from typing import Any, Iterator
+
+import pytest
+from flask.testing import FlaskClient
+
+from tests.conftest import EnexNote
+
+NOTES: list[EnexNote] = [
+    EnexNote(title="Call", content="Bank", tags=["@Phone"]),
+    EnexNote(title="Plan", content="Trip", tags=["@Phone"]),
+    EnexNote(title="Read", content="Book"),
+]
+
+
+@pytest.fixture
+def client(write_enex, import_enex, database_pathname) -> Iterator[FlaskClient]:
+    from src.controller.app import create_app
+
+    import_enex(path=write_enex(notes=NOTES))
+    app = create_app(database_pathname=database_pathname)
+    yield app.test_client()
+    app.extensions["read_cache"].stop()
+    app.extensions["reminder_scheduler"].stop()
+
+
+def latest_seq(database_pathname: str) -> int:
+    with sqlite3.connect(database_pathname) as connection:
+        return connection.execute("SELECT max(seq) FROM change_log").fetchone()[0]
+
+
+def synced(client: FlaskClient, since: int, limit: int) -> list[dict[str, Any]]:
+    """Every page of changes after since, as a client syncing would get them"""
+    pages: list[dict[str, Any]] = []
+    while not pages or pages[-1]["has_more"]:
+        pages.append(client.get(f"/sync?since={since}&limit={limit}").json)
+        since = pages[-1]["next_since"]
+    return pages
+
+
+def test_unchanged_import_logs_no_changes(
+    write_enex, import_enex, database_pathname
+) -> None:
+    import_enex(path=write_enex(notes=NOTES))
+    seq: int = latest_seq(database_pathname=database_pathname)
+
+    import_enex(path=write_enex(notes=NOTES))
+    assert latest_seq(database_pathname=database_pathname) == seq
+
+    with sqlite3.connect(database_pathname) as connection:
+        connection.execute("UPDATE tasks SET title = title, updated = updated")
+    assert latest_seq(database_pathname=database_pathname) == seq
+
+    with sqlite3.connect(database_pathname) as connection:
+        connection.execute("UPDATE tasks SET title = 'Ring' WHERE title = 'Call'")
+    assert latest_seq(database_pathname=database_pathname) == seq + 1
+
+
+def test_pages_of_changes_follow_on(client, database_pathname) -> None:
+    pages: list[dict[str, Any]] = synced(client=client, since=0, limit=2)
+
+    seqs: list[int] = [change["seq"] for page in pages for change in page["changes"]]
+    assert seqs == sorted(set(seqs))
+    assert all(len(page["changes"]) == 2 for page in pages[:-1])
+    assert pages[-1]["next_since"] == latest_seq(database_pathname=database_pathname)
+    titles: list[str] = [
+        change["row"]["title"]
+        for page in pages
+        for change in page["changes"]
+        if change["table"] in ("tasks", "notes")
+    ]
+    assert sorted(titles) == ["Call", "Plan", "Read"]
+
+    # Nothing new
+    since: int = pages[-1]["next_since"]
+    assert client.get(f"/sync?since={since}").json == {
+        "changes": [],
+        "next_since": since,
+        "has_more": False,
+    }
+
+
+def test_changed_and_deleted_rows_are_sent_once_at_their_latest(
+    client, database_pathname
+) -> None:
+    since: int = latest_seq(database_pathname=database_pathname)
+    with sqlite3.connect(database_pathname) as connection:
+        [(call_id,)] = connection.execute("SELECT id FROM tasks WHERE title = 'Call'")
+        [(plan_id,)] = connection.execute("SELECT id FROM tasks WHERE title = 'Plan'")
+        connection.execute("UPDATE tasks SET title = 'Ring' WHERE id = ?", (call_id,))
+        connection.execute("UPDATE tasks SET title = 'Phone' WHERE id = ?", (call_id,))
+        connection.execute(
+            "DELETE FROM task_where_tags_association WHERE task_id = ?", (plan_id,)
+        )
+        connection.execute("DELETE FROM tasks WHERE id = ?", (plan_id,))
+
+    [page] = synced(client=client, since=since, limit=100)
+    changes: list[tuple[str, bool, dict]] = [
+        (change["table"], change["deleted"], change["row"])
+        for change in page["changes"]
+    ]
+    assert changes[0][:2] == ("tasks", False)
+    assert changes[0][2]["title"] == "Phone"
+    assert changes[1:] == [
+        ("task_where_tags_association", True, {"task_id": plan_id, "where_tag_id": 1}),
+        ("tasks", True, {"id": plan_id}),
+    ]
+
+    # A client far behind, applying every page, ends with the same rows
+    tasks: dict[int, dict] = {}
+    for page in synced(client=client, since=0, limit=2):
+        for change in page["changes"]:
+            if change["table"] != "tasks":
+                continue
+            tasks.pop(change["row"]["id"], None)
+            if not change["deleted"]:
+                tasks[change["row"]["id"]] = change["row"]
+    assert sorted(task["title"] for task in tasks.values()) == ["Phone"]
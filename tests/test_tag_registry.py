@@ -0,0 +1,50 @@
+import sqlite3
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from src.controller.save_enex_backup_to_flask_mysql_db import ReferenceTag, db
+from src.controller.tag_registry import TagRegistry
+
+
+def test_registry_reuses_and_creates_tags(database_pathname) -> None:
+    engine = create_engine(f"sqlite+pysqlite:///{database_pathname}")
+    db.metadata.create_all(engine)
+
+    added: list[bool] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def add_tag_first(conn, cursor, statement, *args) -> None:
+        # Another writer adds a tag just before the registry inserts its own
+        if statement.startswith("INSERT INTO reference_tags") and not added:
+            added.append(True)
+            with sqlite3.connect(database_pathname) as connection:
+                connection.execute("INSERT INTO reference_tags (name) VALUES ('car')")
+
+    with sqlite3.connect(database_pathname) as connection:
+        connection.execute("INSERT INTO reference_tags (name) VALUES ('books')")
+    with Session(engine) as session, TagRegistry(
+        session=session, tag_model=ReferenceTag
+    ) as registry:
+        ids: dict[str, int] = registry.ids_for(names=["books", "taxes"])
+        session.commit()
+
+    assert ids == {"books": 1, "taxes": 3}
+    with sqlite3.connect(database_pathname) as connection:
+        assert dict(connection.execute("SELECT name, id FROM reference_tags")) == {
+            "books": 1,
+            "car": 2,
+            "taxes": 3,
+        }
+
+
+def test_registry_forgets_tags_rolled_back(database_pathname) -> None:
+    engine = create_engine(f"sqlite+pysqlite:///{database_pathname}")
+    db.metadata.create_all(engine)
+    with Session(engine) as session, TagRegistry(
+        session=session, tag_model=ReferenceTag
+    ) as registry:
+        registry.ids_for(names=["books"])
+        session.rollback()
+        assert "books" not in registry
+        assert registry.id_for(name="books") == 1
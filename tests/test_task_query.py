@@ -0,0 +1,119 @@
+from typing import Any, Callable, Iterator, Optional
+
+import pytest
+from flask import Flask
+
+from tests.conftest import EnexNote
+
+CREATED: list[str] = [f"2023100{day}T100000Z" for day in range(1, 5)]
+TITLES: list[str] = ["Call", "Buy", "Plan"]
+
+
+@pytest.fixture
+def app(write_enex, import_enex, database_pathname) -> Iterator[Flask]:
+    """
+    Twelve tasks sharing their titles, created times and reminder times with
+    others, so every sort has ties to break by id
+    """
+    from src.controller.save_enex_backup_to_flask_mysql_db import create_import_app
+
+    import_enex(
+        path=write_enex(
+            notes=[
+                EnexNote(
+                    # Each title with each created time at most once
+                    title=TITLES[task_no % 3],
+                    content=f"Task {task_no}",
+                    created=CREATED[task_no % 4],
+                    tags=["@Phone" if task_no % 2 else "@Home-Inside"]
+                    + (["money"] if task_no % 3 == 0 else []),
+                    reminder_time=(
+                        None
+                        if task_no % 4 == 2
+                        else f"2023110{task_no % 2 + 1}T120000Z"
+                    ),
+                )
+                for task_no in range(12)
+            ]
+        )
+    )
+    app: Flask = create_import_app(database_pathname=database_pathname)
+    with app.app_context():
+        yield app
+
+
+def walk_pages(**options) -> list[int]:
+    """The ids of the tasks of every page, following the cursors"""
+    from src.controller.task_query import list_tasks
+
+    task_ids: list[int] = []
+    cursor: Optional[str] = None
+    while True:
+        page = list_tasks(limit=2, cursor=cursor, **options)
+        assert page.tasks or cursor is None
+        task_ids += [task.id for task in page.tasks]
+        if page.next_cursor is None:
+            return task_ids
+        cursor = page.next_cursor
+
+
+def matching_task_ids(
+    matches: Callable[[Any], bool], sort_key: Callable[[Any], Any], reverse: bool
+) -> list[int]:
+    from sqlalchemy import select
+
+    from src.controller.save_enex_backup_to_flask_mysql_db import Task, db
+
+    tasks: list[Any] = [
+        task for task in db.session.scalars(select(Task)) if matches(task)
+    ]
+    return [
+        task.id
+        for task in sorted(
+            tasks, key=lambda task: (sort_key(task), task.id), reverse=reverse
+        )
+    ]
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+@pytest.mark.parametrize("sort", ["created", "reminder", "title"])
+@pytest.mark.parametrize(
+    "where, reference",
+    [
+        ([], []),
+        (["@Phone"], []),
+        ([], ["money"]),
+        (["@Phone", "@Home-Inside"], ["money"]),
+    ],
+)
+def test_pages_hold_every_matching_task_once_in_order(
+    app, sort, order, where, reference
+) -> None:
+    from src.controller.task_query import SORT_COLUMNS, SortOrder, TaskFilter, TaskSort
+
+    task_sort = TaskSort(sort)
+    column: str = SORT_COLUMNS[task_sort].key
+
+    def matches(task: Any) -> bool:
+        return (
+            (not where or task.where_tag.name in where)
+            and (
+                not reference
+                or any(tag.name in reference for tag in task.reference_tags)
+            )
+            and (task_sort != TaskSort.REMINDER or task.reminder_time is not None)
+        )
+
+    task_ids: list[int] = walk_pages(
+        task_filter=TaskFilter(where=where, reference=reference),
+        sort=task_sort,
+        order=SortOrder(order),
+    )
+
+    expected: list[int] = matching_task_ids(
+        matches=matches,
+        sort_key=lambda task: getattr(task, column),
+        reverse=order == "desc",
+    )
+    assert len(expected) > 2  # More than one page
+    assert task_ids == expected